@@ -5,3 +5,8 @@ class CommonConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.common'
     verbose_name = 'Common (TRAUCK)'
+
+    def ready(self):
+        from apps.common.signals import rows_changed
+        from apps.common.versions import bump_written_version
+        rows_changed.connect(bump_written_version, dispatch_uid='common_rows_version')
@@ -0,0 +1,25 @@
+"""Field metadata helpers shared by the dyn_dt and dyn_api apps."""
+
+from django.db import models
+
+
+def is_indexed(field):
+    """True when `field` is the leading column of some index."""
+    if field.primary_key or field.unique or field.db_index:
+        return True
+    meta = field.model._meta
+    for index in meta.indexes:
+        if index.fields and index.fields[0].lstrip('-') == field.name:
+            return True
+    for together in meta.unique_together:
+        if together and together[0] == field.name:
+            return True
+    return False
+
+
+def is_text(field):
+    return isinstance(field, (models.CharField, models.TextField))
+
+
+def is_number(field):
+    return isinstance(field, (models.IntegerField, models.AutoField, models.FloatField, models.DecimalField))
@@ -0,0 +1,18 @@
+"""Signals shared between apps.
+
+rows_changed is sent after multi-row writes that send no row signals
+(bulk_create, bulk_update, QuerySet.update / delete): sender is the model,
+`pks` the keys written (None when unknown) and `using` the database.
+Apps keeping derived data (caches, search indexes) connect to it; the
+data version of the model (versions.py) is bumped by apps.common itself.
+"""
+from django.db import transaction
+from django.dispatch import Signal
+
+rows_changed = Signal()
+
+
+def send_rows_changed(model, pks=None, using='default'):
+    """Sends rows_changed once the current transaction commits."""
+    pks = None if pks is None or None in pks else list(pks)
+    transaction.on_commit(lambda: rows_changed.send(sender=model, pks=pks, using=using), using=using)
@@ -0,0 +1,73 @@
+"""
+Row seeding for the dyn_dt and dyn_api tests and benchmarks.
+
+Builds rows for any model from its field metadata, creating
+the FK targets they need along the way.
+"""
+
+import itertools
+from datetime import date, datetime, timedelta, timezone
+
+from django.db import models
+
+_seq = itertools.count()
+
+def fake_value(field, i):
+    if field.choices:
+        return field.flatchoices[i % len(field.flatchoices)][0]
+    if isinstance(field, models.BooleanField):
+        return i % 2 == 0
+    if isinstance(field, (models.IntegerField, models.FloatField, models.DecimalField)):
+        return i % 1000
+    if isinstance(field, models.DateTimeField):
+        return datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=i)
+    if isinstance(field, models.DateField):
+        return date(2024, 1, 1) + timedelta(days=i % 3650)
+    if isinstance(field, models.EmailField):
+        return f'user{i}@example.com'
+    if isinstance(field, (models.CharField, models.TextField)):
+        return f'row-{i}'[:field.max_length or None]
+    if isinstance(field, models.JSONField):
+        return {}
+    if isinstance(field, models.FileField):
+        return ''
+    return None
+
+def fake_data(aModelClass, related=None):
+    """Field values for a new row; required FKs get a freshly created target."""
+    i = next(_seq)
+    related = related or {}
+    data = {}
+    for field in aModelClass._meta.fields:
+        if field.primary_key:
+            continue
+        if field.is_relation:
+            if field.name in related:
+                data[field.name] = related[field.name]
+            elif not field.null:
+                data[field.name] = create_fake(field.related_model)
+            continue
+        value = fake_value(field, i)
+        if value is not None:
+            data[field.name] = value
+    return data
+
+def create_fake(aModelClass):
+    return aModelClass.objects.create(**fake_data(aModelClass))
+
+def seed_rows(aModelClass, count, batch_size=5000, fk_pool=10):
+    """bulk_create `count` rows; FK columns cycle over `fk_pool` targets each."""
+    pools = {}
+    for field in aModelClass._meta.fields:
+        if field.is_relation and not field.primary_key:
+            pools[field.name] = [create_fake(field.related_model) for _ in range(fk_pool)]
+
+    objs = []
+    for i in range(count):
+        related = {name: pool[i % len(pool)] for name, pool in pools.items()}
+        objs.append(aModelClass(**fake_data(aModelClass, related)))
+        if len(objs) >= batch_size:
+            aModelClass.objects.bulk_create(objs)
+            objs = []
+    if objs:
+        aModelClass.objects.bulk_create(objs)
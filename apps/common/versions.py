@@ -0,0 +1,53 @@
+"""Data versions of models, shared by the dyn_dt and dyn_api apps.
+
+Every model has a "data version" counter in the cache, bumped on commit by
+the row signals the apps connect (bump_model_version) and by rows_changed
+(signals.py) after bulk writes. Cached responses and pages put it in their
+keys or ETags, so a write makes all of them unreachable at once.
+"""
+
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def version_key(name):
+    return 'common:version:' + name
+
+
+def model_version_name(aModelClass):
+    return 'model:' + aModelClass._meta.label_lower
+
+
+def get_versions(names):
+    """{name: version}; missing counters are seeded with the clock, so a
+    counter lost by the cache never repeats a value an ETag was built from."""
+    keys = {version_key(name): name for name in names}
+    versions = {keys[key]: value for key, value in cache.get_many(list(keys)).items()}
+    for name in set(names) - versions.keys():
+        cache.add(version_key(name), time.time_ns(), None)
+        versions[name] = cache.get(version_key(name))
+    return versions
+
+
+def bump_version(name):
+    try:
+        cache.incr(version_key(name))
+    except ValueError:
+        get_versions([name])
+
+
+def data_version(aModelClass):
+    name = model_version_name(aModelClass)
+    return get_versions([name])[name]
+
+
+def bump_model_version(sender, using=None, **kwargs):
+    name = model_version_name(sender)
+    transaction.on_commit(lambda: bump_version(name), using=using)
+
+
+def bump_written_version(sender, **kwargs):
+    """rows_changed receiver, the signal is already sent on commit."""
+    bump_version(model_version_name(sender))
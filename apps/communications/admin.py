@@ -1,6 +1,6 @@
 from django.contrib import admin
 from .models import CommunicationChannel, CommunicationLog, CommSession, CommMessage, CommAttachment, CommSyncLog
-from .models import WebhookEvent
+from .models import WebhookEvent, SyncCursor, SyncJob, SyncLease
 
 
 @admin.register(CommunicationChannel)
@@ -49,6 +49,24 @@ class CommSyncLogAdmin(admin.ModelAdmin):
     readonly_fields = ('created_at',)
 
 
+@admin.register(SyncCursor)
+class SyncCursorAdmin(admin.ModelAdmin):
+    list_display = ('provider', 'resource', 'watermark_ms', 'pagination_key', 'last_run_at', 'last_listed')
+    list_filter = ('provider',)
+
+
+@admin.register(SyncJob)
+class SyncJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'source', 'requested_by', 'worker', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('kind', 'status', 'source')
+    readonly_fields = ('created_at', 'started_at', 'heartbeat_at', 'finished_at')
+
+
+@admin.register(SyncLease)
+class SyncLeaseAdmin(admin.ModelAdmin):
+    list_display = ('name', 'owner', 'expires_at')
+
+
 """Conversation model removed in favor of CommSession unified view."""
 
 
@@ -0,0 +1,141 @@
+"""
+Concurrent GETs against the Retell API.
+
+DetailFetcher runs the detail requests of a sync on a bounded thread pool
+over one keep-alive requests.Session, spaces the requests per host
+(RETELL_RATE_LIMIT) and retries 429 / 5xx / connection errors with
+exponential backoff, honouring Retry-After. Only the HTTP calls run in
+the pool: the caller writes the results to the database on its own thread.
+"""
+
+import random, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from django.conf import settings
+
+RETELL_FETCH_WORKERS = getattr(settings, 'RETELL_FETCH_WORKERS', 8)
+RETELL_RATE_LIMIT    = getattr(settings, 'RETELL_RATE_LIMIT'   , 50)   # requests/s per host, 0 disables
+RETELL_FETCH_RETRIES = getattr(settings, 'RETELL_FETCH_RETRIES', 3)
+RETELL_FETCH_BACKOFF = getattr(settings, 'RETELL_FETCH_BACKOFF', 0.5)  # seconds, doubled per retry
+RETELL_FETCH_TIMEOUT = getattr(settings, 'RETELL_FETCH_TIMEOUT', 20)
+
+RETRY_STATUSES  = (429, 500, 502, 503, 504)
+MAX_RETRY_AFTER = 30
+
+
+class HostRateLimiter:
+    """At most `rate` requests per second per host, spaced evenly."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_slot = {}
+        self.lock = threading.Lock()
+
+    def wait(self, url):
+        if not self.interval:
+            return
+        host = urlsplit(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def retry_delay(response, attempt, backoff):
+    if response is not None:
+        value = response.headers.get('Retry-After')
+        if value:
+            try:
+                return min(MAX_RETRY_AFTER, max(0.0, float(value)))
+            except ValueError:
+                pass
+    # full jitter: the clients that failed together don't retry together
+    return random.uniform(0, backoff * (2 ** attempt))
+
+
+def new_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class DetailFetcher:
+    """Fetches Retell details concurrently; use as a context manager (closes the session)."""
+
+    def __init__(self, headers, workers=None, rate=None, retries=None, backoff=None, timeout=None):
+        self.headers = dict(headers or {})
+        self.headers.setdefault('Accept', 'application/json')
+        self.workers = max(1, workers or RETELL_FETCH_WORKERS)
+        self.retries = RETELL_FETCH_RETRIES if retries is None else retries
+        self.backoff = RETELL_FETCH_BACKOFF if backoff is None else backoff
+        self.timeout = timeout or RETELL_FETCH_TIMEOUT
+        self.limiter = HostRateLimiter(RETELL_RATE_LIMIT if rate is None else rate)
+        self.session = new_session(self.workers)
+        self.stats = {'requests': 0, 'retries': 0}
+        self.stats_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def count(self, name):
+        with self.stats_lock:
+            self.stats[name] += 1
+
+    def get(self, url, params=None):
+        """GET with rate limiting and retries; the last response (or error) once they are spent."""
+        attempt = 0
+        while True:
+            self.limiter.wait(url)
+            self.count('requests')
+            response = None
+            try:
+                response = self.session.get(url, headers=self.headers, params=params, timeout=self.timeout)
+                if response.status_code not in RETRY_STATUSES or attempt >= self.retries:
+                    return response
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.retries:
+                    raise
+            time.sleep(retry_delay(response, attempt, self.backoff))
+            attempt += 1
+            self.count('retries')
+
+    def fetch(self, candidates):
+        """JSON of the first of the (url, params) candidates answering 2xx, None when none does."""
+        for url, params in candidates:
+            response = self.get(url, params)
+            if response.ok:
+                return response.json()
+        return None
+
+    def fetch_all(self, candidates_by_key):
+        """({key: detail}, {key: error}) for {key: [(url, params), ...]}; failed keys are left out of the details."""
+        keys = list(candidates_by_key)
+        details, errors = {}, {}
+
+        def run(key):
+            try:
+                return key, self.fetch(candidates_by_key[key]), None
+            except Exception as e:
+                return key, None, e
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='retell_fetch') as pool:
+            for key, detail, error in pool.map(run, keys):
+                if error is not None:
+                    errors[key] = error
+                elif detail is not None:
+                    details[key] = detail
+        return details, errors
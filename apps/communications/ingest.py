@@ -0,0 +1,111 @@
+"""
+Batch CommSession ingestion.
+
+upsert_sessions() takes normalized session dicts (CommSession field ->
+value, as built by the ingestion helpers of views.py) and writes them with
+one id__in lookup per 500 ids, bulk_create for the new sessions and a
+single bulk_update of the fields that changed, for the rows that changed.
+Sessions are matched on their first provider id (LOOKUP_FIELDS); the ids
+are not unique in the table, so there is no ON CONFLICT upsert and the
+oldest row wins when an id was stored twice.
+"""
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import CommSession
+
+LOOKUP_FIELDS = ('retell_call_id', 'retell_conversation_id', 'conversation_flow_id', 'external_ref')
+BATCH_SIZE = 500
+
+
+# When a value of the row replaces the stored one
+
+def is_set(value):
+    return value is not None
+
+
+def is_filled(value):
+    return value is not None and value != ''
+
+
+def is_truthy(value):
+    return bool(value)
+
+
+def lookup_key(row):
+    for field in LOOKUP_FIELDS:
+        if row.get(field):
+            return field, row[field]
+    return None
+
+
+def existing_sessions(keys):
+    """{(field, id): CommSession} of the stored sessions, one query per field and 500 ids."""
+    ids = {}
+    for field, value in keys:
+        ids.setdefault(field, set()).add(value)
+    found = {}
+    for field, values in ids.items():
+        values = list(values)
+        for start in range(0, len(values), BATCH_SIZE):
+            for obj in CommSession.objects.filter(**{f'{field}__in': values[start:start + BATCH_SIZE]}).order_by('pk'):
+                found.setdefault((field, getattr(obj, field)), obj)
+    return found
+
+
+def apply_row(obj, row, update_fields, replaces):
+    """Sets the update_fields of `row` that `replaces` accepts on obj; returns the fields that changed."""
+    changed = []
+    for field in update_fields:
+        if field in row and replaces(row[field]) and getattr(obj, field) != row[field]:
+            setattr(obj, field, row[field])
+            changed.append(field)
+    # Backfill of the approximate tokens once there is an excerpt
+    if not obj.tokens_prompt and obj.transcript_excerpt:
+        obj.tokens_prompt = max(1, len(obj.transcript_excerpt.split()))
+        changed.append('tokens_prompt')
+    return changed
+
+
+def upsert_sessions(rows, update_fields, replaces=is_set):
+    """Creates or updates the CommSessions of `rows`.
+
+    Stored sessions get the update_fields of their row whose value `replaces`
+    accepts; rows that change nothing are not written. Returns a
+    (session, created) pair per row, (None, False) for rows without an id.
+    """
+    keys = [lookup_key(row) for row in rows]
+    sessions = existing_sessions([key for key in keys if key])
+    new, changed, fields, results = {}, {}, set(), []
+    for row, key in zip(rows, keys):
+        if not key:
+            results.append((None, False))
+            continue
+        obj = sessions.get(key)
+        if obj is None:
+            obj = sessions[key] = new[key] = CommSession(**row)
+            results.append((obj, True))
+            continue
+        dirty = apply_row(obj, row, update_fields, replaces)
+        if dirty and key not in new:
+            changed[key] = obj
+            fields.update(dirty)
+        results.append((obj, False))
+
+    if not new and not changed:
+        return results
+    with transaction.atomic():
+        if new:
+            CommSession.objects.bulk_create(list(new.values()), batch_size=BATCH_SIZE)
+            if any(obj.pk is None for obj in new.values()):
+                # backends that do not return the inserted ids
+                stored = existing_sessions(list(new))
+                for key, obj in new.items():
+                    obj.pk = stored[key].pk
+        if changed:
+            now = timezone.now()
+            for obj in changed.values():
+                obj.updated_at = now
+            CommSession.objects.bulk_update(list(changed.values()), sorted(fields | {'updated_at'}), batch_size=BATCH_SIZE)
+    return results
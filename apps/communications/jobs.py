@@ -0,0 +1,263 @@
+"""
+Background Retell syncs.
+
+The HTTP endpoints only queue a SyncJob (a pending job of the same kind is
+reused) and answer with its id. Jobs are run by the retell_sync_worker
+command, or by a thread of the web process when RETELL_SYNC_INPROCESS is
+on. One sync runs at a time cluster-wide: a worker runs jobs only while it
+holds the SyncLease row, taken and renewed with conditional UPDATEs and
+lost when it is not renewed for RETELL_SYNC_LEASE seconds; a Heartbeat
+thread renews it while a job runs, and the job checks it still holds it
+before moving the cursors and before it is marked done. Each run is
+recorded in a CommSyncLog, updated at every stage.
+
+Webhooks only ingest their own session and ask for a reconciling refresh
+through schedule_refresh(): a pending refresh takes the request over, and a
+new one does not run before RETELL_REFRESH_DEBOUNCE seconds after the
+previous one started, so a burst of events costs one list run.
+"""
+
+import os, socket, threading, time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import CommSyncLog, SyncJob, SyncLease
+
+RETELL_SYNC_LEASE    = getattr(settings, 'RETELL_SYNC_LEASE'   , 120)  # seconds a silent worker keeps the lock
+RETELL_SYNC_ATTEMPTS = getattr(settings, 'RETELL_SYNC_ATTEMPTS', 3)    # runs of a job before it is failed
+RETELL_REFRESH_DEBOUNCE = getattr(settings, 'RETELL_REFRESH_DEBOUNCE', 60)  # seconds between webhook refreshes
+
+LEASE_NAME = 'retell-sync'
+
+_kick_lock = threading.Lock()
+_wake = threading.Event()
+
+
+class LeaseLost(Exception):
+    """Another worker took the lease over: this one stops."""
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+
+def enqueue_sync(kind=SyncJob.KIND_SYNC, user=None, source='', kick=True):
+    """Returns (job, created); a job of the same kind still pending is reused.
+    kick=False leaves the job to the worker polling the queue."""
+    job = SyncJob.objects.filter(kind=kind, status=SyncJob.STATUS_PENDING).order_by('created_at').first()
+    if job:
+        return job, False
+    job = SyncJob.objects.create(kind=kind, requested_by=user if user and user.is_authenticated else None, source=source)
+
+    # Read per call, tests and setups with a worker daemon turn it off
+    if kick and getattr(settings, 'RETELL_SYNC_INPROCESS', True):
+        transaction.on_commit(kick_worker)
+    return job, True
+
+
+def schedule_refresh(source='webhook'):
+    """Debounced KIND_REFRESH for the webhooks, one or two queries; returns (job, created)."""
+    job = SyncJob.objects.filter(kind=SyncJob.KIND_REFRESH, status=SyncJob.STATUS_PENDING).order_by('created_at').first()
+    if job:
+        return job, False
+    last = (SyncJob.objects.filter(kind=SyncJob.KIND_REFRESH).exclude(status=SyncJob.STATUS_PENDING)
+            .order_by('-created_at').values_list('started_at', 'created_at').first())
+    now = timezone.now()
+    run_after = None
+    if last:
+        run_after = (last[0] or last[1]) + timedelta(seconds=RETELL_REFRESH_DEBOUNCE)
+        run_after = run_after if run_after > now else None
+    job = SyncJob.objects.create(kind=SyncJob.KIND_REFRESH, source=source, run_after=run_after)
+    if getattr(settings, 'RETELL_SYNC_INPROCESS', True):
+        transaction.on_commit(kick_worker)
+    return job, True
+
+
+def kick_worker():
+    _wake.set()
+    if _kick_lock.locked():
+        return
+    threading.Thread(target=run_in_thread, name='retell_sync', daemon=True).start()
+
+
+def run_in_thread():
+    # Stays up while debounced jobs wait for their time, a kick wakes it earlier
+    with _kick_lock:
+        while True:
+            _wake.clear()
+            run_pending_jobs()
+            delay = next_job_delay()
+            connection.close()
+            if delay is None:
+                return
+            _wake.wait(delay)
+
+
+def next_job_delay():
+    """Seconds until the next debounced job may run, None when none is waiting."""
+    run_after = (SyncJob.objects.filter(status=SyncJob.STATUS_PENDING, run_after__gt=timezone.now())
+                 .order_by('run_after').values_list('run_after', flat=True).first())
+    return (run_after - timezone.now()).total_seconds() if run_after else None
+
+
+def sync_job_status(job):
+    return {
+        'ok': job.status != SyncJob.STATUS_FAILED,
+        'job_id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'run_after': job.run_after.isoformat() if job.run_after else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'stage': (job.log.payload or {}).get('stage') if job.log_id else None,
+        'result': job.result,
+        'error': job.error,
+        'status_url': reverse('retell_sync_job', args=[job.id]),
+    }
+
+
+# Lease
+
+def acquire_lease(owner):
+    SyncLease.objects.get_or_create(name=LEASE_NAME)
+    now = timezone.now()
+    free = Q(owner=owner) | Q(owner='') | Q(expires_at__isnull=True) | Q(expires_at__lt=now)
+    return SyncLease.objects.filter(free, name=LEASE_NAME).update(
+        owner=owner, expires_at=now + timedelta(seconds=RETELL_SYNC_LEASE)) == 1
+
+
+def renew_lease(owner):
+    expires_at = timezone.now() + timedelta(seconds=RETELL_SYNC_LEASE)
+    if not SyncLease.objects.filter(name=LEASE_NAME, owner=owner).update(expires_at=expires_at):
+        raise LeaseLost(owner)
+
+
+def release_lease(owner):
+    SyncLease.objects.filter(name=LEASE_NAME, owner=owner).update(owner='', expires_at=None)
+
+
+class Heartbeat(threading.Thread):
+    """Renews the lease of `owner` every `interval` seconds until stopped; `lost` is set when another worker took it."""
+
+    def __init__(self, owner, interval=None):
+        super().__init__(name='retell_sync_heartbeat', daemon=True)
+        self.owner = owner
+        self.interval = interval or RETELL_SYNC_LEASE / 3
+        self.stopped = threading.Event()
+        self.lost = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                try:
+                    renew_lease(self.owner)
+                except LeaseLost:
+                    self.lost.set()
+                    return
+                except Exception:
+                    pass  # the next beat tries again, the lease outlives a few
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+# Jobs
+
+def requeue_orphans(owner):
+    """Running jobs of other workers: they lost the lease, so they are dead or stopping."""
+    orphans = SyncJob.objects.filter(status=SyncJob.STATUS_RUNNING).exclude(worker=owner)
+    orphans.filter(attempts__gte=RETELL_SYNC_ATTEMPTS).update(
+        status=SyncJob.STATUS_FAILED, error='worker lost', finished_at=timezone.now())
+    orphans.filter(attempts__lt=RETELL_SYNC_ATTEMPTS).update(status=SyncJob.STATUS_PENDING, worker='')
+
+
+def claim_next_job(owner):
+    due = Q(run_after__isnull=True) | Q(run_after__lte=timezone.now())
+    for pk in SyncJob.objects.filter(due, status=SyncJob.STATUS_PENDING).order_by('created_at').values_list('pk', flat=True)[:5]:
+        now = timezone.now()
+        claimed = SyncJob.objects.filter(pk=pk, status=SyncJob.STATUS_PENDING).update(
+            status=SyncJob.STATUS_RUNNING, worker=owner, started_at=now, heartbeat_at=now, error='', attempts=F('attempts') + 1)
+        if claimed:
+            return SyncJob.objects.get(pk=pk)
+    return None
+
+
+def run_pending_jobs(owner=None):
+    """Runs the queued jobs while holding the lease; returns how many ran (0 when another worker holds it)."""
+    owner = owner or worker_name()
+    ran = 0
+    try:
+        if not acquire_lease(owner):
+            return 0
+        try:
+            requeue_orphans(owner)
+            while True:
+                job = claim_next_job(owner)
+                if not job:
+                    return ran
+                run_sync_job(job, owner)
+                ran += 1
+        except LeaseLost:
+            return ran
+        finally:
+            release_lease(owner)
+    finally:
+        if threading.current_thread() is not threading.main_thread():
+            connection.close()
+
+
+def run_sync_job(job, owner):
+    from .views import RetellSyncWebhookView, refresh_retell_sessions
+
+    started = time.monotonic()
+    log = CommSyncLog.objects.create(user=job.requested_by, payload={'job': job.pk, 'kind': job.kind, 'stage': 'started'})
+    SyncJob.objects.filter(pk=job.pk).update(log=log)
+
+    def progress(stage, **info):
+        if heartbeat.lost.is_set():
+            raise LeaseLost(owner)
+        renew_lease(owner)
+        SyncJob.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now())
+        CommSyncLog.objects.filter(pk=log.pk).update(
+            duration_ms=int((time.monotonic() - started) * 1000),
+            payload={'job': job.pk, 'kind': job.kind, 'stage': stage, **info})
+
+    heartbeat = Heartbeat(owner)
+    heartbeat.start()
+    try:
+        if job.kind == SyncJob.KIND_REFRESH:
+            progress('chats')
+            result = refresh_retell_sessions(progress=progress)
+        else:
+            result = RetellSyncWebhookView().sync(progress=progress)
+        progress('finishing')
+    except LeaseLost:
+        raise
+    except Exception as e:
+        CommSyncLog.objects.filter(pk=log.pk).update(
+            status_code=500, duration_ms=int((time.monotonic() - started) * 1000),
+            payload={'job': job.pk, 'kind': job.kind, 'stage': 'failed', 'error': str(e)})
+        SyncJob.objects.filter(pk=job.pk).update(status=SyncJob.STATUS_FAILED, error=str(e), finished_at=timezone.now())
+        return
+    finally:
+        heartbeat.stop()
+
+    CommSyncLog.objects.filter(pk=log.pk).update(
+        status_code=200, duration_ms=int((time.monotonic() - started) * 1000),
+        payload={'job': job.pk, 'kind': job.kind, 'stage': 'done', **result})
+    SyncJob.objects.filter(pk=job.pk).update(
+        status=SyncJob.STATUS_DONE, result=summary(result), finished_at=timezone.now())
+
+
+def summary(result):
+    """The counters of a sync result (the diagnostics stay in the CommSyncLog)."""
+    return {k: v for k, v in result.items() if k not in ('diag', 'errors')} | {'errors': len(result.get('errors') or [])}
@@ -0,0 +1,54 @@
+import time
+
+import requests
+
+from django.core.management.base import BaseCommand
+
+from apps.communications.fetching import DetailFetcher
+from apps.communications.testing import StubRetell, fake_call
+
+
+def sequential_fetch(base_url, call_ids):
+    # The detail loop of RetellSyncWebhookView before fetching.py: one GET at a time, a new connection each
+    details = {}
+    for call_id in call_ids:
+        r = requests.get(base_url + '/get-call', headers={'Accept': 'application/json'}, params={'call_id': call_id}, timeout=20)
+        if r.ok:
+            details[call_id] = r.json()
+    return details
+
+
+class Command(BaseCommand):
+    help = 'Benchmark Retell detail fetching (sequential against the DetailFetcher pool) on a local stub server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calls', type=int, default=500, help='Call details to fetch')
+        parser.add_argument('--latency', type=float, default=0.05, help='Seconds the stub takes per request')
+        parser.add_argument('--workers', default='4,8,16', help='Comma separated pool sizes')
+        parser.add_argument('--rate', type=float, default=0, help='Requests/s per host of the pool (0: unlimited)')
+        parser.add_argument('--throttle-every', type=int, default=0, help='The stub answers every n-th request with a 429')
+        parser.add_argument('--skip-sequential', action='store_true')
+
+    def handle(self, *args, **options):
+        calls = [fake_call(i) for i in range(options['calls'])]
+        call_ids = [c['call_id'] for c in calls]
+        self.stdout.write(f'{len(calls)} call details, latency={options["latency"] * 1000:.0f}ms, '
+                          f'rate={options["rate"] or "unlimited"}, throttle_every={options["throttle_every"]}')
+
+        if not options['skip_sequential']:
+            with StubRetell(calls=calls, latency=options['latency'], throttle_every=options['throttle_every']) as stub:
+                start = time.perf_counter()
+                details = sequential_fetch(stub.url, call_ids)
+                self.report('sequential', time.perf_counter() - start, len(details), stub.stats, {'retries': 0})
+
+        for workers in [int(w) for w in options['workers'].split(',')]:
+            with StubRetell(calls=calls, latency=options['latency'], throttle_every=options['throttle_every']) as stub:
+                start = time.perf_counter()
+                with DetailFetcher({}, workers=workers, rate=options['rate'], backoff=0.05) as fetcher:
+                    details, errors = fetcher.fetch_all({i: [(stub.url + '/get-call', {'call_id': i})] for i in call_ids})
+                self.report(f'pool x{workers}', time.perf_counter() - start, len(details), stub.stats, fetcher.stats)
+
+    def report(self, name, seconds, fetched, server, client):
+        self.stdout.write(f'{name:<12} {seconds:7.2f}s {fetched / seconds:8.0f} details/s  fetched={fetched}  '
+                          f'connections={server["connections"]}  peak_concurrency={server["peak_in_flight"]}  '
+                          f'throttled={server["throttled"]}  retries={client["retries"]}')
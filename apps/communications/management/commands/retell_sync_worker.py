@@ -0,0 +1,39 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.communications.jobs import enqueue_sync, run_pending_jobs, worker_name
+from apps.communications.models import SyncJob
+
+
+class Command(BaseCommand):
+    help = 'Run queued Retell syncs (DB-backed queue, one sync at a time across workers) and schedule periodic ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0, help='Seconds between scheduled syncs (0: only queued ones)')
+        parser.add_argument('--kind', default=SyncJob.KIND_SYNC, choices=[SyncJob.KIND_SYNC, SyncJob.KIND_REFRESH],
+                            help='Kind of the scheduled syncs')
+        parser.add_argument('--poll', type=float, default=2.0, help='Seconds between queue polls')
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit')
+
+    def handle(self, *args, **options):
+        owner = worker_name()
+        self.stdout.write(f'Retell sync worker {owner} started')
+
+        while True:
+            if options['interval']:
+                self.schedule(options['kind'], options['interval'])
+            ran = run_pending_jobs(owner)
+            if ran:
+                self.stdout.write(f'Ran {ran} sync job(s)')
+            if options['once']:
+                return
+            time.sleep(options['poll'])
+
+    def schedule(self, kind, interval):
+        # The last job of the kind, whoever queued it: a sync requested from the site counts too
+        since = timezone.now() - timedelta(seconds=interval)
+        if not SyncJob.objects.filter(kind=kind, created_at__gte=since).exists():
+            enqueue_sync(kind, source='schedule', kick=False)
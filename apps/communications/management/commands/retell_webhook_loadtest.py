@@ -0,0 +1,74 @@
+import hashlib, hmac, json, time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import reverse
+
+from apps.communications.jobs import run_pending_jobs
+from apps.communications.models import SyncJob
+from apps.communications.testing import StubRetell, fake_call, stub_settings
+from apps.communications.views import refresh_retell_sessions
+
+SECRET = 'loadtest'
+
+
+def signed_post(client, url, payload):
+    body = json.dumps(payload).encode()
+    sig = hmac.new(SECRET.encode(), body, hashlib.sha256).hexdigest()
+    return client.post(url, body, content_type='application/json', HTTP_X_SIGNATURE=sig)
+
+
+class Command(BaseCommand):
+    help = ('Fire signed call.completed webhooks at the Retell webhook view with a local stub provider. '
+            'Runs in a rolled back transaction, nothing is kept')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--webhooks', type=int, default=300, help='Webhooks to send')
+        parser.add_argument('--calls', type=int, default=1000, help='Calls the stub lists')
+        parser.add_argument('--latency', type=float, default=0.02, help='Seconds the stub takes per request')
+        parser.add_argument('--skip-inline', action='store_true',
+                            help='Skip the run that reconciles inline on every webhook (the handling before jobs.schedule_refresh)')
+
+    def handle(self, *args, **options):
+        calls = [fake_call(i) for i in range(options['calls'])]
+        events = [dict(calls[i % len(calls)], event_id=f'evt_{i}', type='call.completed') for i in range(options['webhooks'])]
+        self.stdout.write(f'{len(events)} webhooks, {len(calls)} listed calls, latency={options["latency"] * 1000:.0f}ms')
+
+        if not options['skip_inline']:
+            self.run('inline', calls, events, options['latency'], inline=True)
+        self.run('debounced', calls, events, options['latency'], inline=False)
+
+    def run(self, name, calls, events, latency, inline):
+        url = reverse('retell_webhook')
+        client = Client()
+        timings = []
+        queries = []
+
+        def count_query(execute, sql, params, many, context):
+            queries.append(None)
+            return execute(sql, params, many, context)
+
+        with StubRetell(calls=calls, latency=latency) as stub, \
+                stub_settings(stub, RETELL_WEBHOOK_SECRET=SECRET, RETELL_SYNC_INPROCESS=False), transaction.atomic():
+            with connection.execute_wrapper(count_query):
+                start = time.perf_counter()
+                for payload in events:
+                    t = time.perf_counter()
+                    r = signed_post(client, url, payload)
+                    if inline:
+                        refresh_retell_sessions(lite=True)
+                    timings.append(time.perf_counter() - t)
+                    if r.status_code != 200:
+                        self.stderr.write(f'webhook {payload["event_id"]}: {r.status_code}')
+                seconds = time.perf_counter() - start
+            listed = len(stub.list_requests)
+            jobs = SyncJob.objects.filter(kind=SyncJob.KIND_REFRESH).count()
+            ran = run_pending_jobs()
+            transaction.set_rollback(True)
+
+        timings.sort()
+        p = lambda q: timings[min(len(timings) - 1, int(q * len(timings)))] * 1000
+        self.stdout.write(f'{name:<10} {seconds:7.2f}s {len(events) / seconds:7.0f} webhooks/s  '
+                          f'p50={p(0.5):.1f}ms p95={p(0.95):.1f}ms  queries/webhook={len(queries) / len(events):.1f}  '
+                          f'list_requests={listed}  refresh_jobs={jobs} (ran {ran} after the burst)')
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.9 on 2026-10-18 17:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communications', '0007_drop_conversation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commsession',
+            name='payload_hash',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+        migrations.CreateModel(
+            name='SyncCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(default='retell', max_length=32)),
+                ('resource', models.CharField(max_length=64)),
+                ('watermark_ms', models.BigIntegerField(blank=True, null=True)),
+                ('pagination_key', models.CharField(blank=True, default='', max_length=256)),
+                ('last_run_at', models.DateTimeField(blank=True, null=True)),
+                ('last_listed', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('provider', 'resource')},
+            },
+        ),
+    ]
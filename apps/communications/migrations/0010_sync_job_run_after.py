@@ -0,0 +1,18 @@
+# Generated by Django 4.2.9 on 2026-10-18 18:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communications', '0009_sync_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syncjob',
+            name='run_after',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -139,6 +139,8 @@ class CommSession(models.Model):
     metadata = models.JSONField(default=dict, blank=True)
     # Payload bruto del proveedor para auditoría y sincronización incremental
     provider_payload = models.JSONField(default=dict, blank=True)
+    # Hash del item de listado ya sincronizado con su detalle (sync.py): sin cambios, no se vuelve a pedir
+    payload_hash = models.CharField(max_length=40, blank=True, default='')
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -251,6 +253,77 @@ class CommSyncLog(models.Model):
         return f"Sync {self.created_at:%Y-%m-%d %H:%M:%S} · {self.status_code}"
 
 
+class SyncJob(models.Model):
+    """A queued Retell sync, run by the retell_sync_worker command (jobs.py)."""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE    = 'done'
+    STATUS_FAILED  = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    )
+
+    KIND_SYNC    = 'sync'     # lists + details + messages (RetellSyncWebhookView.sync)
+    KIND_REFRESH = 'refresh'  # lists only (refresh_retell_sessions)
+    KIND_CHOICES = (
+        (KIND_SYNC, 'Sync'),
+        (KIND_REFRESH, 'Refresh'),
+    )
+
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES, default=KIND_SYNC)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    source = models.CharField(max_length=32, blank=True, default='')
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    worker = models.CharField(max_length=128, blank=True, default='')
+    attempts = models.PositiveIntegerField(default=0)
+    log = models.ForeignKey(CommSyncLog, null=True, blank=True, on_delete=models.SET_NULL)
+    result = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    # Not claimed before: debounced refreshes queued by webhooks (jobs.schedule_refresh)
+    run_after = models.DateTimeField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ("-created_at",)
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+
+class SyncLease(models.Model):
+    """Cluster-wide lock: the worker named in `owner` may run syncs until `expires_at`."""
+    name = models.CharField(max_length=64, unique=True)
+    owner = models.CharField(max_length=128, blank=True, default='')
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.owner or '-'}"
+
+
+class SyncCursor(models.Model):
+    """Where the incremental sync of a provider resource stands (sync.py)."""
+    provider = models.CharField(max_length=32, default='retell')
+    resource = models.CharField(max_length=64)
+    # Items that started before this (ms since epoch) are listed no more, unless they were still ongoing
+    watermark_ms = models.BigIntegerField(null=True, blank=True)
+    # Set when a run stopped at its page limit without moving the watermark: the next run resumes there
+    pagination_key = models.CharField(max_length=256, blank=True, default='')
+    last_run_at = models.DateTimeField(null=True, blank=True)
+    last_listed = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = (('provider', 'resource'),)
+
+    def __str__(self):
+        return f"{self.provider}:{self.resource} @ {self.watermark_ms}"
+
+
 """Conversation model removed (merged into CommSession)."""
 
 
@@ -0,0 +1,162 @@
+"""
+Incremental Retell sync.
+
+A SyncCursor per resource keeps a watermark: the list calls ask only for
+items that started after it (minus RETELL_SYNC_OVERLAP), oldest first.
+After a run the watermark moves to the newest start listed, but never past
+an item that was still ongoing or failed to sync, so those are listed again
+until they end or sync; an item holds it for RETELL_SYNC_HOLD_MAX_AGE
+seconds of newer activity at most. Listed items are hashed: a session whose
+item is unchanged and whose status is final is neither upserted nor has
+its detail fetched again (CommSession.payload_hash).
+"""
+
+import hashlib, json
+from datetime import datetime
+
+import requests
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import CommSession, CommStatus, SyncCursor
+
+RETELL_SYNC_OVERLAP   = getattr(settings, 'RETELL_SYNC_OVERLAP'  , 300)   # seconds listed again before the watermark
+RETELL_SYNC_PAGE_SIZE = getattr(settings, 'RETELL_SYNC_PAGE_SIZE', 1000)
+RETELL_SYNC_MAX_PAGES = getattr(settings, 'RETELL_SYNC_MAX_PAGES', 5)
+RETELL_SYNC_HOLD_MAX_AGE = getattr(settings, 'RETELL_SYNC_HOLD_MAX_AGE', 6 * 3600)  # seconds an item may hold the watermark
+
+FINAL_STATUSES = ('ended', 'completed', 'failed', 'error', 'canceled', 'cancelled', 'missed', 'not_connected')
+FINAL_SESSION_STATUSES = (CommStatus.COMPLETED, CommStatus.FAILED, CommStatus.MISSED, CommStatus.CANCELED)
+
+
+def load_cursor(resource, provider='retell'):
+    cursor, _ = SyncCursor.objects.get_or_create(provider=provider, resource=resource)
+    return cursor
+
+
+def payload_hash(item):
+    return hashlib.sha1(json.dumps(item, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def item_id(item):
+    # same precedence as the ingestion helpers
+    return item.get('call_id') or item.get('conversation_id') or item.get('id') or item.get('chat_id')
+
+
+def item_start_ms(item):
+    """Start of a listed item in ms since epoch, None when it has none."""
+    ms = item.get('start_timestamp')
+    if isinstance(ms, (int, float)):
+        return int(ms)
+    value = item.get('start_time') or item.get('started_at') or item.get('registered_time')
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        try:
+            return int(datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp() * 1000)
+        except ValueError:
+            return None
+    return None
+
+
+def item_is_final(item):
+    status = item.get('call_status') or item.get('chat_status') or item.get('conversation_status') or item.get('status') or ''
+    return status.lower() in FINAL_STATUSES or bool(item.get('end_timestamp') or item.get('end_time') or item.get('ended_at'))
+
+
+def lower_threshold(cursor):
+    if cursor.watermark_ms is None:
+        return None
+    return cursor.watermark_ms - RETELL_SYNC_OVERLAP * 1000
+
+
+def filter_criteria(cursor):
+    threshold = lower_threshold(cursor)
+    return {} if threshold is None else {'start_timestamp': {'lower_threshold': threshold}}
+
+
+def list_since(url, headers, cursor, list_keys, limit=None, max_pages=None):
+    """POSTs a Retell list-* endpoint for the items after the cursor, oldest first.
+
+    Returns (items, next_key, ok): next_key is set when max_pages stopped the
+    listing, ok is False when the endpoint failed on the first page.
+    """
+    limit = limit or RETELL_SYNC_PAGE_SIZE
+    h = dict(headers or {})
+    h.setdefault('Accept', 'application/json')
+    h['Content-Type'] = 'application/json'
+    threshold = lower_threshold(cursor)
+    items, next_key = [], cursor.pagination_key or None
+    for page in range(max_pages or RETELL_SYNC_MAX_PAGES):
+        payload = {'limit': limit, 'sort_order': 'ascending'}
+        if threshold is not None:
+            payload['filter_criteria'] = filter_criteria(cursor)
+        if next_key:
+            payload['pagination_key'] = next_key
+        r = requests.post(url, headers=h, json=payload, timeout=25)
+        if not r.ok:
+            return items, next_key, page > 0
+        data = r.json()
+        chunk = data if isinstance(data, list) else next((data.get(k) for k in list_keys if isinstance(data.get(k), list)), [])
+        # the API may ignore the filter: keep what is at or after the threshold
+        items += [it for it in chunk if isinstance(it, dict) and (threshold is None or (item_start_ms(it) or threshold) >= threshold)]
+        next_key = data.get('next_pagination_key') if isinstance(data, dict) else None
+        if not next_key and len(chunk) >= limit:
+            next_key = item_id(chunk[-1])
+        if not next_key:
+            return items, None, True
+    return items, next_key, True
+
+
+def new_watermark(items, failed=()):
+    """The newest start listed, held back to the oldest item still ongoing or whose id is in `failed`.
+
+    Items that started more than RETELL_SYNC_HOLD_MAX_AGE before the newest
+    one hold it no more (a status that never turns final, a lost detail).
+    """
+    starts = [(item_start_ms(it), item_is_final(it) and item_id(it) not in failed) for it in items]
+    starts = [(ms, done) for ms, done in starts if ms is not None]
+    if not starts:
+        return None
+    mark = max(ms for ms, _ in starts)
+    oldest = mark - RETELL_SYNC_HOLD_MAX_AGE * 1000
+    held = [ms for ms, done in starts if not done and ms >= oldest]
+    return min([mark] + held)
+
+
+def advance(cursor, items, next_key, failed=()):
+    """Moves the cursor after a run that listed `items` (next_key: where it stopped, failed: ids not synced)."""
+    previous = cursor.watermark_ms
+    mark = new_watermark(items, failed)
+    if mark is None:
+        mark = previous
+    elif cursor.pagination_key and previous is not None:
+        # resumed run: the pages before the key may hold ongoing items
+        mark = min(mark, previous)
+    stuck = mark is None or (previous is not None and mark <= previous)
+    cursor.pagination_key = next_key if next_key and stuck else ''
+    cursor.watermark_ms = mark
+    cursor.last_run_at = timezone.now()
+    cursor.last_listed = len(items)
+    cursor.save()
+
+
+def known_sessions(id_field, items):
+    """{provider id: (payload_hash, status)} of the sessions of `items`, one query per 500 ids."""
+    ids = list({item_id(it) for it in items if item_id(it)})
+    known = {}
+    for start in range(0, len(ids), 500):
+        rows = CommSession.objects.filter(**{f'{id_field}__in': ids[start:start + 500]})
+        for pk, digest, status in rows.values_list(id_field, 'payload_hash', 'status'):
+            known[pk] = (digest, status)
+    return known
+
+
+def needs_sync(item, known):
+    """False for the items whose session is final and was synced from this same payload."""
+    pk = item_id(item)
+    if not pk or pk not in known:
+        return True
+    digest, status = known[pk]
+    return digest != payload_hash(item) or status not in FINAL_SESSION_STATUSES
@@ -0,0 +1,186 @@
+"""
+A local stand-in for the Retell API, for communications tests and benchmarks.
+
+StubRetell serves the list endpoints (v2/list-calls, list-chats,
+v2/list-conversations) and the detail ones (get-call, get-conversation)
+from in-memory payloads on a background thread, with a simulated latency
+and optional throttling, and counts what it saw: requests, new
+connections, peak concurrency, throttled answers, list request bodies.
+stub_settings(stub) points the Retell settings at it.
+"""
+
+import json, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from django.test import override_settings
+
+
+def fake_call(i):
+    return {
+        'call_id': f'call_{i}',
+        'call_status': 'ended',
+        'direction': 'inbound',
+        'start_timestamp': 1704067200000 + i * 60000,
+        'end_timestamp': 1704067200000 + i * 60000 + 45000,
+        'duration_ms': 45000,
+        'transcript_object': [
+            {'role': 'agent', 'content': f'Hello {i}', 'words': [{'start': 0.5}]},
+            {'role': 'user', 'content': f'Question {i}', 'words': [{'start': 3.0}]},
+        ],
+    }
+
+
+def fake_chat(i):
+    return {
+        'chat_id': f'chat_{i}',
+        'chat_status': 'ended',
+        'start_timestamp': 1704067200000 + i * 60000,
+        'messages': [
+            {'message_id': f'chat_{i}_m0', 'role': 'user', 'content': f'Hi {i}'},
+            {'message_id': f'chat_{i}_m1', 'role': 'agent', 'content': f'Answer {i}'},
+        ],
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    disable_nagle_algorithm = True  # headers and body are two writes
+
+    def setup(self):
+        super().setup()
+        self.server.stub.count('connections')
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.answer('GET', None)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.answer('POST', json.loads(self.rfile.read(length) or b'{}'))
+
+    def answer(self, method, body):
+        stub = self.server.stub
+        status, body, headers = stub.handle(method, urlsplit(self.path), body)
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class StubRetell:
+    """Serves `calls` / `chats` (lists of payloads) on 127.0.0.1; use as a context manager.
+
+    latency: seconds per request; throttle_every: every n-th request gets a 429
+    with Retry-After: retry_after; failures: {call or chat id: n}, the next n
+    detail requests of the id get a 500.
+    """
+
+    def __init__(self, calls=(), chats=(), latency=0.0, throttle_every=0, retry_after=0, failures=None):
+        self.calls = {c['call_id']: c for c in calls}
+        self.chats = {c['chat_id']: c for c in chats}
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.failures = dict(failures or {})
+        self.stats = {'requests': 0, 'connections': 0, 'throttled': 0, 'in_flight': 0, 'peak_in_flight': 0}
+        self.list_requests = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.daemon_threads = True
+        self.server.stub = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, name, step=1):
+        with self.lock:
+            self.stats[name] += step
+            if name == 'in_flight':
+                self.stats['peak_in_flight'] = max(self.stats['peak_in_flight'], self.stats['in_flight'])
+            return self.stats[name]
+
+    def handle(self, method, url, body=None):
+        number = self.count('requests')
+        self.count('in_flight')
+        try:
+            time.sleep(self.latency)
+            if self.throttle_every and number % self.throttle_every == 0:
+                self.count('throttled')
+                return 429, {'error': 'rate limited'}, {'Retry-After': str(self.retry_after)}
+            return self.route(method, url, body)
+        finally:
+            self.count('in_flight', -1)
+
+    def route(self, method, url, body):
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        path = url.path.rstrip('/')
+        if method == 'POST':
+            lists = {
+                '/v2/list-calls': (self.calls, 'call_id', None),
+                '/list-chats': (self.chats, 'chat_id', None),
+                '/v2/list-conversations': (self.chats, 'chat_id', 'conversation_id'),
+            }
+            if path not in lists:
+                return 404, {'error': 'not found'}, {}
+            with self.lock:
+                self.list_requests.append((path, body))
+            return 200, self.listing(*lists[path], body or {}), {}
+        key = None
+        if path == '/get-call':
+            key, items = query.get('call_id'), self.calls
+        elif path.startswith('/v2/get-call/'):
+            key, items = path.rsplit('/', 1)[1], self.calls
+        elif path == '/get-conversation':
+            key, items = query.get('conversation_id'), self.chats
+        with self.lock:
+            if self.failures.get(key):
+                self.failures[key] -= 1
+                return 500, {'error': 'internal error'}, {'Retry-After': '0'}
+        found = items.get(key) if key else None
+        if found is None:
+            return 404, {'error': 'not found'}, {}
+        return 200, found, {}
+
+    def listing(self, items, key, alias, body):
+        """Items started at or after filter_criteria.start_timestamp.lower_threshold, after pagination_key."""
+        threshold = ((body.get('filter_criteria') or {}).get('start_timestamp') or {}).get('lower_threshold')
+        rows = sorted(items.values(), key=lambda it: it['start_timestamp'], reverse=body.get('sort_order') != 'ascending')
+        if threshold is not None:
+            rows = [it for it in rows if it['start_timestamp'] >= threshold]
+        if body.get('pagination_key'):
+            ids = [it[key] for it in rows]
+            rows = rows[ids.index(body['pagination_key']) + 1:] if body['pagination_key'] in ids else []
+        rows = rows[:body.get('limit') or 1000]
+        return [dict(it, **{alias: it[key]}) if alias else it for it in rows]
+
+
+def stub_settings(stub, **extra):
+    return override_settings(
+        RETELL_API_KEY='key',
+        RETELL_SYNC_TOKEN='token',
+        RETELL_LIST_CALLS_V2_URL=stub.url + '/v2/list-calls',
+        RETELL_LIST_CHATS_URL=stub.url + '/list-chats',
+        RETELL_LIST_CONVERSATIONS_V2_URL=stub.url + '/v2/list-conversations',
+        RETELL_GET_CALL_URL=stub.url + '/get-call',
+        RETELL_GET_CONVERSATION_URL=stub.url + '/get-conversation',
+        **extra,
+    )
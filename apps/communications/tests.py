@@ -0,0 +1,286 @@
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.communications.fetching import DetailFetcher, HostRateLimiter
+from apps.communications.jobs import (LEASE_NAME, RETELL_REFRESH_DEBOUNCE, Heartbeat, LeaseLost, acquire_lease, claim_next_job,
+                                      enqueue_sync, run_pending_jobs, run_sync_job)
+from apps.communications.models import CommMessage, CommSession, CommSyncLog, SyncCursor, SyncJob, SyncLease
+from apps.communications.sync import RETELL_SYNC_HOLD_MAX_AGE, RETELL_SYNC_OVERLAP, item_is_final, new_watermark
+from apps.communications.testing import StubRetell, fake_call, fake_chat, stub_settings
+from apps.communications.views import RetellSyncWebhookView, ingest_call_sessions, ingest_chat_sessions, refresh_retell_sessions
+
+
+class DetailFetcherTests(SimpleTestCase):
+    def setUp(self):
+        self.calls = [fake_call(i) for i in range(40)]
+
+    def candidates(self, stub, ids):
+        return {i: [(stub.url + '/get-call', {'call_id': i})] for i in ids}
+
+    def test_fetches_concurrently_over_kept_alive_connections(self):
+        with StubRetell(calls=self.calls, latency=0.01) as stub:
+            with DetailFetcher({}, workers=4, rate=0) as fetcher:
+                details, errors = fetcher.fetch_all(self.candidates(stub, [c['call_id'] for c in self.calls] + ['call_missing']))
+        self.assertEqual(errors, {})
+        self.assertEqual(details['call_7'], self.calls[7])
+        self.assertNotIn('call_missing', details)
+        self.assertEqual(len(details), 40)
+        self.assertLessEqual(stub.stats['connections'], 4)
+        self.assertLessEqual(stub.stats['peak_in_flight'], 4)
+
+    def test_falls_back_to_the_next_candidate(self):
+        with StubRetell(calls=self.calls) as stub:
+            with DetailFetcher({}, workers=2, rate=0) as fetcher:
+                details, _ = fetcher.fetch_all({'call_3': [(stub.url + '/get-call', {'call_id': 'nope'}),
+                                                           (stub.url + '/v2/get-call/call_3', None)]})
+        self.assertEqual(details, {'call_3': self.calls[3]})
+
+    def test_retries_throttled_requests(self):
+        with StubRetell(calls=self.calls, throttle_every=3) as stub:
+            with DetailFetcher({}, workers=1, rate=0, retries=1, backoff=0) as fetcher:
+                details, errors = fetcher.fetch_all(self.candidates(stub, [c['call_id'] for c in self.calls]))
+        self.assertEqual((len(details), errors), (40, {}))
+        self.assertEqual(fetcher.stats['retries'], stub.stats['throttled'])
+        self.assertGreater(stub.stats['throttled'], 0)
+
+    def test_gives_up_after_the_retries(self):
+        with StubRetell(calls=self.calls, throttle_every=1) as stub:
+            with DetailFetcher({}, workers=1, rate=0, retries=2, backoff=0) as fetcher:
+                details, _ = fetcher.fetch_all(self.candidates(stub, ['call_1']))
+        self.assertEqual(details, {})
+        self.assertEqual(stub.stats['requests'], 3)
+
+    def test_rate_limit_is_per_host(self):
+        limiter = HostRateLimiter(50)
+        start = time.monotonic()
+        for _ in range(6):
+            limiter.wait('https://api.example.com/get-call')
+        limiter.wait('https://other.example.com/get-call')
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+        self.assertLess(time.monotonic() - start, 0.5)
+
+
+class IncrementalSyncTests(TestCase):
+    def thresholds(self, stub, path):
+        return [((body.get('filter_criteria') or {}).get('start_timestamp') or {}).get('lower_threshold')
+                for p, body in stub.list_requests if p == path]
+
+    def test_refresh_lists_only_new_activity(self):
+        calls = [fake_call(i) for i in range(20)]
+        with StubRetell(calls=calls, chats=[fake_chat(i) for i in range(5)]) as stub, stub_settings(stub):
+            first = refresh_retell_sessions()
+            self.assertEqual(first['call'], {'created': 20, 'updated': 0})
+            self.assertEqual(first['chat'], {'created': 5, 'updated': 0})
+            mark = SyncCursor.objects.get(resource='calls').watermark_ms
+            self.assertEqual(mark, calls[-1]['start_timestamp'])
+
+            stub.calls.update({c['call_id']: c for c in [fake_call(i) for i in range(20, 23)]})
+            second = refresh_retell_sessions()
+            # the new calls, and the ones inside the overlap window
+            overlap = RETELL_SYNC_OVERLAP // 60
+            self.assertEqual(second['call'], {'created': 3, 'updated': overlap + 1})
+            self.assertEqual(self.thresholds(stub, '/v2/list-calls'), [None, mark - RETELL_SYNC_OVERLAP * 1000])
+        self.assertEqual(CommSession.objects.filter(retell_call_id__isnull=False).count(), 23)
+
+    def test_ongoing_sessions_hold_the_watermark(self):
+        calls = [fake_call(i) for i in range(10)]
+        calls[2].update(call_status='ongoing', end_timestamp=None)
+        with StubRetell(calls=calls) as stub, stub_settings(stub):
+            refresh_retell_sessions()
+            self.assertEqual(SyncCursor.objects.get(resource='calls').watermark_ms, calls[2]['start_timestamp'])
+
+            stub.calls['call_2'] = dict(calls[2], call_status='ended', end_timestamp=calls[2]['start_timestamp'] + 1000)
+            refresh_retell_sessions()
+            self.assertEqual(SyncCursor.objects.get(resource='calls').watermark_ms, calls[-1]['start_timestamp'])
+        self.assertEqual(CommSession.objects.get(retell_call_id='call_2').status, 'completed')
+
+    def test_sync_skips_details_of_unchanged_final_sessions(self):
+        calls = [fake_call(i) for i in range(8)]
+        chats = [fake_chat(i) for i in range(4)]
+        with StubRetell(calls=calls, chats=chats) as stub, stub_settings(stub):
+            def run():
+                before = stub.stats['requests'] - len(stub.list_requests)
+                data = RetellSyncWebhookView().sync()
+                return data, stub.stats['requests'] - len(stub.list_requests) - before
+
+            data, details = run()
+            self.assertEqual((data['created'], details), (12, 12))
+            self.assertEqual(CommMessage.objects.count(), 8 * 2 + 4 * 2)
+
+            data, details = run()
+            self.assertEqual((data['counts']['calls'], data['counts']['conversations'], details), (0, 0, 0))
+            # listed again: what started inside the overlap window before the watermark (a call a minute)
+            self.assertEqual(data['diag']['unchanged'], {'conversations': 4, 'calls': RETELL_SYNC_OVERLAP // 60 + 1})
+
+            stub.calls['call_7'] = dict(calls[7], call_analysis={'call_summary': 'changed'})
+            data, details = run()
+            self.assertEqual((data['counts']['calls'], details), (1, 1))
+
+    def test_failed_details_hold_the_watermark(self):
+        calls = [fake_call(i) for i in range(10)]
+        with StubRetell(calls=calls, failures={'call_3': 100}) as stub, stub_settings(stub):
+            RetellSyncWebhookView().sync()
+            session = CommSession.objects.get(retell_call_id='call_3')
+            self.assertEqual((session.messages.count(), session.payload_hash), (0, ''))
+            self.assertEqual(SyncCursor.objects.get(resource='calls+details').watermark_ms, calls[3]['start_timestamp'])
+
+            stub.failures.clear()
+            RetellSyncWebhookView().sync()
+        session = CommSession.objects.get(retell_call_id='call_3')
+        self.assertEqual((session.messages.count(), session.payload_hash != ''), (2, True))
+        self.assertEqual(SyncCursor.objects.get(resource='calls+details').watermark_ms, calls[-1]['start_timestamp'])
+
+    def test_stale_or_not_connected_items_do_not_hold_the_watermark(self):
+        self.assertTrue(item_is_final({'call_status': 'not_connected'}))
+        stale = dict(fake_call(0), call_status='ongoing', end_timestamp=None)
+        recent = dict(fake_call(1), start_timestamp=stale['start_timestamp'] + RETELL_SYNC_HOLD_MAX_AGE * 1000 + 1)
+        self.assertEqual(new_watermark([stale, recent]), recent['start_timestamp'])
+        self.assertEqual(new_watermark([stale, fake_call(1)]), stale['start_timestamp'])
+        self.assertEqual(new_watermark([fake_call(0), fake_call(1)], failed={'call_0'}), fake_call(0)['start_timestamp'])
+
+
+@override_settings(RETELL_SYNC_INPROCESS=False)
+class SyncJobTests(TestCase):
+    def test_enqueue_reuses_the_pending_job(self):
+        job, created = enqueue_sync(SyncJob.KIND_SYNC, source='site')
+        again, created_again = enqueue_sync(SyncJob.KIND_SYNC, source='webhook')
+        other, _ = enqueue_sync(SyncJob.KIND_REFRESH)
+        self.assertEqual((created, created_again, again.pk), (True, False, job.pk))
+        self.assertNotEqual(other.pk, job.pk)
+
+    def test_one_lease_holder_at_a_time(self):
+        self.assertTrue(acquire_lease('a'))
+        self.assertFalse(acquire_lease('b'))
+        self.assertTrue(acquire_lease('a'))
+        SyncLease.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertTrue(acquire_lease('b'))
+        self.assertEqual(run_pending_jobs('a'), 0)
+
+    def test_worker_runs_the_queued_sync(self):
+        with StubRetell(calls=[fake_call(i) for i in range(5)], chats=[fake_chat(i) for i in range(2)]) as stub, stub_settings(stub):
+            job, _ = enqueue_sync(SyncJob.KIND_SYNC)
+            self.assertEqual(run_pending_jobs('worker'), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.result['created']), (SyncJob.STATUS_DONE, 1, 7))
+        log = CommSyncLog.objects.get(pk=job.log_id)
+        self.assertEqual((log.status_code, log.payload['stage']), (200, 'done'))
+        self.assertEqual(SyncLease.objects.get().owner, '')
+
+    def test_jobs_of_a_lost_worker_are_requeued(self):
+        with StubRetell() as stub, stub_settings(stub):
+            job = SyncJob.objects.create(kind=SyncJob.KIND_REFRESH, status=SyncJob.STATUS_RUNNING, worker='dead', attempts=1)
+            self.assertEqual(run_pending_jobs('worker'), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker, job.attempts), (SyncJob.STATUS_DONE, 'worker', 2))
+
+    def test_a_worker_that_lost_the_lease_leaves_the_cursors(self):
+        with StubRetell(calls=[fake_call(i) for i in range(3)]) as stub, stub_settings(stub):
+            enqueue_sync(SyncJob.KIND_SYNC)
+            job = claim_next_job('worker')
+            SyncLease.objects.create(name=LEASE_NAME, owner='other', expires_at=timezone.now() + timedelta(seconds=60))
+            with self.assertRaises(LeaseLost):
+                run_sync_job(job, 'worker')
+        job.refresh_from_db()
+        self.assertEqual(job.status, SyncJob.STATUS_RUNNING)
+        self.assertFalse(SyncCursor.objects.filter(resource='calls+details', watermark_ms__isnull=False).exists())
+
+    def test_endpoints_answer_with_the_job(self):
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.client.force_login(admin)
+        with override_settings(RETELL_API_KEY='key'):
+            r = self.client.get(reverse('retell_sync_now'))
+        self.assertEqual(r.status_code, 202)
+        job_id = r.json()['job_id']
+        self.assertEqual(r.json()['status_url'], reverse('retell_sync_job', args=[job_id]))
+
+        r = self.client.get(reverse('retell_sync_job', args=[job_id]))
+        self.assertEqual((r.status_code, r.json()['kind'], r.json()['status']), (200, SyncJob.KIND_REFRESH, SyncJob.STATUS_PENDING))
+
+
+class HeartbeatTests(TransactionTestCase):
+    def test_renews_the_lease_until_it_is_taken(self):
+        acquire_lease('worker')
+        expires = SyncLease.objects.get().expires_at
+        heartbeat = Heartbeat('worker', interval=0.05)
+        heartbeat.start()
+        try:
+            time.sleep(0.3)
+            self.assertGreater(SyncLease.objects.get().expires_at, expires)
+            SyncLease.objects.update(owner='other')
+            self.assertTrue(heartbeat.lost.wait(2))
+        finally:
+            heartbeat.stop()
+
+
+@override_settings(RETELL_SYNC_INPROCESS=False, RETELL_WEBHOOK_SECRET='')
+class WebhookRefreshTests(TestCase):
+    def post(self, payload):
+        return self.client.post(reverse('retell_webhook'), payload, content_type='application/json')
+
+    def test_webhooks_ingest_and_queue_one_refresh(self):
+        calls = [fake_call(i) for i in range(30)]
+        with StubRetell(calls=calls) as stub, stub_settings(stub):
+            for i, call in enumerate(calls):
+                self.assertEqual(self.post(dict(call, event_id=f'evt_{i}', type='call.completed')).status_code, 200)
+            self.assertEqual(stub.list_requests, [])
+            self.assertEqual(CommSession.objects.count(), 30)
+            self.assertEqual(SyncJob.objects.filter(kind=SyncJob.KIND_REFRESH).count(), 1)
+
+            self.assertEqual(run_pending_jobs('worker'), 1)
+            self.assertEqual(len(stub.list_requests), 2)
+
+    def test_refreshes_are_debounced(self):
+        with StubRetell(calls=[fake_call(0)]) as stub, stub_settings(stub):
+            self.post(dict(fake_call(0), event_id='evt_0'))
+            run_pending_jobs('worker')
+            self.post(dict(fake_call(1), event_id='evt_1'))
+            self.post(dict(fake_call(2), event_id='evt_2'))
+            job = SyncJob.objects.get(status=SyncJob.STATUS_PENDING)
+            self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=RETELL_REFRESH_DEBOUNCE - 5))
+            self.assertEqual(run_pending_jobs('worker'), 0)
+
+            SyncJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            self.assertEqual(run_pending_jobs('worker'), 1)
+        self.assertEqual(len(stub.list_requests), 4)
+
+
+class BulkIngestTests(TestCase):
+    def test_ingests_a_thousand_calls_in_a_few_queries(self):
+        calls = [fake_call(i) for i in range(1000)]
+        with CaptureQueriesContext(connection) as queries:
+            results = ingest_call_sessions(calls + [{'call_status': 'ended'}])
+        self.assertLess(len(queries), 50)
+        self.assertEqual(sum(created for _, created in results), 1000)
+        self.assertEqual(results[-1], (None, False))
+        self.assertIsNotNone(results[0][0].pk)
+        self.assertEqual(CommSession.objects.filter(retell_call_id__isnull=False).count(), 1000)
+
+        # unchanged: the lookups only
+        with self.assertNumQueries(2):
+            results = ingest_call_sessions(calls)
+        self.assertFalse(any(created for _, created in results))
+
+    def test_updates_only_the_changed_rows(self):
+        ingest_chat_sessions([fake_chat(i) for i in range(5)])
+        before = dict(CommSession.objects.values_list('retell_conversation_id', 'updated_at'))
+        chats = [fake_chat(i) for i in range(5)]
+        chats[1]['chat_analysis'] = {'chat_summary': 'new summary'}
+        chats[3]['chat_status'] = 'failed'
+        chats[4]['metadata'] = ''  # empty values do not replace the stored ones
+        with CaptureQueriesContext(connection) as queries:
+            ingest_chat_sessions(chats + [fake_chat(5), dict(chats[1], chat_status='ongoing')])
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('UPDATE')]), 1)
+
+        after = {s.retell_conversation_id: s for s in CommSession.objects.all()}
+        self.assertEqual(len(after), 6)
+        self.assertEqual(sorted(i for i in before if after[i].updated_at != before[i]), ['chat_1', 'chat_3'])
+        self.assertEqual((after['chat_1'].transcript_excerpt, after['chat_1'].status), ('new summary', 'ongoing'))
+        self.assertEqual(after['chat_1'].tokens_prompt, 2)
+        self.assertEqual(after['chat_3'].status, 'failed')
@@ -12,6 +12,7 @@ from .views import (
     RetellListConversationsView,
     RetellListCallsView,
     RetellSyncNowView,
+    RetellSyncJobView,
     CommSessionDetailApiView,
     ConversationMemoryViewSet,
     RetellSimulateConversationView,
@@ -35,6 +36,7 @@ urlpatterns = [
     path('retell/sync/<str:token>/', RetellSyncWebhookView.as_view(), name='retell_sync'),
     path('retell/sync-latest-log/', latest_sync_log, name='retell_sync_latest_log'),
     path('retell/sync-now/', RetellSyncNowView.as_view(), name='retell_sync_now'),
+    path('retell/sync-jobs/<int:pk>/', RetellSyncJobView.as_view(), name='retell_sync_job'),
     path('retell/simulate-conversation/', RetellSimulateConversationView.as_view(), name='retell_simulate_conversation'),
     path('retell/webhook/', RetellWebhookView.as_view(), name='retell_webhook'),
     path('my/conversations/', MyConversationsListView.as_view(), name='my_conversations'),
@@ -2,8 +2,12 @@ from rest_framework import viewsets, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
-from .models import CommunicationChannel, CommunicationLog, CommSession, Channel, Direction, CommStatus, ConversationMemory
+from .models import CommunicationChannel, CommunicationLog, CommSession, Channel, Direction, CommStatus, ConversationMemory, SyncJob
 from .serializers import CommunicationChannelSerializer, CommunicationLogSerializer, ConversationMemorySerializer
+from .fetching import DetailFetcher
+from .ingest import is_filled, is_set, is_truthy, lookup_key, upsert_sessions
+from .jobs import LeaseLost, enqueue_sync, schedule_refresh, sync_job_status
+from .sync import advance, item_start_ms, known_sessions, list_since, load_cursor, lower_threshold, needs_sync, payload_hash
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
@@ -17,7 +21,6 @@ from django.db.models import Q
 from django.views import View
 from django.http import JsonResponse, HttpResponseForbidden, HttpResponseRedirect
 import time
-from rest_framework.test import APIRequestFactory
 from django.views.decorators.http import require_GET
 import hmac
 import hashlib
@@ -340,7 +343,8 @@ class ConversationMemoryViewSet(viewsets.ViewSet):
 class RetellSyncWebhookView(APIView):
     """
     Sync endpoint with a complex token path to be used as a Retell callback.
-    On each call, pulls conversations and calls from Retell and upserts CommSession records.
+    On each call, queues a sync job (jobs.py) that pulls conversations and calls from Retell
+    and upserts CommSession records (sync()).
     Security: requires token to match settings.RETELL_SYNC_TOKEN. No session auth required.
     """
     authentication_classes = []
@@ -358,7 +362,7 @@ class RetellSyncWebhookView(APIView):
             return None
 
     def _status_from_retell(self, item):
-        status = (item.get('status') or item.get('call_status') or item.get('conversation_status') or '').lower()
+        status = (item.get('status') or item.get('call_status') or item.get('conversation_status') or item.get('chat_status') or '').lower()
         mapping = {
             'completed': CommStatus.COMPLETED,
             'ended': CommStatus.COMPLETED,
@@ -399,42 +403,41 @@ class RetellSyncWebhookView(APIView):
         except Exception:
             return None
 
+    UPSERT_FIELDS = (
+        'status', 'started_at', 'ended_at', 'duration_sec', 'message_count', 'direction', 'channel',
+        'intent', 'transcript_excerpt', 'from_identity', 'to_identity', 'metadata'
+    )
+
     def _upsert_session(self, user, base_defaults):
-        # Upsert by unique retell ids preference: call_id, conversation_id, else external_ref
-        call_id = base_defaults.get('retell_call_id')
-        conv_id = base_defaults.get('retell_conversation_id')
-        flow_id = base_defaults.get('conversation_flow_id')
-        ext_ref = base_defaults.get('external_ref')
-        lookup = {}
-        if call_id:
-            lookup['retell_call_id'] = call_id
-        elif conv_id:
-            lookup['retell_conversation_id'] = conv_id
-        elif flow_id:
-            lookup['conversation_flow_id'] = flow_id
-        elif ext_ref:
-            lookup['external_ref'] = ext_ref
-        else:
-            # no identifiers, skip
-            return None, False
-
-        obj, created = CommSession.objects.get_or_create(defaults=base_defaults, **lookup)
-        if not created:
-            # update mutable fields
-            for f in (
-                'status', 'started_at', 'ended_at', 'duration_sec', 'message_count', 'direction', 'channel',
-                'intent', 'transcript_excerpt', 'from_identity', 'to_identity', 'metadata'
-            ):
-                val = base_defaults.get(f)
-                if val is not None:
-                    setattr(obj, f, val)
-            obj.save()
-        return obj, created
+        # Upsert by unique retell ids preference: call_id, conversation_id, flow id, else external_ref
+        return self._upsert_sessions([base_defaults])[0]
+
+    def _upsert_sessions(self, rows):
+        """Bulk _upsert_session (ingest.py); rows without identifiers give (None, False)."""
+        return upsert_sessions(rows, self.UPSERT_FIELDS, is_set)
 
     def _build_detail_url(self, base_url, item_id):
         # ensure single slash join
         return f"{base_url.rstrip('/')}/{item_id}"
 
+    def _conversation_detail_candidates(self, conv_id):
+        # Newer API style uses query param instead of path segment, older v2 path style if configured
+        conv_base = getattr(settings, 'RETELL_GET_CONVERSATION_URL', 'https://api.retellai.com/get-conversation')
+        candidates = [(conv_base, {'conversation_id': conv_id})]
+        v2_base = getattr(settings, 'RETELL_LIST_CONVERSATIONS_URL', '') or ''
+        if '/v2/conversations' in v2_base:
+            candidates.append((self._build_detail_url(v2_base, conv_id), None))
+        return candidates
+
+    def _call_detail_candidates(self, call_id):
+        # Query param first, then explicit path variants
+        calls_base = getattr(settings, 'RETELL_GET_CALL_URL', 'https://api.retellai.com/get-call')
+        return [
+            (calls_base, {'call_id': call_id}),
+            (self._build_detail_url('https://api.retellai.com/v2/get-call', call_id), None),
+            (self._build_detail_url('https://api.retellai.com/get-call', call_id), None),
+        ]
+
     def _extract_messages(self, detail):
         """Try to return a list of message dicts with keys: id, role, content, timestamp, audio_url, metadata"""
         if not isinstance(detail, dict):
@@ -699,29 +702,9 @@ class RetellSyncWebhookView(APIView):
         except Exception as e:
             return [], {'url': url, 'error': str(e)}
 
-    def post(self, request, token=None):
-        expected = getattr(settings, 'RETELL_SYNC_TOKEN', None)
-        if not expected or token != expected:
-            return Response({'error': 'forbidden'}, status=403)
-
-        api_key = getattr(settings, 'RETELL_API_KEY', None)
-        if not api_key:
-            return Response({'error': 'retell not configured'}, status=503)
-
-        headers = {'Authorization': f'Bearer {api_key}'}
-
-        created = 0
-        updated = 0
-        errors = []
-        stats = {
-            'messages_created': 0,
-            'messages_updated': 0,
-            'attachments_created': 0,
-        }
-
-        diag = {}
-
-    # Fetch conversations (try multiple candidate endpoints with pagination)
+    def _discover_conversations(self, headers, diag, errors):
+        """Legacy listing of conversations: every candidate endpoint, then the conversation flows."""
+        # Try multiple candidate endpoints with pagination
         try:
             conv_candidates = []
             conv_candidates.append(getattr(settings, 'RETELL_LIST_CONVERSATIONS_URL', 'https://api.retellai.com/list-conversations'))
@@ -823,8 +806,11 @@ class RetellSyncWebhookView(APIView):
         except Exception as e:
             conversations = []
             errors.append(f'conversations: {e}')
+        return conversations
 
-        # Fetch calls (try multiple candidate endpoints with pagination)
+    def _discover_calls(self, headers, diag, errors):
+        """Legacy listing of calls: every candidate endpoint, then the flows and the agent filter."""
+        # Try multiple candidate endpoints with pagination
         try:
             call_candidates = []
             call_candidates.append(getattr(settings, 'RETELL_LIST_CALLS_URL', 'https://api.retellai.com/list-calls'))
@@ -925,12 +911,81 @@ class RetellSyncWebhookView(APIView):
         except Exception as e:
             calls = []
             errors.append(f'calls: {e}')
+        return calls
+
+    def post(self, request, token=None):
+        expected = getattr(settings, 'RETELL_SYNC_TOKEN', None)
+        if not expected or token != expected:
+            return Response({'error': 'forbidden'}, status=403)
+
+        api_key = getattr(settings, 'RETELL_API_KEY', None)
+        if not api_key:
+            return Response({'error': 'retell not configured'}, status=503)
+
+        # The sync runs in the background (jobs.py), poll status_url
+        job, _ = enqueue_sync(SyncJob.KIND_SYNC, source='webhook')
+        return Response(sync_job_status(job), status=202)
+
+    def sync(self, progress=None):
+        """Pulls conversations and calls from Retell and upserts CommSession records; returns the counters.
+        progress(stage, **info) is called between the stages."""
+        progress = progress or (lambda stage, **info: None)
+        api_key = getattr(settings, 'RETELL_API_KEY', None)
+        headers = {'Authorization': f'Bearer {api_key}'}
+
+        created = 0
+        updated = 0
+        errors = []
+        stats = {
+            'messages_created': 0,
+            'messages_updated': 0,
+            'attachments_created': 0,
+        }
+
+        diag = {}
+
+        # Incremental listing (sync.py): only what started after the cursors, oldest first.
+        # The candidate endpoints are tried when the documented POST list fails, or on a first empty run.
+        conv_cursor = load_cursor('conversations+details')
+        conv_url = getattr(settings, 'RETELL_LIST_CONVERSATIONS_V2_URL', None) or 'https://api.retellai.com/v2/list-conversations'
+        try:
+            conversations, conv_next, conv_ok = list_since(conv_url, headers, conv_cursor, ('conversations', 'data', 'items'))
+        except Exception as e:
+            conversations, conv_next, conv_ok = [], None, False
+            errors.append(f'conversations: {e}')
+        if not conv_ok or (not conversations and conv_cursor.watermark_ms is None):
+            conversations = self._discover_conversations(headers, diag, errors)
+            conv_next = None
+        diag['conversations_since'] = lower_threshold(conv_cursor)
+
+        call_cursor = load_cursor('calls+details')
+        calls_url = getattr(settings, 'RETELL_LIST_CALLS_V2_URL', None) or 'https://api.retellai.com/v2/list-calls'
+        try:
+            calls, calls_next, calls_ok = list_since(calls_url, headers, call_cursor, ('calls', 'data', 'items'))
+        except Exception as e:
+            calls, calls_next, calls_ok = [], None, False
+            errors.append(f'calls: {e}')
+        if not calls_ok or (not calls and call_cursor.watermark_ms is None):
+            calls = self._discover_calls(headers, diag, errors)
+            calls_next = None
+        diag['calls_since'] = lower_threshold(call_cursor)
+
+        # Final sessions synced from the same list item are left alone (no upsert, no detail fetch)
+        listed_conversations, listed_calls = conversations, calls
+        conv_known = known_sessions('retell_conversation_id', conversations)
+        conversations = [c for c in conversations if needs_sync(c, conv_known)]
+        call_known = known_sessions('retell_call_id', calls)
+        calls = [k for k in calls if needs_sync(k, call_known)]
+        diag['unchanged'] = {'conversations': len(listed_conversations) - len(conversations), 'calls': len(listed_calls) - len(calls)}
+        progress('listed', conversations=len(listed_conversations), calls=len(listed_calls),
+                 to_sync=len(conversations) + len(calls))
 
         # Use system user or leave null; here we leave null, later we can map by metadata
         user = None
 
-        # Upsert conversations
+        # Upsert conversations and calls in one batch (ingest.py)
         skipped_no_id = 0
+        rows = []
         for c in conversations:
             try:
                 started = self._parse_iso(c.get('start_time') or c.get('started_at'))
@@ -962,15 +1017,10 @@ class RetellSyncWebhookView(APIView):
                     'metadata': c.get('metadata') or {},
                     'provider_payload': c,
                 }
-                obj, was_created = self._upsert_session(user, defaults)
-                if was_created:
-                    created += 1
-                else:
-                    updated += 1
+                rows.append(defaults)
             except Exception as e:
                 errors.append(f"conversation upsert: {e}")
 
-        # Upsert calls
         for k in calls:
             try:
                 # Retell V2 list-calls uses ms timestamps
@@ -1010,37 +1060,45 @@ class RetellSyncWebhookView(APIView):
                     'metadata': k.get('metadata') or {},
                     'provider_payload': k,
                 }
-                obj, was_created = self._upsert_session(user, defaults)
+                rows.append(defaults)
+            except Exception as e:
+                errors.append(f"call upsert: {e}")
+
+        sessions = {}
+        try:
+            for row, (obj, was_created) in zip(rows, self._upsert_sessions(rows)):
+                if not obj:
+                    continue
                 if was_created:
                     created += 1
                 else:
                     updated += 1
-            except Exception as e:
-                errors.append(f"call upsert: {e}")
-
-        # Fetch details and persist messages for conversations
-        conv_base = getattr(settings, 'RETELL_GET_CONVERSATION_URL', 'https://api.retellai.com/get-conversation')
-        for c in conversations:
+                sessions[lookup_key(row)] = obj
+        except Exception as e:
+            errors.append(f"session upsert: {e}")
+
+        progress('upserted', created=created, updated=updated)
+
+        # Fetch details concurrently (fetching.py), then persist messages on this thread
+        conv_ids = [c.get('conversation_id') or c.get('id') for c in conversations]
+        call_ids = [k.get('call_id') or k.get('id') for k in calls]
+        with DetailFetcher(headers) as fetcher:
+            conv_details, conv_errors = fetcher.fetch_all({i: self._conversation_detail_candidates(i) for i in conv_ids if i})
+            call_details, call_errors = fetcher.fetch_all({i: self._call_detail_candidates(i) for i in call_ids if i})
+            diag['detail_fetch'] = dict(fetcher.stats)
+        errors += [f"conversation detail: {e}" for e in conv_errors.values()]
+        errors += [f"call detail: {e}" for e in call_errors.values()]
+        progress('details', fetched=len(conv_details) + len(call_details))
+
+        # Ids left unsynced by a failed upsert, detail or save hold the cursors (sync.py)
+        synced = set()
+        for conv_id, c in zip(conv_ids, conversations):
             try:
-                conv_id = c.get('conversation_id') or c.get('id')
-                if not conv_id:
-                    continue
-                # Newer API style uses query param instead of path segment
-                d_resp = requests.get(conv_base, headers=headers, params={'conversation_id': conv_id}, timeout=20)
-                if not d_resp.ok:
-                    # Fallback to older v2 path style if configured
-                    try:
-                        v2_base = getattr(settings, 'RETELL_LIST_CONVERSATIONS_URL', '')
-                        if '/v2/conversations' in v2_base:
-                            detail_url = self._build_detail_url(v2_base, conv_id)
-                            d_resp = requests.get(detail_url, headers=headers, timeout=20)
-                    except Exception:
-                        pass
-                if not d_resp.ok:
+                detail = conv_details.get(conv_id)
+                if detail is None:
                     continue
-                detail = d_resp.json()
-                # Find the session we just upserted
-                session = CommSession.objects.filter(retell_conversation_id=conv_id).first()
+                # The session we just upserted
+                session = sessions.get(('retell_conversation_id', conv_id))
                 if not session:
                     continue
                 # Extract messages and persist
@@ -1070,37 +1128,19 @@ class RetellSyncWebhookView(APIView):
                 session.message_count = session.messages.count()
                 if session.duration_sec and session.duration_sec > 0:
                     session.voice_minutes = round(session.duration_sec / 60.0, 2)
+                session.payload_hash = payload_hash(c)
                 session.save()
+                synced.add(conv_id)
             except Exception as e:
                 errors.append(f"conversation detail: {e}")
 
-        # Fetch details and persist messages for calls (if API provides transcript/messages)
-        calls_base = getattr(settings, 'RETELL_GET_CALL_URL', 'https://api.retellai.com/get-call')
-        for k in calls:
+        # Persist messages for calls (if API provides transcript/messages)
+        for call_id, k in zip(call_ids, calls):
             try:
-                call_id = k.get('call_id') or k.get('id')
-                if not call_id:
-                    continue
-                # Try query param first
-                h = dict(headers or {})
-                h.setdefault('Accept', 'application/json')
-                d_resp = requests.get(calls_base, headers=h, params={'call_id': call_id}, timeout=20)
-                if not d_resp.ok:
-                    # Fallback to explicit path variants
-                    try:
-                        v2_get = 'https://api.retellai.com/v2/get-call'
-                        detail_url = self._build_detail_url(v2_get, call_id)
-                        d_resp = requests.get(detail_url, headers=h, timeout=20)
-                        if not d_resp.ok:
-                            get_legacy = 'https://api.retellai.com/get-call'
-                            detail_url = self._build_detail_url(get_legacy, call_id)
-                            d_resp = requests.get(detail_url, headers=h, timeout=20)
-                    except Exception:
-                        pass
-                if not d_resp.ok:
+                detail = call_details.get(call_id)
+                if detail is None:
                     continue
-                detail = d_resp.json()
-                session = CommSession.objects.filter(retell_call_id=call_id).first()
+                session = sessions.get(('retell_call_id', call_id))
                 if not session:
                     continue
                 for m in self._extract_messages(detail):
@@ -1110,12 +1150,21 @@ class RetellSyncWebhookView(APIView):
                 session.message_count = session.messages.count()
                 if session.duration_sec and session.duration_sec > 0:
                     session.voice_minutes = round(session.duration_sec / 60.0, 2)
+                session.payload_hash = payload_hash(k)
                 session.save()
+                synced.add(call_id)
             except Exception as e:
                 errors.append(f"call detail: {e}")
 
+        # Raises LeaseLost (jobs.py) when another worker took over: the cursors stay for it
+        progress('advance', synced=len(synced))
+        advance(conv_cursor, listed_conversations, conv_next, failed=set(conv_ids) - synced)
+        advance(call_cursor, listed_calls, calls_next, failed=set(call_ids) - synced)
+
         diag['skipped_no_id'] = skipped_no_id
-        return Response({'ok': True, 'created': created, 'updated': updated, **stats, 'errors': errors, 'diag': diag, 'counts': {'conversations': len(conversations), 'calls': len(calls)}})
+        return {'ok': True, 'created': created, 'updated': updated, **stats, 'errors': errors, 'diag': diag,
+                'counts': {'conversations': len(conversations), 'calls': len(calls),
+                           'listed_conversations': len(listed_conversations), 'listed_calls': len(listed_calls)}}
 
 
 @method_decorator(login_required, name='dispatch')
@@ -1220,42 +1269,16 @@ class CommSyncTriggerView(View):
     def get(self, request):
         if not request.user.is_superuser:
             return HttpResponseForbidden("forbidden")
-        token = getattr(settings, 'RETELL_SYNC_TOKEN', None)
-        if not token:
-            data = { 'ok': False, 'error': 'missing RETELL_SYNC_TOKEN' }
+        if not getattr(settings, 'RETELL_API_KEY', None):
+            data = { 'ok': False, 'error': 'retell not configured' }
             if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-                return JsonResponse(data, status=500)
+                return JsonResponse(data, status=503)
             return HttpResponseRedirect(request.META.get('HTTP_REFERER', '/'))
 
-        # Measure and log
-        start = time.time()
-        factory = APIRequestFactory()
-        req = factory.get('/')
-        resp = RetellSyncWebhookView.as_view()(req, token=token)
-        duration_ms = int((time.time() - start) * 1000)
-        # Normalize
-        payload = getattr(resp, 'data', None)
-        status = getattr(resp, 'status_code', 200)
-
-        # Persist sync log
-        try:
-            from .models import CommSyncLog
-            ip = request.META.get('HTTP_X_FORWARDED_FOR')
-            if ip and ',' in ip:
-                ip = ip.split(',')[0].strip()
-            if not ip:
-                ip = request.META.get('REMOTE_ADDR')
-            CommSyncLog.objects.create(
-                user=request.user,
-                ip=ip,
-                status_code=int(status or 0),
-                duration_ms=duration_ms,
-                payload=payload or { 'status': status },
-            )
-        except Exception:
-            pass
+        # Queue the sync (jobs.py): the request returns at once, the job id is polled
+        job, created = enqueue_sync(SyncJob.KIND_SYNC, user=request.user, source='site')
         if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-            return JsonResponse(payload or { 'status': status }, status=status)
+            return JsonResponse(sync_job_status(job), status=202)
         # Non-AJAX: redirect back
         return HttpResponseRedirect(request.META.get('HTTP_REFERER', '/'))
 
@@ -1289,27 +1312,22 @@ class RetellSyncNowView(APIView):
     def get(self, request):
         if not request.user.is_superuser:
             return Response({'error': 'forbidden'}, status=403)
-        start = time.time()
-        result = refresh_retell_sessions()
-        duration_ms = int((time.time() - start) * 1000)
-        # persist log
-        try:
-            from .models import CommSyncLog
-            ip = request.META.get('HTTP_X_FORWARDED_FOR')
-            if ip and ',' in ip:
-                ip = ip.split(',')[0].strip()
-            if not ip:
-                ip = request.META.get('REMOTE_ADDR')
-            CommSyncLog.objects.create(
-                user=request.user,
-                ip=ip,
-                status_code=200,
-                duration_ms=duration_ms,
-                payload=result,
-            )
-        except Exception:
-            pass
-        return Response(result, status=200)
+        # Queued (jobs.py), the CommSyncLog of the run is written by the worker
+        job, created = enqueue_sync(SyncJob.KIND_REFRESH, user=request.user, source='site')
+        return Response(sync_job_status(job), status=202)
+
+
+class RetellSyncJobView(APIView):
+    """Status of a queued sync: GET retell/sync-jobs/<id>/"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        if not request.user.is_superuser:
+            return Response({'error': 'forbidden'}, status=403)
+        job = SyncJob.objects.select_related('log').filter(pk=pk).first()
+        if not job:
+            return Response({'error': 'not found'}, status=404)
+        return Response(sync_job_status(job))
 
 
 class RetellSimulateConversationView(APIView):
@@ -1479,10 +1497,8 @@ class RetellSimpleCallbackView(APIView):
                     helper._ensure_message(session, Channel.WEB, m, stats)
                 session.message_count = session.messages.count()
                 session.save()
-                try:
-                    refresh_retell_sessions(lite=True)
-                except Exception:
-                    pass
+                # Reconciliation of the list endpoints runs in the background, debounced (jobs.py)
+                schedule_refresh(source='callback')
                 return Response({'ok': True, 'conversation_id': conversation_id, **stats})
             except Exception as e:
                 return Response({'ok': False, 'conversation_id': conversation_id, 'error': str(e)}, status=500)
@@ -1525,10 +1541,26 @@ def resolve_user_from_payload(payload: dict):
 
 
 # --- Unified ingestion helpers (chat & call) ---
+CHAT_UPDATE_FIELDS = ('status', 'ended_at', 'duration_sec', 'message_count', 'intent', 'transcript_excerpt', 'metadata')
+CALL_UPDATE_FIELDS = ('status', 'ended_at', 'duration_sec', 'message_count', 'transcript_excerpt', 'metadata')
+
+
 def _ingest_chat_session(item: dict):
     """Create or update a CommSession for a chat conversation item from Retell."""
+    return ingest_chat_sessions([item])[0]
+
+
+def ingest_chat_sessions(items):
+    """Bulk _ingest_chat_session (ingest.py): a (session, created) pair per item."""
+    rows = [_chat_session_fields(it) for it in items]
+    results = iter(upsert_sessions([r for r in rows if r], CHAT_UPDATE_FIELDS, is_filled))
+    return [next(results) if r else (None, False) for r in rows]
+
+
+def _chat_session_fields(item):
+    """CommSession fields of a chat conversation item from Retell, None without an id."""
     if not isinstance(item, dict):
-        return None, False
+        return None
     from .models import CommSession, Channel, Direction, CommStatus
     def parse_iso(s):
         if not s:
@@ -1553,7 +1585,7 @@ def _ingest_chat_session(item: dict):
 
     conv_id = item.get('conversation_id') or item.get('id') or item.get('chat_id')
     if not conv_id:
-        return None, False
+        return None
 
     # New chat API (list-chats) uses start_timestamp (ms) and chat_status + chat_analysis
     is_new_chat_payload = 'chat_id' in item or 'chat_status' in item
@@ -1631,27 +1663,25 @@ def _ingest_chat_session(item: dict):
             defaults['tokens_prompt'] = approx_tokens
     except Exception:
         pass
-    obj, created = CommSession.objects.get_or_create(retell_conversation_id=conv_id, defaults=defaults)
-    if not created:
-        for f in ('status','ended_at','duration_sec','message_count','intent','transcript_excerpt','metadata'):
-            if f in defaults:
-                val = defaults.get(f)
-                if val is not None and val != '':
-                    setattr(obj, f, val)
-        # Backfill de tokens si aún están en cero y ya tenemos transcript
-        try:
-            if (not getattr(obj, 'tokens_prompt', 0)) and (obj.transcript_excerpt):
-                obj.tokens_prompt = max(1, len(obj.transcript_excerpt.split()))
-        except Exception:
-            pass
-        obj.save()
-    return obj, created
+    return defaults
 
 
 def _ingest_call_session(item: dict):
     """Create or update a CommSession for a voice call item from Retell."""
+    return ingest_call_sessions([item])[0]
+
+
+def ingest_call_sessions(items):
+    """Bulk _ingest_call_session (ingest.py): a (session, created) pair per item."""
+    rows = [_call_session_fields(it) for it in items]
+    results = iter(upsert_sessions([r for r in rows if r], CALL_UPDATE_FIELDS, is_truthy))
+    return [next(results) if r else (None, False) for r in rows]
+
+
+def _call_session_fields(item):
+    """CommSession fields of a voice call item from Retell, None without an id."""
     if not isinstance(item, dict):
-        return None, False
+        return None
     from .models import CommSession, Channel, Direction, CommStatus
     def parse_ms(ms):
         if ms is None:
@@ -1673,7 +1703,7 @@ def _ingest_call_session(item: dict):
             return None
     call_id = item.get('call_id') or item.get('id')
     if not call_id:
-        return None, False
+        return None
     started = parse_ms(item.get('start_timestamp')) or parse_iso(item.get('start_time') or item.get('registered_time'))
     ended = parse_ms(item.get('end_timestamp')) or parse_iso(item.get('end_time'))
     dms = item.get('duration_ms')
@@ -1711,19 +1741,7 @@ def _ingest_call_session(item: dict):
             defaults['tokens_prompt'] = max(1, len((defaults['transcript_excerpt'] or '').split()))
     except Exception:
         pass
-    obj, created = CommSession.objects.get_or_create(retell_call_id=call_id, defaults=defaults)
-    if not created:
-        for f in ('status','ended_at','duration_sec','message_count','transcript_excerpt','metadata'):
-            val = defaults.get(f)
-            if val:
-                setattr(obj, f, val)
-        try:
-            if (not getattr(obj, 'tokens_prompt', 0)) and obj.transcript_excerpt:
-                obj.tokens_prompt = max(1, len(obj.transcript_excerpt.split()))
-        except Exception:
-            pass
-        obj.save()
-    return obj, created
+    return defaults
 
 
 class RetellWebhookView(APIView):
@@ -1773,11 +1791,9 @@ class RetellWebhookView(APIView):
             session, created_flag = _ingest_call_session(root)
         else:
             session, created_flag = _ingest_chat_session(root)
-        # Light background refresh to reconcile list endpoints
-        try:
-            refresh_retell_sessions(lite=True)
-        except Exception:
-            pass
+        # Reconciliation of the list endpoints runs in the background, debounced (jobs.py)
+        if getattr(settings, 'RETELL_API_KEY', None):
+            schedule_refresh(source='webhook')
         if not session:
             return Response({'error': 'unable to ingest'}, status=400)
 
@@ -1809,34 +1825,27 @@ class RetellWebhookView(APIView):
         return Response({'status': 'ok', 'created': created_flag})
 
 
-def refresh_retell_sessions(lite: bool=False):
+def refresh_retell_sessions(lite: bool=False, progress=None):
     """Fetch chats from list-chat and calls from v2/list-calls only; upsert CommSession.
+    Only lists what started after the 'chats' / 'calls' cursors (sync.py).
     lite=True omite diagnósticos detallados.
     """
-    from .models import CommSession
     api_key = getattr(settings, 'RETELL_API_KEY', '')
     headers = {'Authorization': f'Bearer {api_key}', 'Content-Type': 'application/json'}
     # Correct chat endpoints: prefer POST /list-chats (object with "chats"), fallback GET /list-chat (array)
-    chat_post_url = 'https://api.retellai.com/list-chats'
+    chat_post_url = getattr(settings, 'RETELL_LIST_CHATS_URL', None) or 'https://api.retellai.com/list-chats'
     chat_get_url = 'https://api.retellai.com/list-chat'
-    calls_url = 'https://api.retellai.com/v2/list-calls'
+    calls_url = getattr(settings, 'RETELL_LIST_CALLS_V2_URL', None) or 'https://api.retellai.com/v2/list-calls'
     created_chat = updated_chat = created_call = updated_call = 0
     diag = {} if not lite else None
     # Chats
     try:
-        items = []
+        chat_cursor = load_cursor('chats')
         # Primary: POST /list-chats
-        rc = requests.post(chat_post_url, headers=headers, json={'limit': 1000}, timeout=25)
-        if rc.ok:
-            data = rc.json() or {}
-            if isinstance(data, list):
-                items = data
-            elif isinstance(data, dict):
-                items = data.get('chats') or data.get('data') or data.get('items') or []
-        else:
-            if diag is not None: diag['chat_post_status'] = rc.status_code
-        # Fallback: GET /list-chat
-        if not items:
+        items, next_key, ok = list_since(chat_post_url, headers, chat_cursor, ('chats', 'data', 'items'))
+        if not ok:
+            if diag is not None: diag['chat_post_failed'] = True
+            # Fallback: GET /list-chat (unfiltered, the threshold is applied here)
             rg = requests.get(chat_get_url, headers={'Authorization': headers['Authorization'], 'Accept': 'application/json'}, params={'limit': 1000}, timeout=25)
             if rg.ok:
                 gdata = rg.json() if rg.headers.get('Content-Type','').startswith('application/json') else []
@@ -1844,37 +1853,46 @@ def refresh_retell_sessions(lite: bool=False):
                     items = gdata
                 elif isinstance(gdata, dict):
                     items = gdata.get('chats') or gdata.get('data') or gdata.get('items') or []
+                threshold = lower_threshold(chat_cursor)
+                if threshold is not None:
+                    items = [it for it in items if (item_start_ms(it) or threshold) >= threshold]
             else:
                 if diag is not None: diag['chat_get_status'] = rg.status_code
-        for it in items:
-            cid = it.get('conversation_id') or it.get('id') or it.get('chat_id')
-            if not cid:
+        for session, was_created in ingest_chat_sessions(items):
+            if not session:
                 continue
-            existed = CommSession.objects.filter(retell_conversation_id=cid).exists()
-            _ingest_chat_session(it)
-            if existed: updated_chat += 1
-            else: created_chat += 1
+            if was_created: created_chat += 1
+            else: updated_chat += 1
+        if ok or items:
+            if progress:
+                progress('chats', listed=len(items))
+            advance(chat_cursor, items, next_key)
         if diag is not None:
             diag['chat_count'] = len(items)
+    except LeaseLost:
+        raise
     except Exception as e:
         if diag is not None: diag['chat_error'] = str(e)
+    if progress:
+        progress('calls', chats=created_chat + updated_chat)
     # Calls
     try:
-        rc2 = requests.post(calls_url, headers=headers, json={'limit': 1000}, timeout=25)
-        if rc2.ok:
-            data2 = rc2.json() or {}
-            items2 = data2.get('calls') or data2.get('data') or data2.get('items') or []
-            for it in items2:
-                call_id = it.get('call_id') or it.get('id')
-                if not call_id:
+        call_cursor = load_cursor('calls')
+        items2, next_key, ok = list_since(calls_url, headers, call_cursor, ('calls', 'data', 'items'))
+        if ok:
+            for session, was_created in ingest_call_sessions(items2):
+                if not session:
                     continue
-                existed = CommSession.objects.filter(retell_call_id=call_id).exists()
-                _ingest_call_session(it)
-                if existed: updated_call += 1
-                else: created_call += 1
+                if was_created: created_call += 1
+                else: updated_call += 1
+            if progress:
+                progress('calls', listed=len(items2))
+            advance(call_cursor, items2, next_key)
             if diag is not None: diag['calls_count'] = len(items2)
         else:
-            if diag is not None: diag['calls_status'] = rc2.status_code
+            if diag is not None: diag['calls_failed'] = True
+    except LeaseLost:
+        raise
     except Exception as e:
         if diag is not None: diag['calls_error'] = str(e)
     return {
@@ -1884,7 +1902,6 @@ def refresh_retell_sessions(lite: bool=False):
         **({'diag': diag} if diag is not None else {})
     }
 
-
 class MyConversationsListView(APIView):
     """Backward-compatible endpoint now sourcing from CommSession (web + voice)."""
     permission_classes = [IsAuthenticated]
@@ -8,3 +8,8 @@ from django.apps import AppConfig
 class DynApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.dyn_api'
+
+    def ready(self):
+        from apps.dyn_api import registry, signals
+        registry.build_registry()
+        signals.connect_version_signals()
@@ -0,0 +1,104 @@
+# -*- encoding: utf-8 -*-
+"""
+Copyright (c) 2019 - present AppSeed.us
+
+Async reads of DynamicAPI, routed when DYNAMIC_API_ASYNC is on (config/asgi.py
+turns it on): JSON and NDJSON GETs are answered with the async ORM (aget(),
+`async for`), so a slow list doesn't hold the process while the others are
+served. Writes and the browsable API go to the DRF view (DynamicAPI) in a
+worker thread. The responses are the ones of DynamicAPI, byte for byte.
+"""
+
+from asgiref.sync import sync_to_async
+
+from django.http import HttpResponse
+
+from rest_framework.renderers import JSONRenderer
+
+from .caching import acached_get
+from .registry import api_model
+from .listing import list_params, alist_page, ListError
+from .serializers import aget_row
+from .streaming import NDJSONRenderer, astream_response
+from .views import DynamicAPI
+
+sync_view = DynamicAPI.as_view()
+
+def json_response(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), content_type='application/json', status=status)
+
+def read_format(request):
+    """'json' or 'ndjson' when the async path can answer, None when DRF negotiates (html, other formats)."""
+    if request.method != 'GET':
+        return None
+    fmt = request.GET.get('format')
+    if fmt:
+        return fmt if fmt in ('json', NDJSONRenderer.format) else None
+    accept = request.headers.get('Accept', '')
+    if NDJSONRenderer.media_type in accept:
+        return NDJSONRenderer.format
+    return None if 'text/html' in accept else 'json'
+
+async def read_object(aModelClass, model_id):
+    try:
+        data = await aget_row(aModelClass.objects.all(), id=model_id)
+    except aModelClass.DoesNotExist:
+        return json_response({
+            'message': 'object with given id not found.',
+            'success': False
+        }, status=404)
+    return json_response({
+        'data': data,
+        'success': True
+    })
+
+async def read_page(request, aModelClass, params):
+    output, next_url, previous_url = await alist_page(request, aModelClass.objects.all(), params)
+    return json_response({
+        'data': output,
+        'next': next_url,
+        'previous': previous_url,
+        'success': True
+    })
+
+# READ : GET api/model/id or api/model, the rest goes to DynamicAPI
+async def dynamic_api(request, **kwargs):
+    fmt = read_format(request)
+    if fmt is None:
+        return await sync_to_async(sync_view)(request, **kwargs)
+
+    slug = kwargs.get('model_name')
+    try:
+        aModelClass = api_model(slug)
+    except KeyError:
+        return json_response({
+            'message': 'this model is not activated or not exist.',
+            'success': False
+        }, status=400)
+
+    if kwargs.get('id') is not None:
+        try:
+            model_id = int(kwargs.get('id'))
+            if model_id < 0:
+                raise ValueError('Expect positive int')
+        except ValueError as e:
+            return json_response({
+                'message': 'Input Error = ' + str(e),
+                'success': False
+            }, status=400)
+        return await acached_get(request, slug, aModelClass, kwargs.get('id'), lambda: read_object(aModelClass, model_id))
+
+    try:
+        params = list_params(slug, aModelClass, request.GET)
+    except ListError as e:
+        return json_response({
+            'message': 'Input Error = ' + str(e),
+            'success': False
+        }, status=400)
+
+    if fmt == NDJSONRenderer.format or request.GET.get('stream') in ('1', 'true'):
+        return astream_response(aModelClass.objects.all(), params, fmt == NDJSONRenderer.format)
+    return await acached_get(request, slug, aModelClass, None, lambda: read_page(request, aModelClass, params))
+
+# Like the DRF view, whose authentication checks CSRF (Django 4.2's csrf_exempt() wraps async views in a sync one)
+dynamic_api.csrf_exempt = True
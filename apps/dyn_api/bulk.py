@@ -0,0 +1,269 @@
+# -*- encoding: utf-8 -*-
+"""
+Copyright (c) 2019 - present AppSeed.us
+
+Bulk writes of DynamicAPI models.
+
+Rows are validated by a ModelSerializer in batches, without its per-row
+queries: FK ids are checked with one pk__in lookup per batch and unique
+columns are left to the database. Writes are bulk_create / bulk_update in
+one transaction, all or nothing. Every request gets one status and one
+result per item: {'index', 'status', 'id'} or {'index', 'status', 'errors'}.
+"""
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+
+from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
+
+from apps.common.signals import send_rows_changed
+from .listing import api_option
+
+API_BULK_MAX_ROWS = getattr(settings, 'DYNAMIC_API_BULK_MAX_ROWS', 10000)
+API_BULK_BATCH    = getattr(settings, 'DYNAMIC_API_BULK_BATCH'   , 500)
+
+STATUS_CREATED   = 'created'
+STATUS_UPDATED   = 'updated'
+STATUS_DELETED   = 'deleted'
+STATUS_INVALID   = 'invalid'
+STATUS_NOT_FOUND = 'not_found'
+STATUS_SKIPPED   = 'skipped'  # valid, not written because of other items
+
+class BulkError(Exception):
+    """Rejected request, nothing written; `results` holds the per-item outcome."""
+    def __init__(self, message, results=None, status=400):
+        super().__init__(message)
+        self.results = results or []
+        self.status = status
+
+class RelatedPk(serializers.PrimaryKeyRelatedField):
+    """A FK as its key, checked for the whole batch by check_related()."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return self.get_queryset().model._meta.pk.to_python(data)
+        except ValidationError:
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+class BulkSerializer(serializers.ModelSerializer):
+    serializer_related_field = RelatedPk
+
+    def get_validators(self):
+        # unique_together / UniqueConstraint: enforced by the database
+        return []
+
+    def build_standard_field(self, field_name, model_field):
+        field_class, kwargs = super().build_standard_field(field_name, model_field)
+        if 'validators' in kwargs:
+            kwargs['validators'] = [v for v in kwargs['validators'] if not isinstance(v, UniqueValidator)]
+        return field_class, kwargs
+
+_bulk_serializers = {}
+
+def bulk_serializer_class(aModelClass):
+    cls = _bulk_serializers.get(aModelClass)
+    if cls is None:
+        meta = type('Meta', (), {'model': aModelClass, 'fields': '__all__'})
+        cls = _bulk_serializers[aModelClass] = type(aModelClass.__name__ + 'BulkSerializer', (BulkSerializer,), {'Meta': meta})
+    return cls
+
+def batches(items, size=API_BULK_BATCH):
+    for start in range(0, len(items), size):
+        yield start, items[start:start + size]
+
+def result(index, status, pk=None, errors=None):
+    item = {'index': index, 'status': status}
+    if pk is not None:
+        item['id'] = pk
+    if errors:
+        item['errors'] = errors
+    return item
+
+def rejected(count, errors, status=400):
+    """BulkError carrying every item: the failing ones and the skipped ones."""
+    results = [result(i, errors[i][0], errors=errors[i][1]) if i in errors else result(i, STATUS_SKIPPED) for i in range(count)]
+    return BulkError('Rows rejected, nothing was written', results, status)
+
+def check_rows(rows):
+    if not isinstance(rows, list) or not rows:
+        raise BulkError('Expected a non empty list of rows')
+    if len(rows) > API_BULK_MAX_ROWS:
+        raise BulkError(f'At most {API_BULK_MAX_ROWS} rows per request')
+
+def natural_key(aModelClass, names):
+    """The fields of `names`, when they are a unique key of the model."""
+    if isinstance(names, str):
+        names = [names]
+    try:
+        fields = [aModelClass._meta.get_field(name) for name in names]
+    except Exception:
+        raise BulkError('Unknown key field in: ' + ', '.join(map(str, names)))
+
+    opts = aModelClass._meta
+    unique_sets = [set(together) for together in opts.unique_together]
+    unique_sets += [set(c.fields) for c in opts.total_unique_constraints]
+    if len(fields) == 1 and (fields[0].unique or fields[0].primary_key) or set(names) in unique_sets:
+        return fields
+    raise BulkError('Not a unique key: ' + ', '.join(names))
+
+def validate_rows(aModelClass, rows, partial):
+    """Validated data of every row (FK fields hold the key), or raises BulkError."""
+    cls = bulk_serializer_class(aModelClass)
+    validated, errors = [], {}
+    for start, chunk in batches(rows):
+        serializer = cls(data=chunk, many=True, partial=partial)
+        if serializer.is_valid():
+            validated += serializer.validated_data
+        else:
+            for i, row_errors in enumerate(serializer.errors):
+                if row_errors:
+                    errors[start + i] = (STATUS_INVALID, row_errors)
+            validated += [None] * len(chunk)
+
+    if not errors:
+        check_related(aModelClass, validated, errors)
+    if errors:
+        raise rejected(len(rows), errors)
+    return validated
+
+def check_related(aModelClass, validated, errors):
+    for field in aModelClass._meta.concrete_fields:
+        if not field.is_relation:
+            continue
+        wanted = list({row[field.name] for row in validated if row.get(field.name) is not None})
+        found = set()
+        for _, chunk in batches(wanted):
+            found.update(field.related_model._default_manager.filter(pk__in=chunk).values_list('pk', flat=True))
+        for i, row in enumerate(validated):
+            pk = row.get(field.name)
+            if pk is not None and pk not in found:
+                message = f'Invalid pk "{pk}" - object does not exist.'
+                errors.setdefault(i, (STATUS_INVALID, {}))[1][field.name] = [message]
+
+def model_values(aModelClass, data):
+    """Validated data -> model attribute values (FKs by attname)."""
+    return {aModelClass._meta.get_field(name).attname: value for name, value in data.items()}
+
+def key_of(fields, row, raw=None):
+    """The natural key tuple of a row, read from the validated row or the raw input."""
+    values = []
+    for field in fields:
+        if raw is not None and field.name in raw:
+            value = raw[field.name]
+        elif row is not None and field.name in row:
+            value = row[field.name]
+        else:
+            return None
+        target = field.target_field if field.is_relation else field
+        try:
+            values.append(target.to_python(value))
+        except ValidationError:
+            return None
+    return tuple(values)
+
+def existing_rows(aModelClass, fields, keys):
+    """{key: instance} of the rows matching `keys`, locked for the transaction."""
+    found = {}
+    for _, chunk in batches(list(keys)):
+        if len(fields) == 1:
+            query = Q(**{f'{fields[0].attname}__in': [k[0] for k in chunk]})
+        else:
+            query = Q()
+            for key in chunk:
+                query |= Q(**{f.attname: v for f, v in zip(fields, key)})
+        for obj in aModelClass._default_manager.select_for_update().filter(query):
+            found[tuple(getattr(obj, f.attname) for f in fields)] = obj
+    return found
+
+def bulk_create_rows(aModelClass, rows):
+    check_rows(rows)
+    validated = validate_rows(aModelClass, rows, partial=False)
+
+    objs = [aModelClass(**model_values(aModelClass, data)) for data in validated]
+    with transaction.atomic():
+        aModelClass._default_manager.bulk_create(objs, batch_size=API_BULK_BATCH)
+        send_rows_changed(aModelClass, [obj.pk for obj in objs])
+    return [result(i, STATUS_CREATED, obj.pk) for i, obj in enumerate(objs)]
+
+def bulk_write_rows(aModelClass, rows, key, create):
+    """Updates the rows matched by the natural `key`; creates the others when
+    `create` (upsert), they are reported as not found otherwise."""
+    check_rows(rows)
+    fields = natural_key(aModelClass, key)
+    validated = validate_rows(aModelClass, rows, partial=not create)
+
+    keys, seen, errors = [], set(), {}
+    for i, (raw, data) in enumerate(zip(rows, validated)):
+        row_key = key_of(fields, data, raw)
+        if row_key is None:
+            errors[i] = (STATUS_INVALID, {f.name: ['This field is required.'] for f in fields})
+        elif row_key in seen:
+            errors[i] = (STATUS_INVALID, {'non_field_errors': ['Duplicate key in this request.']})
+        keys.append(row_key)
+        seen.add(row_key)
+    if errors:
+        raise rejected(len(rows), errors)
+
+    with transaction.atomic():
+        found = existing_rows(aModelClass, fields, keys)
+        if not create:
+            errors = {i: (STATUS_NOT_FOUND, None) for i, row_key in enumerate(keys) if row_key not in found}
+            if errors:
+                raise rejected(len(rows), errors, status=404)
+
+        results, created, updated, changed = [], [], [], set()
+        for i, (row_key, data) in enumerate(zip(keys, validated)):
+            values = model_values(aModelClass, data)
+            obj = found.get(row_key)
+            if obj is None:
+                # the key may be read-only in the serializer (the primary key)
+                for field, value in zip(fields, row_key):
+                    values.setdefault(field.attname, value)
+                obj = aModelClass(**values)
+                created.append(obj)
+                results.append((i, STATUS_CREATED, obj))
+                continue
+            for name, value in values.items():
+                setattr(obj, name, value)
+            changed.update(values.keys())
+            updated.append(obj)
+            results.append((i, STATUS_UPDATED, obj))
+
+        if created:
+            aModelClass._default_manager.bulk_create(created, batch_size=API_BULK_BATCH)
+        changed.discard(aModelClass._meta.pk.attname)
+        if updated and changed:
+            aModelClass._default_manager.bulk_update(updated, list(changed), batch_size=API_BULK_BATCH)
+        send_rows_changed(aModelClass, [obj.pk for obj in created + updated])
+
+    return [result(i, status, obj.pk) for i, status, obj in results]
+
+def bulk_delete_rows(aModelClass, ids):
+    check_rows(ids)
+    pk_field = aModelClass._meta.pk
+    try:
+        ids = [pk_field.to_python(pk) for pk in ids]
+    except ValidationError as e:
+        raise BulkError(' '.join(e.messages))
+
+    with transaction.atomic():
+        found = set()
+        for _, chunk in batches(ids):
+            found.update(aModelClass._default_manager.select_for_update().filter(pk__in=chunk).values_list('pk', flat=True))
+        errors = {i: (STATUS_NOT_FOUND, None) for i, pk in enumerate(ids) if pk not in found}
+        if errors:
+            raise rejected(len(ids), errors, status=404)
+
+        for _, chunk in batches(ids):
+            aModelClass._default_manager.filter(pk__in=chunk).delete()
+        send_rows_changed(aModelClass, ids)
+    return [result(i, STATUS_DELETED, pk) for i, pk in enumerate(ids)]
+
+def upsert_key(slug, data):
+    """The natural key of an upsert: the request's "key", else the slug's 'natural_key' option."""
+    return data.get('key') or api_option(slug, 'natural_key')
@@ -0,0 +1,133 @@
+# -*- encoding: utf-8 -*-
+"""
+Copyright (c) 2019 - present AppSeed.us
+
+Server cache and conditional GETs of DynamicAPI reads.
+
+A rendered JSON response is stored in the DYNAMIC_API_CACHE cache under
+the slug, the id, the query and the data version of the model
+(apps.common.versions, bumped on commit by post_save / post_delete and by
+bulk writes),
+so a write makes every stored page of the model unreachable. The ETag is
+the md5 of the bytes (strong), If-None-Match / If-Modified-Since are
+answered with 304. Streams, errors and the browsable API are not cached.
+"""
+
+import hashlib, json, time
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from apps.common.versions import data_version
+from .listing import api_option
+
+API_CACHE_TTL   = getattr(settings, 'DYNAMIC_API_CACHE_TTL', 60)  # 0 disables
+API_CACHE_ALIAS = getattr(settings, 'DYNAMIC_API_CACHE'    , 'default')
+
+STAT_HIT          = 'hit'
+STAT_MISS         = 'miss'
+STAT_NOT_MODIFIED = 'not_modified'
+STATS             = (STAT_HIT, STAT_MISS, STAT_NOT_MODIFIED)
+
+def cacheable(slug, request):
+    return API_CACHE_TTL and api_option(slug, 'cache', True) and request.accepted_renderer.format == 'json'
+
+def response_key(slug, aModelClass, model_id, query, media_type):
+    payload = [slug, model_id, sorted(query.lists()), media_type, data_version(aModelClass)]
+    return 'dyn_api:response:' + hashlib.md5(json.dumps(payload, default=str).encode()).hexdigest()
+
+def stat_key(slug, name):
+    return f'dyn_api:stats:{slug}:{name}'
+
+def count(slug, name):
+    key = stat_key(slug, name)
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+def cache_stats(slugs):
+    """{slug: {'hit': n, 'miss': n, 'not_modified': n}}, counted by the cache of this process
+    unless the default cache is shared."""
+    keys = {stat_key(slug, name): (slug, name) for slug in slugs for name in STATS}
+    values = cache.get_many(list(keys))
+    stats = {slug: dict.fromkeys(STATS, 0) for slug in slugs}
+    for key, (slug, name) in keys.items():
+        stats[slug][name] = values.get(key, 0)
+    return stats
+
+def new_entry(content, content_type):
+    return ('"' + hashlib.md5(content).hexdigest() + '"', int(time.time()), content, content_type)
+
+def cached_response(entry, request, status):
+    """The stored response, or a 304 when the client's copy is current."""
+    etag, last_modified, content, content_type = entry
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = HttpResponse(content, content_type=content_type)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['X-Cache'] = status
+    patch_cache_control(response, no_cache=True)
+    return response
+
+def cached_get(view, request, slug, aModelClass, model_id, read):
+    """Answers a GET from the cache, or with read() (a DRF Response) which is stored when it's a 200."""
+    if not cacheable(slug, request):
+        return read()
+
+    store = caches[API_CACHE_ALIAS]
+    # The version is read before the rows: a write in between leaves a stale key, never stale bytes under a new one
+    key = response_key(slug, aModelClass, model_id, request.query_params, request.accepted_media_type)
+    entry = store.get(key)
+    if entry is not None:
+        response = cached_response(entry, request, 'HIT')
+        count(slug, STAT_NOT_MODIFIED if response.status_code == 304 else STAT_HIT)
+        return response
+
+    count(slug, STAT_MISS)
+    response = read()
+    if response.status_code != 200 or response.streaming:
+        return response
+
+    response.accepted_renderer = request.accepted_renderer
+    response.accepted_media_type = request.accepted_media_type
+    response.renderer_context = view.get_renderer_context()
+    response.render()
+
+    entry = new_entry(response.content, response['Content-Type'])
+    store.set(key, entry, API_CACHE_TTL)
+    return cached_response(entry, request, 'MISS')
+
+def in_thread(function):
+    # Cache calls don't touch the database connection, any worker thread can run them
+    # (cache.aget() & co. queue behind the ORM on the one thread-sensitive thread)
+    return sync_to_async(function, thread_sensitive=False)
+
+async def acached_get(request, slug, aModelClass, model_id, read):
+    """cached_get() of the async views: read() is a coroutine returning the JSON HttpResponse."""
+    if not (API_CACHE_TTL and api_option(slug, 'cache', True)):
+        return await read()
+
+    store = caches[API_CACHE_ALIAS]
+    key = await in_thread(response_key)(slug, aModelClass, model_id, request.GET, 'application/json')
+    entry = await in_thread(store.get)(key)
+    if entry is not None:
+        response = cached_response(entry, request, 'HIT')
+        await in_thread(count)(slug, STAT_NOT_MODIFIED if response.status_code == 304 else STAT_HIT)
+        return response
+
+    await in_thread(count)(slug, STAT_MISS)
+    response = await read()
+    if response.status_code != 200 or response.streaming:
+        return response
+
+    entry = new_entry(response.content, response['Content-Type'])
+    await in_thread(store.set)(key, entry, API_CACHE_TTL)
+    return cached_response(entry, request, 'MISS')
@@ -5,13 +5,15 @@ Copyright (c) 2019 - present AppSeed.us
 
 import datetime, sys, inspect, importlib
 
-from functools import wraps
+from functools import wraps, lru_cache
 
 from django.db import models
 from django.http import HttpResponseRedirect, HttpResponse
 
 from rest_framework import serializers
 
+from .serializers import serializer_class
+
 class Utils:
     @staticmethod
     def get_class(config, name: str) -> models.Model:
@@ -23,14 +25,11 @@ class Utils:
 
     @staticmethod
     def get_serializer(config, name: str):
-        class Serializer(serializers.ModelSerializer):
-            class Meta:
-                model = Utils.get_class(config, name)
-                fields = '__all__'
-
-        return Serializer
+        # Built once per model, see serializers.py
+        return serializer_class(Utils.get_class(config, name))
 
     @staticmethod
+    @lru_cache(maxsize=None)
     def model_name_to_class(name: str):
 
         model_name    = name.split('.')[-1]
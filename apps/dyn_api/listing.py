@@ -0,0 +1,195 @@
+# -*- encoding: utf-8 -*-
+"""
+Copyright (c) 2019 - present AppSeed.us
+
+Pagination, sparse fieldsets, filtering and ordering of DynamicAPI lists.
+
+  ?limit=&offset=        page by offset (default: the first page)
+  ?cursor=               seek pagination: start with an empty cursor, follow `next`
+  ?fields=a,b            only these keys in every row
+  ?ordering=-name        one column, the primary key breaks the ties
+  ?<field>[__lookup]=    exact, in (a,b), gt, gte, lt, lte, isnull, startswith
+
+Only indexed columns can be filtered and ordered on unless the slug's
+DYNAMIC_API_OPTIONS say otherwise ('filter_fields', 'order_fields'), and
+no page is larger than 'max_page_size'.
+"""
+
+import base64, json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+from apps.common.fields import is_indexed, is_text
+from .serializers import row_spec, page_rows, apage_rows
+
+API_PAGE_SIZE     = getattr(settings, 'DYNAMIC_API_PAGE_SIZE'    , 50)
+API_MAX_PAGE_SIZE = getattr(settings, 'DYNAMIC_API_MAX_PAGE_SIZE', 500)
+
+RESERVED_PARAMS = ('limit', 'offset', 'cursor', 'fields', 'ordering', 'format', 'stream')
+FILTER_LOOKUPS  = ('exact', 'in', 'gt', 'gte', 'lt', 'lte', 'isnull', 'startswith')
+
+class ListError(ValueError):
+    pass
+
+def api_option(slug, name, default=None):
+    """Reads a per-slug option from settings.DYNAMIC_API_OPTIONS."""
+    options = getattr(settings, 'DYNAMIC_API_OPTIONS', {}).get(slug, {})
+    return options.get(name, default)
+
+def allowed_fields(slug, aModelClass, option):
+    names = api_option(slug, option)
+    return {
+        field.name: field for field in aModelClass._meta.concrete_fields
+        if (field.name in names if names is not None else is_indexed(field))
+    }
+
+def max_page_size(slug):
+    return min(api_option(slug, 'max_page_size', API_MAX_PAGE_SIZE), API_MAX_PAGE_SIZE)
+
+def to_int(query, name, default):
+    try:
+        value = int(query.get(name, default))
+    except ValueError:
+        raise ListError(name + ' must be an integer')
+    if value < 0:
+        raise ListError(name + ' must be positive')
+    return value
+
+def clean_value(field, value):
+    target = field.target_field if field.is_relation else field
+    try:
+        return target.to_python(value)
+    except ValidationError as e:
+        raise ListError(f'{field.name}: ' + ' '.join(e.messages))
+
+def filter_lookup(field, lookup, value):
+    name = field.attname
+    if lookup == 'isnull':
+        if value.lower() not in ('true', 'false', '1', '0'):
+            raise ListError(f'{field.name}__isnull: expected true or false')
+        return {f'{name}__isnull': value.lower() in ('true', '1')}
+    if lookup == 'in':
+        return {f'{name}__in': [clean_value(field, v.strip()) for v in value.split(',') if v.strip()]}
+    if lookup == 'startswith':
+        if not is_text(field):
+            raise ListError(f'{field.name}__startswith: text columns only')
+        return {f'{name}__startswith': value}
+    return {f'{name}__{lookup}': clean_value(field, value)}
+
+def encode_cursor(value, pk):
+    payload = json.dumps([value, pk], cls=DjangoJSONEncoder)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, order_field, pk_field):
+    try:
+        value, pk = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return order_field.to_python(value), pk_field.to_python(pk)
+    except (ValueError, TypeError, ValidationError):
+        raise ListError('Invalid cursor')
+
+def list_params(slug, aModelClass, query):
+    """Parses the list parameters of `query` (a QueryDict), raises ListError."""
+    spec = row_spec(aModelClass)
+    pk_field = aModelClass._meta.pk
+
+    limit = to_int(query, 'limit', min(API_PAGE_SIZE, max_page_size(slug)))
+    if not 0 < limit <= max_page_size(slug):
+        raise ListError(f'limit must be between 1 and {max_page_size(slug)}')
+    offset = to_int(query, 'offset', 0)
+
+    names = None
+    if query.get('fields'):
+        names = [n.strip() for n in query.get('fields').split(',') if n.strip()]
+        unknown = set(names) - {name for name, _, _ in spec.fields}
+        if unknown or not names:
+            raise ListError('Unknown fields: ' + ', '.join(sorted(unknown)))
+
+    ordering = query.get('ordering', pk_field.name)
+    order_fields = dict(allowed_fields(slug, aModelClass, 'order_fields'), **{pk_field.name: pk_field})
+    order_field = order_fields.get(ordering.lstrip('-'))
+    if order_field is None:
+        raise ListError('Ordering is allowed on: ' + ', '.join(sorted(order_fields)))
+    if 'cursor' in query and order_field.null:
+        raise ListError('Cursor pagination needs a non-null ordering column')
+
+    lookups = {}
+    filter_fields = allowed_fields(slug, aModelClass, 'filter_fields')
+    for key, values in query.lists():
+        if key in RESERVED_PARAMS:
+            continue
+        name, _, lookup = key.partition('__')
+        field = filter_fields.get(name)
+        if field is None or (lookup or 'exact') not in FILTER_LOOKUPS:
+            raise ListError(f'Filtering is not allowed on {key} (fields: {", ".join(sorted(filter_fields))})')
+        lookups.update(filter_lookup(field, lookup or 'exact', values[-1]))
+
+    cursor = decode_cursor(query['cursor'], order_field, pk_field) if query.get('cursor') else None
+    return {
+        'limit'      : limit,
+        'offset'     : offset,
+        'seek'       : 'cursor' in query,
+        'cursor'     : cursor,
+        'fields'     : names,
+        'descending' : ordering.startswith('-'),
+        'order_field': order_field,
+        'lookups'    : lookups,
+    }
+
+def list_queryset(queryset, params):
+    """The filtered and ordered rows, before pagination."""
+    order, desc = params['order_field'], params['descending']
+    pk_name = queryset.model._meta.pk.attname
+    queryset = queryset.filter(**params['lookups'])
+
+    if params['cursor'] is not None:
+        value, pk = params['cursor']
+        op = 'lt' if desc else 'gt'
+        if order.primary_key:
+            queryset = queryset.filter(**{f'pk__{op}': pk})
+        else:
+            queryset = queryset.filter(Q(**{f'{order.attname}__{op}': value}) | Q(**{order.attname: value, f'pk__{op}': pk}))
+
+    prefix = '-' if desc else ''
+    return queryset.order_by(*dict.fromkeys([prefix + order.attname, prefix + pk_name]))
+
+def page_window(queryset, params):
+    """The sliced queryset of a page (one row more, it tells if there's a next page), its start and its key columns."""
+    start = 0 if params['seek'] else params['offset']
+    keys = [params['order_field'].attname, queryset.model._meta.pk.attname]
+    return list_queryset(queryset, params)[start:start + params['limit'] + 1], start, keys
+
+def page_links(request, params, window, start, key_columns):
+    """Returns (rows, next_url, previous_url) of the fetched window, (rows, keys) of page_rows()."""
+    rows, keys = window
+    limit = params['limit']
+    more = len(rows) > limit
+    rows, keys = rows[:limit], keys[:limit]
+
+    url = request.build_absolute_uri()
+    next_url = previous_url = None
+    if params['seek']:
+        if more:
+            last = keys[-1]
+            next_url = replace_query_param(url, 'cursor', encode_cursor(*[last[column] for column in key_columns]))
+    else:
+        if more:
+            next_url = replace_query_param(url, 'offset', start + limit)
+        if start:
+            previous = max(start - limit, 0)
+            previous_url = replace_query_param(url, 'offset', previous) if previous else remove_query_param(url, 'offset')
+    return rows, next_url, previous_url
+
+def list_page(request, queryset, params):
+    """Returns (rows, next_url, previous_url) of one page."""
+    window, start, keys = page_window(queryset, params)
+    return page_links(request, params, page_rows(window, params['fields'], keys), start, keys)
+
+async def alist_page(request, queryset, params):
+    """list_page() with the async ORM."""
+    window, start, keys = page_window(queryset, params)
+    return page_links(request, params, await apage_rows(window, params['fields'], keys), start, keys)
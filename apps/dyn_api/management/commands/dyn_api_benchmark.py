@@ -0,0 +1,185 @@
+import statistics, time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import RequestFactory, override_settings
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+
+from apps.dyn_api import views
+from apps.dyn_api.bulk import bulk_write_rows
+from apps.dyn_api.helpers import Utils
+from apps.dyn_api.serializers import serialize_rows
+from apps.common.testing import seed_rows
+
+
+class Rollback(Exception):
+    """Raised to discard the rows seeded by a benchmark run."""
+
+
+def status_kb(name):
+    # Linux only, None elsewhere
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith(name + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def reset_peak_rss():
+    """Resets VmHWM (peak RSS) to the current RSS, returns the RSS in KB."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        return None
+    return status_kb('VmRSS')
+
+
+def legacy_rows(queryset):
+    # The list path before compiled serializers: a class per call, an instance per row
+    class Serializer(serializers.ModelSerializer):
+        class Meta:
+            model = queryset.model
+            fields = '__all__'
+
+    return [Serializer(instance=obj).data for obj in queryset]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark DynamicAPI reads against seeded tables (seeded rows are rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--slug', default='product', help='DYNAMIC_API slug to benchmark')
+        parser.add_argument('--rows', default='1000,10000', help='Comma separated row counts')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement')
+        parser.add_argument('--scenario', default='serialize', choices=['serialize', 'stream', 'bulk', 'cache'], help='What to measure')
+
+    def handle(self, *args, **options):
+        slug = options['slug']
+        if slug not in settings.DYNAMIC_API.keys():
+            raise CommandError('Unknown DYNAMIC_API slug: ' + slug)
+
+        self.aModelClass = Utils.get_class(settings.DYNAMIC_API, slug)
+        row_counts = [int(r) for r in options['rows'].split(',')]
+
+        try:
+            with transaction.atomic():
+                seeded = 0
+                for count in row_counts:
+                    seed_rows(self.aModelClass, count - seeded)
+                    seeded = count
+                    getattr(self, 'bench_' + options['scenario'])(slug, count, options['repeat'])
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def rows_per_second(self, serialize, count, repeat):
+        timings = []
+        for _ in range(repeat):
+            queryset = self.aModelClass.objects.all()
+            start = time.perf_counter()
+            rows = serialize(queryset)
+            timings.append(time.perf_counter() - start)
+            assert len(rows) == count
+        return count / statistics.median(timings)
+
+    def bench_serialize(self, slug, count, repeat):
+        before = self.rows_per_second(legacy_rows, count, repeat)
+        after  = self.rows_per_second(serialize_rows, count, repeat)
+        self.stdout.write(
+            f'serialize rows={count:>9} per-row ModelSerializer={before:10.0f} rows/s '
+            f'compiled={after:10.0f} rows/s x{after / before:5.1f}'
+        )
+
+    def measure(self, respond):
+        """(time to first byte, total time, peak RSS growth in KB) of one response."""
+        base = reset_peak_rss()
+        start = time.perf_counter()
+        first = None
+        for _ in respond():
+            if first is None:
+                first = time.perf_counter() - start
+        total = time.perf_counter() - start
+        peak = status_kb('VmHWM')
+        return first * 1000, total * 1000, (peak - base) if base is not None and peak is not None else None
+
+    def bench_stream(self, slug, count, repeat):
+        # The whole table: rendered in one document (the list path before
+        # pagination) against the NDJSON stream of the same rows
+        factory = RequestFactory()
+
+        def buffered():
+            yield JSONRenderer().render({'data': legacy_rows(self.aModelClass.objects.all()), 'success': True})
+
+        def streamed():
+            request = factory.get('/api/' + slug + '/', HTTP_ACCEPT='application/x-ndjson')
+            return views.DynamicAPI.as_view()(request, model_name=slug).streaming_content
+
+        # Streamed first: freed memory of the buffered run would hide its growth
+        for label, respond in (('ndjson', streamed), ('buffered', buffered)):
+            runs = [self.measure(respond) for _ in range(repeat)]
+            first = statistics.median(r[0] for r in runs)
+            total = statistics.median(r[1] for r in runs)
+            peak = max(r[2] for r in runs) if runs[0][2] is not None else None
+            peak = f'{peak / 1024:8.1f}MB' if peak is not None else '     n/a'
+            self.stdout.write(f'stream {label:<8} rows={count:>9} ttfb={first:9.2f}ms total={total:9.2f}ms peak rss +{peak}')
+
+    def bench_bulk(self, slug, count, repeat):
+        # Updating every row: one validated save() per row (the PUT path) against bulk_write_rows()
+        cls = Utils.get_serializer(settings.DYNAMIC_API, slug)
+        ids = list(self.aModelClass.objects.values_list('pk', flat=True))
+
+        def per_row(value):
+            for pk in ids:
+                serializer = cls(instance=self.aModelClass.objects.get(pk=pk), data={'info': value}, partial=True)
+                serializer.is_valid(raise_exception=True)
+                serializer.save()
+
+        def bulk(value):
+            bulk_write_rows(self.aModelClass, [{'id': pk, 'info': value} for pk in ids], 'id', create=False)
+
+        timings = {}
+        for label, write in (('per-row', per_row), ('bulk', bulk)):
+            runs = []
+            for i in range(repeat):
+                start = time.perf_counter()
+                write(f'{label}-{i}')
+                runs.append(time.perf_counter() - start)
+            timings[label] = count / statistics.median(runs)
+        self.stdout.write(
+            f'bulk rows={count:>9} per-row PUT={timings["per-row"]:10.0f} rows/s '
+            f'bulk={timings["bulk"]:10.0f} rows/s x{timings["bulk"] / timings["per-row"]:5.1f}'
+        )
+
+    def bench_cache(self, slug, count, repeat):
+        # A dashboard poll of one page: uncached, answered from the cache, answered with 304
+        factory = RequestFactory()
+        view = views.DynamicAPI.as_view()
+        polls = 200
+
+        def poll(**headers):
+            return view(factory.get('/api/' + slug + '/', {'limit': 100}, **headers), model_name=slug)
+
+        def per_second(**headers):
+            runs = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                for _ in range(polls):
+                    poll(**headers)
+                runs.append(time.perf_counter() - start)
+            return polls / statistics.median(runs)
+
+        options = dict(getattr(settings, 'DYNAMIC_API_OPTIONS', {}))
+        with override_settings(DYNAMIC_API_OPTIONS=dict(options, **{slug: dict(options.get(slug, {}), cache=False)})):
+            uncached = per_second()
+        etag = poll()['ETag']
+        cached = per_second()
+        not_modified = per_second(HTTP_IF_NONE_MATCH=etag)
+        self.stdout.write(
+            f'cache rows={count:>9} uncached={uncached:8.0f} req/s cached={cached:8.0f} req/s '
+            f'304={not_modified:8.0f} req/s'
+        )
@@ -0,0 +1,184 @@
+import asyncio, os, random, shutil, socket, statistics, subprocess, sys, tempfile, time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+SERVERS = {
+    # one process each: gunicorn-cfg.py (sync worker) and gunicorn-asgi-cfg.py (uvicorn worker)
+    'wsgi': ('gunicorn-cfg.py', 'config.wsgi'),
+    'asgi': ('gunicorn-asgi-cfg.py', 'config.asgi'),
+}
+
+SEED = (
+    'from django.conf import settings\n'
+    'from apps.dyn_api.helpers import Utils\n'
+    'from apps.common.testing import seed_rows\n'
+    'seed_rows(Utils.get_class(settings.DYNAMIC_API, {slug!r}), {rows})\n'
+)
+
+
+async def fetch(conn, host, path):
+    """One GET on a keep-alive connection; returns (status, conn), conn is None once the server closed it."""
+    if conn is None:
+        conn = await asyncio.open_connection(*host)
+    reader, writer = conn
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: {host[0]}\r\nAccept: application/json\r\n\r\n'.encode())
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    length, chunked, close = None, False, False
+    while True:
+        line = (await reader.readline()).strip().lower()
+        if not line:
+            break
+        name, _, value = line.partition(b':')
+        value = value.strip()
+        if name == b'content-length':
+            length = int(value)
+        elif name == b'transfer-encoding':
+            chunked = value == b'chunked'
+        elif name == b'connection':
+            close = value == b'close'
+
+    if chunked:
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    elif length is not None:
+        await reader.readexactly(length)
+    else:
+        await reader.read()
+        close = True
+
+    if close:
+        writer.close()
+        conn = None
+    return status, conn
+
+
+async def client(host, paths, deadline, latencies, errors):
+    conn = None
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            status, conn = await fetch(conn, host, random.choice(paths))
+        except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+            errors.append(None)
+            conn = None
+            continue
+        latencies.append(time.perf_counter() - start)
+        if status != 200:
+            errors.append(status)
+    if conn is not None:
+        conn[1].close()
+
+
+async def load(host, paths, clients, duration, slow_paths, slow_clients):
+    """Runs `clients` clients on `paths` (and `slow_clients` on `slow_paths`) for `duration` seconds."""
+    latencies, errors, slow = [], [], []
+    deadline = time.perf_counter() + duration
+    tasks = [client(host, paths, deadline, latencies, errors) for _ in range(clients)]
+    tasks += [client(host, slow_paths, deadline, slow, errors) for _ in range(slow_clients)]
+    await asyncio.gather(*tasks)
+    return latencies, errors, slow
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = 'Load test DynamicAPI reads: WSGI (sync gunicorn) against ASGI (uvicorn), one worker each'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--slug', default='product', help='DYNAMIC_API slug to read')
+        parser.add_argument('--servers', default='wsgi,asgi', help='Comma separated: wsgi, asgi')
+        parser.add_argument('--clients', type=int, default=200, help='Concurrent clients reading pages')
+        parser.add_argument('--slow-clients', type=int, default=0, help='Concurrent clients streaming the whole table')
+        parser.add_argument('--duration', type=float, default=15, help='Seconds of load per server')
+        parser.add_argument('--warmup', type=float, default=2, help='Seconds of load before measuring')
+        parser.add_argument('--rows', type=int, default=10000, help='Rows seeded in the temporary sqlite database')
+        parser.add_argument('--limit', type=int, default=50, help='Page size of the reads')
+        parser.add_argument('--cache', action='store_true', help='Keep the DynamicAPI response cache (off: every read hits the database)')
+
+    def handle(self, *args, **options):
+        slug = options['slug']
+        if slug not in settings.DYNAMIC_API.keys():
+            raise CommandError('Unknown DYNAMIC_API slug: ' + slug)
+
+        workdir = tempfile.mkdtemp(prefix='dyn_api_loadtest_')
+        env = dict(os.environ, PYTHONPATH=str(settings.BASE_DIR), DJANGO_SETTINGS_MODULE='config.settings')
+        env.setdefault('DYNAMIC_API_CACHE_TTL', '60' if options['cache'] else '0')
+        env.pop('DYNAMIC_API_ASYNC', None)
+        try:
+            self.prepare(workdir, env, slug, options['rows'])
+            results = {name: self.run_server(name, workdir, env, slug, options) for name in options['servers'].split(',')}
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        self.stdout.write(f'\n{options["clients"]} clients, {options["slow_clients"]} streaming, {options["duration"]:.0f}s, '
+                          f'{options["rows"]} rows, limit={options["limit"]}, cache={"on" if options["cache"] else "off"}')
+        for name, (rps, p50, p99, errors, streams) in results.items():
+            line = f'{name:<5} {rps:8.0f} req/s  p50={p50:8.1f}ms  p99={p99:8.1f}ms  errors={errors}'
+            if options['slow_clients']:
+                line += f'  streams={streams}'
+            self.stdout.write(line)
+
+    def manage(self, workdir, env, *args):
+        done = subprocess.run([sys.executable, str(settings.BASE_DIR / 'manage.py'), *args], cwd=workdir, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if done.returncode:
+            raise CommandError(f'manage.py {args[0]} failed:\n{done.stderr}')
+
+    def prepare(self, workdir, env, slug, rows):
+        # The sqlite database is db.sqlite3 of the working directory: a fresh one in workdir.
+        # Another engine (DB_ENGINE) is used as it is, seeded by the operator.
+        if settings.DATABASES['default']['ENGINE'] != 'django.db.backends.sqlite3':
+            self.stdout.write('Non sqlite database: reading the rows it has')
+            return
+        self.stdout.write(f'Seeding {rows} rows in {workdir}/db.sqlite3')
+        self.manage(workdir, env, 'migrate', '--noinput')
+        self.manage(workdir, env, 'shell', '-c', SEED.format(slug=slug, rows=rows))
+
+    def run_server(self, name, workdir, env, slug, options):
+        config, app = SERVERS[name]
+        port = free_port()
+        command = ['gunicorn', '--config', str(settings.BASE_DIR / config), '--bind', f'127.0.0.1:{port}',
+                   '--log-level', 'warning', '--access-logfile', '/dev/null', '--backlog', '2048', app]
+        server = subprocess.Popen(command, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            host = ('127.0.0.1', port)
+            self.wait_ready(server, host, name)
+
+            limit = options['limit']
+            paths = [f'/api/{slug}/?limit={limit}&offset={offset}' for offset in range(0, options['rows'], limit)] or [f'/api/{slug}/']
+            slow_paths = [f'/api/{slug}/?stream=1']
+            self.stdout.write(f'{name}: {" ".join(command)}')
+
+            asyncio.run(load(host, paths, options['clients'], options['warmup'], slow_paths, options['slow_clients']))
+            latencies, errors, slow = asyncio.run(load(host, paths, options['clients'], options['duration'], slow_paths, options['slow_clients']))
+        finally:
+            server.terminate()
+            server.wait(30)
+
+        if not latencies:
+            raise CommandError(f'{name}: no response')
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        return len(latencies) / options['duration'], statistics.median(latencies) * 1000, p99 * 1000, len(errors), len(slow)
+
+    def wait_ready(self, server, host, name):
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'{name}: the server exited ({server.returncode}), is its worker installed?')
+            try:
+                socket.create_connection(host, timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError(f'{name}: the server did not start')
@@ -0,0 +1,218 @@
+# -*- encoding: utf-8 -*-
+"""
+Copyright (c) 2019 - present AppSeed.us
+
+The DYNAMIC_API models, resolved and validated once at startup.
+
+build_registry() (called by DynApiConfig.ready) imports every entry,
+checks it and the DYNAMIC_API_OPTIONS that refer to it, and raises
+ImproperlyConfigured listing every problem, so a bad slug stops the boot
+instead of failing its requests. ApiMeta holds what the views use per
+request: the model, its serializer and compiled rows, and the JSON schema
+of a row, from which openapi_document() describes the whole API.
+"""
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+
+from rest_framework.schemas.openapi import AutoSchema
+
+from .bulk import BulkError, natural_key
+from .helpers import Utils
+from .listing import FILTER_LOOKUPS, allowed_fields, max_page_size
+from .serializers import serializer_class, row_spec
+
+API_OPTIONS = ('max_page_size', 'filter_fields', 'order_fields', 'natural_key', 'cache')
+
+_registry = {}
+
+class ApiMeta:
+    """What the views need of a DYNAMIC_API slug, built once."""
+
+    def __init__(self, slug, aModelClass):
+        self.slug       = slug
+        self.model      = aModelClass
+        self.serializer = serializer_class(aModelClass)
+        self.rows       = row_spec(aModelClass)
+        self.pk         = aModelClass._meta.pk
+        self.schema     = AutoSchema().map_serializer(self.serializer())
+
+def resolve(slug, aModelName):
+    """The model class of a DYNAMIC_API entry, raises ImproperlyConfigured."""
+    try:
+        aModelClass = Utils.model_name_to_class(aModelName)
+    except (ImportError, AttributeError, ValueError) as e:
+        raise ImproperlyConfigured(f'{slug}: cannot import {aModelName!r} ({e})')
+
+    if not isinstance(aModelClass, type) or not issubclass(aModelClass, models.Model):
+        raise ImproperlyConfigured(f'{slug}: {aModelName!r} is not a Django model')
+    if aModelClass._meta.abstract or aModelClass._meta.app_config is None:
+        raise ImproperlyConfigured(f'{slug}: {aModelName!r} is abstract or not in an installed app')
+    if not apps.is_installed(aModelClass._meta.app_config.name):
+        raise ImproperlyConfigured(f'{slug}: the app of {aModelName!r} is not installed')
+    return aModelClass
+
+def option_errors(slug, aModelClass, options):
+    errors = [f'{slug}: unknown option {name!r}' for name in options if name not in API_OPTIONS]
+
+    size = options.get('max_page_size')
+    if size is not None and (not isinstance(size, int) or size < 1):
+        errors.append(f'{slug}: max_page_size must be a positive integer')
+
+    columns = {field.name for field in aModelClass._meta.concrete_fields}
+    for name in ('filter_fields', 'order_fields'):
+        unknown = set(options.get(name) or ()) - columns
+        if unknown:
+            errors.append(f'{slug}: {name} has unknown fields ' + ', '.join(sorted(unknown)))
+
+    if options.get('natural_key'):
+        try:
+            natural_key(aModelClass, options['natural_key'])
+        except BulkError as e:
+            errors.append(f'{slug}: natural_key: {e}')
+    return errors
+
+def validate(config, options):
+    """({slug: ApiMeta}, [errors]) of a DYNAMIC_API / DYNAMIC_API_OPTIONS pair."""
+    metas, errors = {}, []
+    for slug, aModelName in config.items():
+        if not slug or '/' in slug:
+            errors.append(f'{slug!r}: a slug is one URL segment')
+            continue
+        try:
+            aModelClass = resolve(slug, aModelName)
+        except ImproperlyConfigured as e:
+            errors.append(str(e))
+            continue
+        errors += option_errors(slug, aModelClass, options.get(slug, {}))
+        metas[slug] = ApiMeta(slug, aModelClass)
+
+    errors += [f'DYNAMIC_API_OPTIONS: unknown slug {slug!r}' for slug in options if slug not in config]
+    return metas, errors
+
+def build_registry():
+    metas, errors = validate(getattr(settings, 'DYNAMIC_API', {}), getattr(settings, 'DYNAMIC_API_OPTIONS', {}))
+    if errors:
+        raise ImproperlyConfigured('DYNAMIC_API is misconfigured:\n  ' + '\n  '.join(errors))
+    _registry.clear()
+    _registry.update(metas)
+
+def api_meta(slug):
+    """The ApiMeta of a DYNAMIC_API slug, raises KeyError for unknown slugs (like Utils.get_class)."""
+    return _registry[slug]
+
+def api_model(slug):
+    return api_meta(slug).model
+
+def metas():
+    return list(_registry.values())
+
+# OpenAPI
+
+def ref(meta):
+    return {'$ref': f'#/components/schemas/{meta.slug}'}
+
+def envelope(data, **extra):
+    properties = {'data': data, **extra, 'success': {'type': 'boolean'}}
+    return {'application/json': {'schema': {'type': 'object', 'properties': properties}}}
+
+def error_response(description):
+    schema = {'type': 'object', 'properties': {'message': {'type': 'string'}, 'success': {'type': 'boolean'}}}
+    return {'description': description, 'content': {'application/json': {'schema': schema}}}
+
+def list_parameters(meta):
+    pk = meta.pk.name
+    orderings = sorted(set(allowed_fields(meta.slug, meta.model, 'order_fields')) | {pk})
+    parameters = [
+        {'name': 'limit', 'in': 'query', 'schema': {'type': 'integer', 'minimum': 1, 'maximum': max_page_size(meta.slug)}},
+        {'name': 'offset', 'in': 'query', 'schema': {'type': 'integer', 'minimum': 0}},
+        {'name': 'cursor', 'in': 'query', 'description': 'Seek pagination: empty to start, then follow `next`', 'schema': {'type': 'string'}},
+        {'name': 'fields', 'in': 'query', 'description': 'Comma separated keys of the rows', 'schema': {'type': 'string'}},
+        {'name': 'ordering', 'in': 'query', 'schema': {'type': 'string', 'enum': orderings + ['-' + name for name in orderings]}},
+        {'name': 'stream', 'in': 'query', 'description': 'Every row as one streamed JSON array (NDJSON with Accept: application/x-ndjson)',
+         'schema': {'type': 'boolean'}},
+    ]
+    for name, field in sorted(allowed_fields(meta.slug, meta.model, 'filter_fields').items()):
+        schema = meta.schema['properties'].get(name, {'type': 'string'})
+        for lookup in FILTER_LOOKUPS:
+            if lookup == 'startswith' and not isinstance(field, (models.CharField, models.TextField)):
+                continue
+            if lookup == 'isnull':
+                value = {'type': 'boolean'}
+            elif lookup == 'in':
+                value = {'type': 'string', 'description': 'comma separated'}
+            else:
+                value = {k: v for k, v in schema.items() if k in ('type', 'format', 'enum')}
+            parameters.append({'name': name if lookup == 'exact' else f'{name}__{lookup}', 'in': 'query', 'schema': value})
+    return parameters
+
+def bulk_operation(operation_id, tag, body, failure, description):
+    item = {'type': 'object', 'properties': {
+        'index': {'type': 'integer'}, 'status': {'type': 'string'}, 'id': {}, 'errors': {'type': 'object'},
+    }}
+    results = {'application/json': {'schema': {'type': 'object', 'properties': {
+        'results': {'type': 'array', 'items': item}, 'message': {'type': 'string'}, 'success': {'type': 'boolean'},
+    }}}}
+    return {'tags': tag, 'operationId': operation_id, 'description': description, 'requestBody': body, 'responses': {
+        '200': {'description': 'Every item written', 'content': results},
+        str(failure): {'description': 'Nothing written, see the items', 'content': results},
+        '409': error_response('Conflict with existing rows, nothing written'),
+    }}
+
+def paths_of(meta):
+    row, tag = ref(meta), [meta.slug]
+    rows = {'type': 'array', 'items': row}
+    written = {'200': error_response('Done'),
+               '400': error_response('Invalid input')}
+    id_parameter = [{'name': 'id', 'in': 'path', 'required': True, 'schema': {'type': 'integer', 'minimum': 0}}]
+    ids_body = {'content': {'application/json': {'schema': {'type': 'array', 'items': {'type': 'integer'}}}}}
+    bulk_body = {'content': {'application/json': {'schema': {'oneOf': [rows, {'type': 'object', 'properties': {
+        'rows': rows, 'key': {'type': 'array', 'items': {'type': 'string'}}}}]}}}}
+
+    return {
+        f'/api/{meta.slug}/': {
+            'get': {'tags': tag, 'operationId': f'list_{meta.slug}', 'parameters': list_parameters(meta), 'responses': {
+                '200': {'description': 'One page', 'content': envelope(rows, next={'type': 'string', 'nullable': True},
+                                                                      previous={'type': 'string', 'nullable': True})},
+                '400': error_response('Invalid parameters'),
+            }},
+            'post': {'tags': tag, 'operationId': f'create_{meta.slug}', 'responses': written,
+                     'requestBody': {'content': {'application/json': {'schema': row}}}},
+        },
+        f'/api/{meta.slug}/{{id}}/': {
+            'parameters': id_parameter,
+            'get': {'tags': tag, 'operationId': f'retrieve_{meta.slug}', 'responses': {
+                '200': {'description': 'The row', 'content': envelope(row)},
+                '404': error_response('Not found'),
+            }},
+            'put': {'tags': tag, 'operationId': f'update_{meta.slug}', 'responses': dict(written, **{'404': error_response('Not found')}),
+                    'requestBody': {'content': {'application/json': {'schema': row}}}},
+            'delete': {'tags': tag, 'operationId': f'delete_{meta.slug}', 'responses': {
+                '200': written['200'], '404': error_response('Not found'),
+            }},
+        },
+        f'/api/{meta.slug}/bulk/': {
+            'post': bulk_operation(f'bulk_create_{meta.slug}', tag, bulk_body, 400,
+                                   'Creates the rows, upserts them on a natural key ("key" or the natural_key option)'),
+            'put': bulk_operation(f'bulk_update_{meta.slug}', tag, bulk_body, 404, 'Updates the rows, matched by id or "key"'),
+            'delete': bulk_operation(f'bulk_delete_{meta.slug}', tag, ids_body, 404, 'Deletes the rows of the ids'),
+        },
+    }
+
+def openapi_document(server_url=None):
+    """OpenAPI 3.0 description of the DYNAMIC_API endpoints."""
+    paths, schemas = {}, {}
+    for meta in metas():
+        paths.update(paths_of(meta))
+        schemas[meta.slug] = meta.schema
+    document = {
+        'openapi': '3.0.3',
+        'info': {'title': 'Dynamic API', 'version': '1.0.0', 'description': 'Models exposed by settings.DYNAMIC_API'},
+        'paths': paths,
+        'components': {'schemas': schemas},
+    }
+    if server_url:
+        document['servers'] = [{'url': server_url}]
+    return document
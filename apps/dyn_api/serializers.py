@@ -0,0 +1,168 @@
+# -*- encoding: utf-8 -*-
+"""
+Copyright (c) 2019 - present AppSeed.us
+
+Compiled serializers for DYNAMIC_API models.
+
+One ModelSerializer class is built per model and kept for the life of the
+process. List responses don't instantiate it per row: its bound fields are
+compiled once into (key, column, converter) triples, and rows are read with
+values() in chunks and converted with them. The output is the one of the
+ModelSerializer (same keys, same representations).
+"""
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+
+from rest_framework import serializers, relations
+
+ROWS_CHUNK = getattr(settings, 'DYNAMIC_API_ROWS_CHUNK', 2000)
+
+_serializers = {}
+_row_specs   = {}
+
+def serializer_class(aModelClass):
+    """The ModelSerializer (fields='__all__') of a model, built once."""
+    cls = _serializers.get(aModelClass)
+    if cls is None:
+        meta = type('Meta', (), {'model': aModelClass, 'fields': '__all__'})
+        cls = _serializers[aModelClass] = type(aModelClass.__name__ + 'Serializer', (serializers.ModelSerializer,), {'Meta': meta})
+    return cls
+
+def file_converter(model_field, drf_field):
+    def convert(name):
+        return drf_field.to_representation(model_field.attr_class(None, model_field, name)) if name else None
+    return convert
+
+class RowSpec:
+    """The serializer fields of a model compiled to values() columns + converters.
+
+    `fast` is False when some field has no plain column behind it (many to
+    many, method fields ...); such models are serialized with many=True.
+    """
+
+    def __init__(self, aModelClass):
+        self.model   = aModelClass
+        self.fields  = []
+        self.fast    = True
+
+        serializer = serializer_class(aModelClass)()
+        for name, drf_field in serializer.fields.items():
+            if drf_field.write_only:
+                continue
+            try:
+                model_field = aModelClass._meta.get_field(drf_field.source)
+            except FieldDoesNotExist:
+                model_field = None
+            if model_field is None or not model_field.concrete or model_field.many_to_many:
+                self.fast = False
+                break
+
+            if isinstance(drf_field, relations.PrimaryKeyRelatedField) and drf_field.pk_field is None:
+                convert = None
+            elif isinstance(model_field, models.FileField):
+                convert = file_converter(model_field, drf_field)
+            elif isinstance(drf_field, (serializers.CharField, serializers.IntegerField, serializers.BooleanField)) \
+                    and not isinstance(drf_field, serializers.ChoiceField):
+                convert = None
+            else:
+                convert = drf_field.to_representation
+            self.fields.append((name, model_field.attname, convert))
+
+        self.columns = [column for _, column, _ in self.fields]
+
+    def select(self, names=None):
+        """The (key, column, converter) triples of `names`, all of them for None."""
+        return self.fields if names is None else [f for f in self.fields if f[0] in names]
+
+    def row(self, values, fields=None):
+        data = {}
+        for name, column, convert in self.fields if fields is None else fields:
+            value = values[column]
+            data[name] = convert(value) if convert is not None and value is not None else value
+        return data
+
+def row_spec(aModelClass):
+    spec = _row_specs.get(aModelClass)
+    if spec is None:
+        spec = _row_specs[aModelClass] = RowSpec(aModelClass)
+    return spec
+
+def sparse(row, names):
+    return row if names is None else {key: value for key, value in row.items() if key in names}
+
+def iter_rows(queryset, names=None, chunk_size=ROWS_CHUNK):
+    """Yields the serialized rows of `queryset` (only the `names` keys when given), read in chunks."""
+    spec = row_spec(queryset.model)
+    if not spec.fast:
+        cls, batch = serializer_class(queryset.model), []
+        for obj in queryset.iterator(chunk_size=chunk_size):
+            batch.append(obj)
+            if len(batch) == chunk_size:
+                yield from (sparse(row, names) for row in cls(batch, many=True).data)
+                batch = []
+        yield from (sparse(row, names) for row in cls(batch, many=True).data)
+        return
+
+    fields = spec.select(names)
+    for values in queryset.values(*[column for _, column, _ in fields]).iterator(chunk_size=chunk_size):
+        yield spec.row(values, fields)
+
+def serialize_rows(queryset, names=None, chunk_size=ROWS_CHUNK):
+    return list(iter_rows(queryset, names, chunk_size))
+
+def page_rows(queryset, names=None, keys=()):
+    """(rows, keys) of a sliced queryset; `keys` lists the {column: value} of
+    the `keys` columns of every row, whether they are selected or not (cursors)."""
+    spec = row_spec(queryset.model)
+    if not spec.fast:
+        objs = list(queryset)
+        rows = serializer_class(queryset.model)(objs, many=True).data
+        return [sparse(row, names) for row in rows], [{c: getattr(obj, c) for c in keys} for obj in objs]
+
+    fields = spec.select(names)
+    columns = list(dict.fromkeys([column for _, column, _ in fields] + list(keys)))
+    values = list(queryset.values(*columns))
+    return [spec.row(v, fields) for v in values], [{c: v[c] for c in keys} for v in values]
+
+# Async variants (async views): the rows are read with `async for`, models
+# without a compiled spec are serialized in a worker thread (their fields may query)
+
+async def aiter_rows(queryset, names=None, chunk_size=ROWS_CHUNK):
+    spec = row_spec(queryset.model)
+    if not spec.fast:
+        cls, batch = serializer_class(queryset.model), []
+        async for obj in queryset.aiterator(chunk_size=chunk_size):
+            batch.append(obj)
+            if len(batch) == chunk_size:
+                for row in await sync_to_async(lambda: cls(batch, many=True).data)():
+                    yield sparse(row, names)
+                batch = []
+        for row in await sync_to_async(lambda: cls(batch, many=True).data)():
+            yield sparse(row, names)
+        return
+
+    fields = spec.select(names)
+    async for values in queryset.values(*[column for _, column, _ in fields]).aiterator(chunk_size=chunk_size):
+        yield spec.row(values, fields)
+
+async def apage_rows(queryset, names=None, keys=()):
+    spec = row_spec(queryset.model)
+    if not spec.fast:
+        return await sync_to_async(page_rows)(queryset, names, keys)
+
+    fields = spec.select(names)
+    columns = list(dict.fromkeys([column for _, column, _ in fields] + list(keys)))
+    values = [v async for v in queryset.values(*columns)]
+    return [spec.row(v, fields) for v in values], [{c: v[c] for c in keys} for v in values]
+
+async def aget_row(queryset, **lookup):
+    """The serialized row matching `lookup`, raises DoesNotExist."""
+    spec = row_spec(queryset.model)
+    if not spec.fast:
+        obj = await queryset.aget(**lookup)
+        return await sync_to_async(lambda: serializer_class(queryset.model)(instance=obj).data)()
+    return spec.row(await queryset.values(*spec.columns).aget(**lookup))
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_save, post_delete
+
+from apps.common.versions import bump_model_version
+from .registry import metas
+
+def connect_version_signals():
+    """Bumps the data version of the DYNAMIC_API models on writes, it keys their cached responses (caching.py)."""
+    for meta in metas():
+        uid = 'dyn_api_version_' + meta.model._meta.label_lower
+        post_save.connect(bump_model_version, sender=meta.model, dispatch_uid=uid)
+        post_delete.connect(bump_model_version, sender=meta.model, dispatch_uid=uid)
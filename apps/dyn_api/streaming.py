@@ -0,0 +1,93 @@
+# -*- encoding: utf-8 -*-
+"""
+Copyright (c) 2019 - present AppSeed.us
+
+Streaming reads of DynamicAPI lists, for sync jobs pulling whole tables.
+
+`Accept: application/x-ndjson` (or ?format=ndjson) streams one JSON row
+per line, ?stream=1 one JSON array. The rows are read with iterator()
+(server-side cursors where the database has them) and written as they are
+serialized, so memory does not grow with the table. Filters, ordering,
+?fields= and ?cursor= apply as for pages; limit / offset don't.
+"""
+
+import json
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from .listing import list_queryset
+from .serializers import iter_rows, aiter_rows
+
+STREAM_CHUNK = getattr(settings, 'DYNAMIC_API_STREAM_CHUNK', 2000)
+STREAM_BATCH = 100  # rows per write
+
+class NDJSONRenderer(BaseRenderer):
+    """Negotiates application/x-ndjson; non streamed data is one line."""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return (json.dumps(data, cls=JSONEncoder) + '\n').encode()
+
+def wants_stream(request):
+    return request.accepted_renderer.format == NDJSONRenderer.format or request.query_params.get('stream') in ('1', 'true')
+
+def ndjson_lines(rows):
+    batch = []
+    for row in rows:
+        batch.append(json.dumps(row, cls=JSONEncoder))
+        if len(batch) >= STREAM_BATCH:
+            yield '\n'.join(batch) + '\n'
+            batch = []
+    if batch:
+        yield '\n'.join(batch) + '\n'
+
+def array_part(lines, first):
+    # json.dumps() never writes a raw newline, the line breaks are the row breaks
+    return ('' if first else ',') + lines.rstrip('\n').replace('\n', ',')
+
+def json_array(rows):
+    yield '['
+    for i, lines in enumerate(ndjson_lines(rows)):
+        yield array_part(lines, i == 0)
+    yield ']'
+
+# Async variants, served by the ASGI views (async_views.py)
+
+async def andjson_lines(rows):
+    batch = []
+    async for row in rows:
+        batch.append(json.dumps(row, cls=JSONEncoder))
+        if len(batch) >= STREAM_BATCH:
+            yield '\n'.join(batch) + '\n'
+            batch = []
+    if batch:
+        yield '\n'.join(batch) + '\n'
+
+async def ajson_array(rows):
+    yield '['
+    first = True
+    async for lines in andjson_lines(rows):
+        yield array_part(lines, first)
+        first = False
+    yield ']'
+
+def streaming_response(content, ndjson):
+    response = StreamingHttpResponse(content, content_type=NDJSONRenderer.media_type if ndjson else 'application/json')
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def stream_response(request, queryset, params):
+    rows = iter_rows(list_queryset(queryset, params), params['fields'], STREAM_CHUNK)
+    if request.accepted_renderer.format == NDJSONRenderer.format:
+        return streaming_response(ndjson_lines(rows), True)
+    return streaming_response(json_array(rows), False)
+
+def astream_response(queryset, params, ndjson):
+    rows = aiter_rows(list_queryset(queryset, params), params['fields'], STREAM_CHUNK)
+    return streaming_response(andjson_lines(rows) if ndjson else ajson_array(rows), ndjson)
@@ -3,6 +3,407 @@
 Copyright (c) 2019 - present AppSeed.us
 """
 
-from django.test import TestCase
+import json
+from unittest import skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, AsyncRequestFactory, override_settings
+from django.urls import path
+from django.test.utils import CaptureQueriesContext
+
+from apps.common.testing import seed_rows
+from apps.dyn_api.async_views import dynamic_api
+from apps.dyn_api.caching import cache_stats
+from apps.dyn_api.bulk import BulkError, bulk_write_rows
+from apps.dyn_api.helpers import Utils
+from apps.dyn_api.registry import api_meta, api_model, openapi_document, validate
+from apps.dyn_api.serializers import serializer_class, serialize_rows, row_spec
+from apps.faq.models import FaqArticle, FaqAttachment, FaqCategory
+from apps.pages.models import Product
+
+
+class SerializerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def _assert_same_as_drf(self, aModelClass):
+        queryset = aModelClass.objects.order_by('pk')
+        cls = serializer_class(aModelClass)
+        self.assertEqual(serialize_rows(queryset), [cls(obj).data for obj in queryset])
+
+    def test_fast_rows_match_model_serializer(self):
+        seed_rows(Product, 5)
+        Product.objects.create(name='no price')
+        seed_rows(FaqArticle, 5, fk_pool=2)
+        attachment = FaqAttachment.objects.create(article=FaqArticle.objects.first(), file='faq/a.pdf')
+        FaqAttachment.objects.create(article=attachment.article, file='')
+
+        for aModelClass in (Product, FaqArticle, FaqAttachment):
+            self.assertTrue(row_spec(aModelClass).fast)
+            self._assert_same_as_drf(aModelClass)
+
+    def test_serializer_built_once(self):
+        config = {'product': 'apps.pages.models.Product'}
+        self.assertIs(Utils.get_serializer(config, 'product'), Utils.get_serializer(config, 'product'))
+
+    def test_list_reads_rows_with_one_query(self):
+        seed_rows(Product, 30)
+        with CaptureQueriesContext(connection) as ctx:
+            r = self.client.get('/api/product/')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(len(r.json()['data']), 30)
+        self.assertEqual(len([q for q in ctx.captured_queries if 'pages_product' in q['sql']]), 1)
+
+
+class ListEndpointTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        seed_rows(Product, 12)
+
+    def _get(self, params=None, url='/api/product/'):
+        r = self.client.get(url, params or {})
+        return r, r.json()
+
+    def test_pages_by_offset_with_a_default_limit(self):
+        with self.settings(DYNAMIC_API_OPTIONS={'product': {'max_page_size': 5}}):
+            r, data = self._get()
+            self.assertEqual(len(data['data']), 5)
+            self.assertIn('offset=5', data['next'])
+            self.assertIsNone(data['previous'])
+
+            r, data = self._get({'limit': 10})
+            self.assertEqual(r.status_code, 400)
+
+            _, last = self._get({'offset': 10})
+            self.assertEqual(len(last['data']), 2)
+            self.assertIsNone(last['next'])
+            self.assertIn('offset=5', last['previous'])
+
+    def test_cursor_walks_every_row_once(self):
+        ids, url, params = [], '/api/product/', {'cursor': '', 'limit': 5, 'ordering': '-id'}
+        while url:
+            r = self.client.get(url, params)
+            self.assertEqual(r.status_code, 200)
+            ids += [row['id'] for row in r.json()['data']]
+            url, params = r.json()['next'], None
+        self.assertEqual(ids, list(Product.objects.order_by('-id').values_list('id', flat=True)))
+
+        self.assertEqual(self._get({'cursor': 'garbage'})[0].status_code, 400)
+
+    def test_sparse_fields(self):
+        _, data = self._get({'fields': 'id,name', 'limit': 2})
+        self.assertEqual([set(row) for row in data['data']], [{'id', 'name'}] * 2)
+        self.assertEqual(self._get({'fields': 'id,secret'})[0].status_code, 400)
+
+    def test_filters_and_ordering_limited_to_indexed_columns(self):
+        first = Product.objects.order_by('pk').first()
+        _, data = self._get({'id__in': f'{first.pk},{first.pk + 1}'})
+        self.assertEqual([row['id'] for row in data['data']], [first.pk, first.pk + 1])
+
+        self.assertEqual(self._get({'price': 3})[0].status_code, 400)
+        self.assertEqual(self._get({'ordering': 'name'})[0].status_code, 400)
+        self.assertEqual(self._get({'id__gt': 'x'})[0].status_code, 400)
+
+        with self.settings(DYNAMIC_API_OPTIONS={'product': {'filter_fields': ['price'], 'order_fields': ['name']}}):
+            price = Product.objects.exclude(price=None).first().price
+            _, data = self._get({'price': price, 'ordering': '-name'})
+            self.assertEqual({row['price'] for row in data['data']}, {price})
+            names = [row['name'] for row in data['data']]
+            self.assertEqual(names, sorted(names, reverse=True))
+
+
+class StreamingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        seed_rows(Product, 250)
+
+    def _stream(self, params=None, **headers):
+        r = self.client.get('/api/product/', params or {}, **headers)
+        self.assertEqual(r.status_code, 200)
+        self.assertTrue(r.streaming)
+        return r, b''.join(r.streaming_content).decode()
+
+    def test_ndjson_streams_every_row(self):
+        r, body = self._stream(HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(r['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(rows, serialize_rows(Product.objects.order_by('pk')))
+
+        _, body = self._stream({'format': 'ndjson', 'fields': 'id', 'id__lte': rows[9]['id']})
+        self.assertEqual([json.loads(line) for line in body.splitlines()], [{'id': row['id']} for row in rows[:10]])
+
+    def test_json_array(self):
+        _, body = self._stream({'stream': 1, 'ordering': '-id'})
+        self.assertEqual(json.loads(body), serialize_rows(Product.objects.order_by('-pk')))
+
+        Product.objects.all().delete()
+        self.assertEqual(json.loads(self._stream({'stream': 1})[1]), [])
+
+    def test_errors_are_not_streamed(self):
+        r = self.client.get('/api/product/', {'price': 1}, HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(r.status_code, 400)
+        self.assertFalse(json.loads(r.content)['success'])
+
+
+class BulkTests(TestCase):
+    url = '/api/product/bulk/'
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(get_user_model().objects.create_user('bulk', password='x'))
+
+    def _send(self, method, data):
+        r = getattr(self.client, method)(self.url, json.dumps(data), content_type='application/json')
+        return r, r.json()
+
+    def test_create_update_delete(self):
+        rows = [{'name': f'p{i}', 'price': i} for i in range(1200)]
+        with CaptureQueriesContext(connection) as ctx:
+            r, data = self._send('post', rows)
+        self.assertEqual(r.status_code, 200)
+        self.assertLess(len(ctx.captured_queries), 20)
+        ids = [item['id'] for item in data['results']]
+        self.assertEqual({item['status'] for item in data['results']}, {'created'})
+        self.assertEqual(list(Product.objects.filter(pk__in=ids).order_by('pk').values_list('name', flat=True)), [row['name'] for row in rows])
+
+        r, data = self._send('put', [{'id': pk, 'price': 7} for pk in ids[:600]])
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(Product.objects.filter(price=7).count(), 600)
+        self.assertEqual(Product.objects.get(pk=ids[0]).name, 'p0')
+
+        r, data = self._send('delete', {'ids': ids[:10]})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(Product.objects.count(), 1190)
+
+    @skipUnless(apps.is_installed('apps.dyn_dt'), 'dyn_dt not installed')
+    @skipUnless(connection.vendor == 'sqlite', 'FTS5 backend is SQLite only')
+    def test_writes_refresh_the_search_index(self):
+        from apps.dyn_dt.search import SEARCH_FTS5, search_queryset, _fts5_tables
+        # captureOnCommitCallbacks runs the hooks of a transaction that is then rolled back
+        self.addCleanup(_fts5_tables.clear)
+
+        def found(term):
+            return set(search_queryset(Product.objects.all(), term, ['name'], [], SEARCH_FTS5).values_list('name', flat=True))
+
+        Product.objects.create(name='existing')
+        self.assertEqual(found('existing'), {'existing'})  # builds the index
+
+        with self.captureOnCommitCallbacks(execute=True):
+            r, data = self._send('post', [{'name': 'alpha one'}, {'name': 'alpha two'}])
+        ids = [item['id'] for item in data['results']]
+        self.assertEqual(found('alpha'), {'alpha one', 'alpha two'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._send('put', [{'id': ids[0], 'name': 'beta'}])
+        with self.captureOnCommitCallbacks(execute=True):
+            self._send('delete', {'ids': ids[1:]})
+        self.assertEqual((found('alpha'), found('beta')), (set(), {'beta'}))
+
+    def test_rejected_items_write_nothing(self):
+        r, data = self._send('post', [{'name': 'ok'}, {'price': 'x'}])
+        self.assertEqual(r.status_code, 400)
+        self.assertEqual([item['status'] for item in data['results']], ['skipped', 'invalid'])
+        self.assertIn('name', data['results'][1]['errors'])
+        self.assertFalse(Product.objects.exists())
+
+        kept = Product.objects.create(name='kept')
+        r, data = self._send('put', [{'id': kept.pk, 'name': 'new'}, {'id': kept.pk + 100, 'name': 'x'}])
+        self.assertEqual(r.status_code, 404)
+        self.assertEqual([item['status'] for item in data['results']], ['skipped', 'not_found'])
+        self.assertEqual(Product.objects.get().name, 'kept')
+
+        self.assertEqual(self._send('delete', [kept.pk, kept.pk + 1])[0].status_code, 404)
+        self.assertEqual(self._send('post', {'rows': [{'name': 'a'}], 'key': ['name']})[0].status_code, 400)
+
+    def test_anonymous_is_rejected(self):
+        self.client.logout()
+        self.assertEqual(self._send('post', [{'name': 'a'}])[0].status_code, 403)
+
+    def test_upsert_by_natural_key(self):
+        category = FaqCategory.objects.create(name='c', slug='c')
+        existing = FaqArticle.objects.create(category=category, title='old', slug='a', content='x')
+        rows = [
+            {'category': category.pk, 'title': 'new', 'slug': 'a', 'content': 'y'},
+            {'category': category.pk, 'title': 'b', 'slug': 'b', 'content': 'y'},
+        ]
+        results = bulk_write_rows(FaqArticle, rows, 'slug', create=True)
+        self.assertEqual([item['status'] for item in results], ['updated', 'created'])
+        self.assertEqual(results[0]['id'], existing.pk)
+        self.assertEqual(FaqArticle.objects.get(slug='a').title, 'new')
+        self.assertEqual(FaqArticle.objects.count(), 2)
+
+        rows[1]['category'] = category.pk + 1
+        with self.assertRaises(BulkError) as ctx:
+            bulk_write_rows(FaqArticle, rows, 'slug', create=True)
+        self.assertEqual(ctx.exception.results[1]['errors'], {'category': [f'Invalid pk "{category.pk + 1}" - object does not exist.']})
+
+        with self.assertRaises(BulkError):
+            bulk_write_rows(FaqArticle, rows, 'title', create=True)
+
+
+class CacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        seed_rows(Product, 5)
+
+    def _queries(self, url, **headers):
+        with CaptureQueriesContext(connection) as ctx:
+            r = self.client.get(url, **headers)
+        return r, len([q for q in ctx.captured_queries if 'pages_product' in q['sql']])
+
+    def test_cached_until_a_write(self):
+        r, queries = self._queries('/api/product/')
+        self.assertEqual((r['X-Cache'], queries), ('MISS', 1))
+        etag = r['ETag']
+        self.assertTrue(etag.startswith('"'))
+
+        r2, queries = self._queries('/api/product/')
+        self.assertEqual((r2['X-Cache'], queries, r2['ETag']), ('HIT', 0, etag))
+        self.assertEqual(r2.content, r.content)
+
+        r, queries = self._queries('/api/product/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((r.status_code, queries, r.content), (304, 0, b''))
+
+        self.assertEqual(self.client.get('/api/product/', {'limit': 2})['X-Cache'], 'MISS')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='new')
+        r, queries = self._queries('/api/product/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((r.status_code, r['X-Cache'], queries), (200, 'MISS', 1))
+        self.assertNotEqual(r['ETag'], etag)
+
+        self.assertEqual(cache_stats(['product']), {'product': {'hit': 1, 'miss': 3, 'not_modified': 1}})
+
+    def test_detail_and_errors(self):
+        product = Product.objects.first()
+        url = f'/api/product/{product.pk}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.name = 'renamed'
+            product.save()
+        r = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((r.status_code, r.json()['data']['name']), (200, 'renamed'))
+
+        self.assertEqual(self.client.get('/api/product/0/').status_code, 404)
+        self.assertNotIn('X-Cache', self.client.get('/api/product/0/'))
+        self.assertNotIn('X-Cache', self.client.get('/api/product/', {'stream': 1}))
+
+    def test_disabled_by_option(self):
+        with self.settings(DYNAMIC_API_OPTIONS={'product': {'cache': False}}):
+            self.client.get('/api/product/')
+            _, queries = self._queries('/api/product/')
+            self.assertEqual(queries, 1)
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        seed_rows(Product, 12)
+
+    async def _get(self, path, params=None, **kwargs):
+        return await dynamic_api(AsyncRequestFactory().get(path, params or {}), **kwargs)
+
+    async def _body(self, response):
+        return b''.join([part async for part in response.streaming_content])
+
+    async def test_same_bytes_as_the_drf_view(self):
+        first = await Product.objects.order_by('pk').afirst()
+        for path, params, kwargs in (
+            ('/api/product/', {'limit': 5, 'offset': 5}, {}),
+            ('/api/product/', {'cursor': '', 'limit': 4, 'ordering': '-id'}, {}),
+            (f'/api/product/{first.pk}/', None, {'id': str(first.pk)}),
+            ('/api/product/0/', None, {'id': '0'}),
+            ('/api/product/', {'price': 1}, {}),
+        ):
+            await sync_to_async(cache.clear)()
+            expected = await sync_to_async(self.client.get)(path, params or {})
+            await sync_to_async(cache.clear)()
+            r = await self._get(path, params, model_name='product', **kwargs)
+            self.assertEqual((r.status_code, r.content), (expected.status_code, expected.content))
+        self.assertEqual((await self._get('/api/missing/', model_name='missing')).status_code, 400)
+
+    async def test_cache_and_streams(self):
+        r = await self._get('/api/product/', model_name='product')
+        self.assertEqual(r['X-Cache'], 'MISS')
+        etag = r['ETag']
+        request = AsyncRequestFactory().get('/api/product/', headers={'If-None-Match': etag})
+        self.assertEqual((await dynamic_api(request, model_name='product')).status_code, 304)
+
+        r = await self._get('/api/product/', {'format': 'ndjson'}, model_name='product')
+        rows = [json.loads(line) for line in (await self._body(r)).splitlines()]
+        self.assertEqual(len(rows), 12)
+        r = await self._get('/api/product/', {'stream': 1, 'fields': 'id'}, model_name='product')
+        self.assertEqual(json.loads(await self._body(r)), [{'id': row['id']} for row in rows])
+
+    async def test_writes_and_html_go_to_the_drf_view(self):
+        request = AsyncRequestFactory().get('/api/product/', headers={'Accept': 'text/html'})
+        r = await sync_to_async((await dynamic_api(request, model_name='product')).render)()
+        self.assertIn(b'<html', r.content)
+
+        request = AsyncRequestFactory().post('/api/product/', {'name': 'async'}, content_type='application/json')
+        self.assertEqual((await dynamic_api(request, model_name='product')).status_code, 200)
+        self.assertTrue(await Product.objects.filter(name='async').aexists())
+
+    async def test_async_middleware_chain(self):
+        r = await self.async_client.get('/api/product/')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(len(r.json()['data']), 12)
+
+    @override_settings(ROOT_URLCONF='apps.dyn_api.tests')
+    async def test_served_by_the_asgi_handler(self):
+        r = await self.async_client.get('/api/product/', {'limit': 3})
+        self.assertEqual((r.status_code, len(r.json()['data'])), (200, 3))
+
+        r = await self.async_client.post('/api/product/', {'name': 'async'}, content_type='application/json')
+        self.assertEqual(r.status_code, 200)
+
+
+class RegistryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_startup_registry(self):
+        self.assertIs(api_model('product'), Product)
+        self.assertIs(api_meta('product').serializer, serializer_class(Product))
+        with self.assertRaises(KeyError):
+            api_model('nope')
+
+    def test_misconfigurations_are_reported(self):
+        config = {'product': 'apps.pages.models.Product', 'bad': 'apps.pages.models.Nope', 'x/y': 'apps.pages.models.Product'}
+        options = {
+            'product': {'max_page_size': 0, 'filter_fields': ['name', 'colour'], 'natural_key': ['name'], 'pagesize': 10},
+            'ghost': {},
+        }
+        metas, errors = validate(config, options)
+        self.assertEqual(list(metas), ['product'])
+        text = '\n'.join(errors)
+        for expected in ('bad: cannot import', "'x/y'", "unknown option 'pagesize'", 'max_page_size', 'colour',
+                         'natural_key: Not a unique key', "unknown slug 'ghost'"):
+            self.assertIn(expected, text)
+
+    def test_openapi_document(self):
+        r = self.client.get('/api/openapi.json')
+        self.assertEqual(r.status_code, 200)
+        document = r.json()
+        self.assertEqual(document['openapi'], '3.0.3')
+        self.assertEqual(set(document['paths']), set(openapi_document()['paths']))
+        self.assertIn('/api/product/', document['paths'])
+        self.assertIn('/api/product/{id}/', document['paths'])
+        self.assertIn('/api/product/bulk/', document['paths'])
+        schema = document['components']['schemas']['product']
+        self.assertEqual(schema['properties']['id'].get('readOnly'), True)
+        self.assertIn('name', schema['properties'])
+        names = [p['name'] for p in document['paths']['/api/product/']['get']['parameters']]
+        self.assertIn('limit', names)
+
+
+urlpatterns = [
+    path('api/<str:model_name>/', dynamic_api),
+]
@@ -3,14 +3,21 @@
 Copyright (c) 2019 - present AppSeed.us
 """
 
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
-from apps.dyn_api import views 
+from apps.dyn_api import views, async_views
+
+# ASGI: async reads, see async_views.py
+model_api = async_views.dynamic_api if getattr(settings, 'DYNAMIC_API_ASYNC', False) else views.DynamicAPI.as_view()
 
 urlpatterns = [
     path('api/', views.index, name="dynamic_api"),
+    path('api/openapi.json', views.OpenAPISchema.as_view(), name="model_api_openapi"),
+    path('api/cache/stats/', views.CacheStatsAPI.as_view(), name="model_api_cache_stats"),
 
-    path('api/<str:model_name>/'          , views.DynamicAPI.as_view(), name="model_api"),
-    path('api/<str:model_name>/<str:id>'  , views.DynamicAPI.as_view()),
-    path('api/<str:model_name>/<str:id>/' , views.DynamicAPI.as_view()),
+    path('api/<str:model_name>/'          , model_api, name="model_api"),
+    path('api/<str:model_name>/bulk/'     , views.DynamicBulkAPI.as_view(), name="model_api_bulk"),
+    path('api/<str:model_name>/<str:id>'  , model_api),
+    path('api/<str:model_name>/<str:id>/' , model_api),
 ]
@@ -11,10 +11,14 @@ from django.shortcuts import render, redirect, get_object_or_404
 
 from rest_framework.generics import get_object_or_404
 from rest_framework.views import APIView
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from django.http import HttpResponse
 
 from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import IntegrityError
 
 DYNAMIC_API = {}
 
@@ -24,6 +28,11 @@ except:
     pass 
 
 from .helpers import Utils 
+from .registry import api_meta, api_model, openapi_document
+from .listing import list_params, list_page, ListError
+from .streaming import NDJSONRenderer, wants_stream, stream_response
+from .caching import cached_get, cache_stats
+from .bulk import BulkError, bulk_create_rows, bulk_write_rows, bulk_delete_rows, upsert_key
 
 def index(request):
     
@@ -36,9 +45,18 @@ def index(request):
     return render(request, 'dyn_api/index.html', context)
 
 class DynamicAPI(APIView):
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [NDJSONRenderer]
 
-    # READ : GET api/model/id or api/model
+    # READ : GET api/model/id or api/model, answered from the cache when it can (caching.py)
     def get(self, request, **kwargs):
+        try:
+            model_class = api_model(kwargs.get('model_name'))
+        except KeyError:
+            return self.read(request, **kwargs)
+        return cached_get(self, request, kwargs.get('model_name'), model_class, kwargs.get('id'),
+                          lambda: self.read(request, **kwargs))
+
+    def read(self, request, **kwargs):
 
         model_id = kwargs.get('id', None)
         try:
@@ -57,15 +75,29 @@ class DynamicAPI(APIView):
                         'success': False
                     }, status=400)
 
-                thing = get_object_or_404(Utils.get_manager(DYNAMIC_API, kwargs.get('model_name')), id=model_id)
-                model_serializer = Utils.get_serializer(DYNAMIC_API, kwargs.get('model_name'))(instance=thing)
+                thing = get_object_or_404(api_model(kwargs.get('model_name')).objects, id=model_id)
+                model_serializer = api_meta(kwargs.get('model_name')).serializer(instance=thing)
                 output = model_serializer.data
             else:
-                all_things = Utils.get_manager(DYNAMIC_API, kwargs.get('model_name')).all()
-                thing_serializer = Utils.get_serializer(DYNAMIC_API, kwargs.get('model_name'))
-                output = []
-                for thing in all_things:
-                    output.append(thing_serializer(instance=thing).data)
+                model_class = api_model(kwargs.get('model_name'))
+                try:
+                    params = list_params(kwargs.get('model_name'), model_class, request.query_params)
+                except ListError as e:
+                    return Response(data={
+                        'message': 'Input Error = ' + str(e),
+                        'success': False
+                    }, status=400)
+
+                if wants_stream(request):
+                    return stream_response(request, model_class.objects.all(), params)
+
+                output, next_url, previous_url = list_page(request, model_class.objects.all(), params)
+                return Response(data={
+                    'data': output,
+                    'next': next_url,
+                    'previous': previous_url,
+                    'success': True
+                    }, status=200)
         except KeyError:
             return Response(data={
                 'message': 'this model is not activated or not exist.',
@@ -85,7 +117,7 @@ class DynamicAPI(APIView):
     #@check_permission
     def post(self, request, **kwargs):
         try:
-            model_serializer = Utils.get_serializer(DYNAMIC_API, kwargs.get('model_name'))(data=request.data)
+            model_serializer = api_meta(kwargs.get('model_name')).serializer(data=request.data)
             if model_serializer.is_valid():
                 model_serializer.save()
             else:
@@ -107,8 +139,8 @@ class DynamicAPI(APIView):
     #@check_permission
     def put(self, request, **kwargs):
         try:
-            thing = get_object_or_404(Utils.get_manager(DYNAMIC_API, kwargs.get('model_name')), id=kwargs.get('id'))
-            model_serializer = Utils.get_serializer(DYNAMIC_API, kwargs.get('model_name'))(instance=thing,
+            thing = get_object_or_404(api_model(kwargs.get('model_name')).objects, id=kwargs.get('id'))
+            model_serializer = api_meta(kwargs.get('model_name')).serializer(instance=thing,
                                                                                            data=request.data,
                                                                                            partial=True)
             if model_serializer.is_valid():
@@ -137,7 +169,7 @@ class DynamicAPI(APIView):
     #@check_permission
     def delete(self, request, **kwargs):
         try:
-            model_manager = Utils.get_manager(DYNAMIC_API, kwargs.get('model_name'))
+            model_manager = api_model(kwargs.get('model_name')).objects
             to_delete_id = kwargs.get('id')
             model_manager.get(id=to_delete_id).delete()
         except KeyError:
@@ -145,7 +177,7 @@ class DynamicAPI(APIView):
                 'message': 'this model is not activated or not exist.',
                 'success': False
             }, status=400)
-        except Utils.get_class(DYNAMIC_API, kwargs.get('model_name')).DoesNotExist as e:
+        except ObjectDoesNotExist:
             return Response(data={
                 'message': 'object with given id not found.',
                 'success': False
@@ -154,3 +186,86 @@ class DynamicAPI(APIView):
             'message': 'Record Deleted.',
             'success': True
         }, status=200)
+
+class OpenAPISchema(APIView):
+
+    # GET api/openapi.json : OpenAPI 3 document of every DYNAMIC_API route (registry.py)
+    def get(self, request, **kwargs):
+        return Response(data=openapi_document(request.build_absolute_uri('/')[:-1]), status=200)
+
+class CacheStatsAPI(APIView):
+    permission_classes = [IsAdminUser]
+
+    # GET api/cache/stats/ : hit / miss / 304 counters of every slug
+    def get(self, request, **kwargs):
+        return Response(data={
+            'data': cache_stats(DYNAMIC_API.keys()),
+            'success': True
+        }, status=200)
+
+class DynamicBulkAPI(APIView):
+    """Arrays of rows, written in one transaction: all of them or none.
+
+      POST   api/model/bulk/   [rows] or {"rows": [...], "key": ["field"]}   create, upsert with a key
+      PUT    api/model/bulk/   [rows] or {"rows": [...], "key": ["field"]}   update, by id by default
+      DELETE api/model/bulk/   [ids]  or {"ids": [...]}
+    """
+    permission_classes = [IsAuthenticated]
+
+    def rows(self, request, name):
+        data = request.data
+        if isinstance(data, dict):
+            return data.get(name), data
+        return data, {}
+
+    def respond(self, write, **kwargs):
+        try:
+            aModelClass = api_model(kwargs.get('model_name'))
+        except KeyError:
+            return Response(data={
+                'message': 'this model is not activated or not exist.',
+                'success': False
+            }, status=400)
+        try:
+            results = write(aModelClass)
+        except BulkError as e:
+            return Response(data={
+                'message': 'Input Error = ' + str(e),
+                'results': e.results,
+                'success': False
+            }, status=e.status)
+        except IntegrityError as e:
+            return Response(data={
+                'message': 'Conflict = ' + str(e),
+                'success': False
+            }, status=409)
+        return Response(data={
+            'results': results,
+            'success': True
+        }, status=200)
+
+    # CREATE / UPSERT : POST api/model/bulk/
+    def post(self, request, **kwargs):
+        rows, data = self.rows(request, 'rows')
+        key = upsert_key(kwargs.get('model_name'), data)
+
+        def write(aModelClass):
+            if key:
+                return bulk_write_rows(aModelClass, rows, key, create=True)
+            return bulk_create_rows(aModelClass, rows)
+        return self.respond(write, **kwargs)
+
+    # UPDATE : PUT api/model/bulk/
+    def put(self, request, **kwargs):
+        rows, data = self.rows(request, 'rows')
+
+        def write(aModelClass):
+            return bulk_write_rows(aModelClass, rows, data.get('key') or aModelClass._meta.pk.name, create=False)
+        return self.respond(write, **kwargs)
+
+    patch = put
+
+    # DELETE : DELETE api/model/bulk/
+    def delete(self, request, **kwargs):
+        ids, _ = self.rows(request, 'ids')
+        return self.respond(lambda aModelClass: bulk_delete_rows(aModelClass, ids), **kwargs)
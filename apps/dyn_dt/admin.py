@@ -6,3 +6,4 @@ from .models import *
 admin.site.register(PageItems)
 admin.site.register(HideShowFilter)
 admin.site.register(ModelFilter)
+admin.site.register(ExportJob)
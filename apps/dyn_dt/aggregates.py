@@ -0,0 +1,248 @@
+"""
+Column aggregates (COMMON.CHART_VERBS: sum, count, avg, min, max) for
+dyn_dt tables.
+
+One aggregate() query computes every verb of every aggregated column over
+the saved filters + search, and the result is cached by a hash of the
+model, filters and search. Row saves and deletes then update the cached
+entries of the model in place (signals, applied on commit) instead of
+dropping them: avg is kept as sum / count, and only a removed min / max
+value forces a recompute. Bulk writes send no per-row signals, they drop
+the entries of the model (invalidate_aggregates).
+
+Concurrent writers are serialized per entry by a version counter kept in
+its own key (cache.incr is atomic): each change takes the next version
+before its transaction commits, and on commit the entry is updated only
+when it holds the version right before it. Any other case drops the
+entry, so the next read recomputes it.
+"""
+
+import hashlib, json, time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Sum, Min, Max
+
+from apps.common.fields import is_number
+from apps.dyn_dt.registry import table_meta
+from apps.dyn_dt.utils import search_filter, table_option
+from cli import COMMON
+
+AGGREGATE_TTL         = getattr(settings, 'DYNAMIC_DATATB_AGGREGATE_TTL'    , 300)
+AGGREGATE_MAX_ENTRIES = getattr(settings, 'DYNAMIC_DATATB_AGGREGATE_ENTRIES', 32)
+
+# Old row state of an update that started before the entry existed
+STALE = object()
+
+def aggregate_fields(aPath, meta):
+    """The aggregated columns: the table's 'aggregates' option, or every numeric column."""
+    option = table_option(aPath, 'aggregates')
+    if option is False:
+        return []
+    names = option or meta.db_fields
+    return [
+        field.name for field in meta.model._meta.fields
+        if field.name in names and is_number(field) and not (field.primary_key or field.is_relation or field.choices)
+    ]
+
+def aggregate_cache_key(aModelClass, aPath, filter_string, search):
+    filter_set = json.dumps([aPath.lower(), filter_string, search or ''], sort_keys=True, default=str)
+    digest = hashlib.md5(filter_set.encode()).hexdigest()
+    return f'dyn_dt:aggregates:{aModelClass._meta.label_lower}:{digest}'
+
+def index_key(aModelClass):
+    """Lists the live aggregate keys of a model, for the signal handlers."""
+    return f'dyn_dt:aggregates:{aModelClass._meta.label_lower}'
+
+def version_key(key):
+    return key + ':version'
+
+def entry_version(key):
+    """The number of changes taken on `key` so far; the counter outlives the entry computed next."""
+    if not cache.add(version_key(key), 0, 2 * AGGREGATE_TTL):
+        cache.touch(version_key(key), 2 * AGGREGATE_TTL)
+    return cache.get(version_key(key)) or 0
+
+def claim_version(key):
+    """Takes the next version of `key`, for one change."""
+    cache.add(version_key(key), 0, 2 * AGGREGATE_TTL)
+    try:
+        return cache.incr(version_key(key))
+    except ValueError:
+        # the counter expired in between: no entry version can match
+        return None
+
+def entry_queryset(aModelClass, entry):
+    queryset = aModelClass.objects.filter(**entry['lookups'])
+    if entry['search']:
+        meta = table_meta(entry['aPath'])
+        queryset = search_filter(queryset, entry['search'], meta.db_fields, meta.fk_fields.keys(), entry['aPath'])
+    return queryset
+
+def compute_entry(aModelClass, aPath, fields, filter_string, search, version=0):
+    entry = {
+        'aPath'  : aPath,
+        'lookups': filter_string,
+        'search' : search or '',
+        'expires': time.time() + AGGREGATE_TTL,
+        'version': version,
+    }
+    expressions = {'rows': Count('pk')}
+    for name in fields:
+        expressions.update({
+            name + '__count': Count(name),
+            name + '__sum'  : Sum(name),
+            name + '__min'  : Min(name),
+            name + '__max'  : Max(name),
+        })
+    result = entry_queryset(aModelClass, entry).aggregate(**expressions)
+
+    entry['rows'] = result['rows']
+    entry['columns'] = {
+        name: {verb: result[f'{name}__{verb}'] for verb in ('count', 'sum', 'min', 'max')} for name in fields
+    }
+    return entry
+
+def summary(entry):
+    """{'rows': n, 'columns': {field: {verb: value}}} in COMMON.CHART_VERBS order."""
+    columns = {}
+    for name, column in entry['columns'].items():
+        values = dict(column, avg=column['sum'] / column['count'] if column['count'] else None)
+        columns[name] = {verb: values[verb] for verb in COMMON.CHART_VERBS}
+    return {'rows': entry['rows'], 'columns': columns}
+
+def table_aggregates(aPath, meta, filter_string, search):
+    """The aggregates of a table over its saved filters and `search`, cached."""
+    aModelClass = meta.model
+    fields = aggregate_fields(aPath, meta)
+    key = aggregate_cache_key(aModelClass, aPath, filter_string, search)
+
+    entry = cache.get(key)
+    if entry is None:
+        version = entry_version(key)
+        entry = compute_entry(aModelClass, aPath, fields, filter_string, search, version)
+        if entry_version(key) != version:
+            # A change took a version during the query, which may or may not include it
+            entry['version'] = None
+        cache.set(key, entry, AGGREGATE_TTL)
+
+        keys = [k for k in cache.get(index_key(aModelClass)) or [] if k != key] + [key]
+        cache.delete_many(keys[:-AGGREGATE_MAX_ENTRIES])
+        cache.set(index_key(aModelClass), keys[-AGGREGATE_MAX_ENTRIES:], AGGREGATE_TTL)
+    return summary(entry)
+
+def invalidate_aggregates(aModelClass):
+    keys = cache.get(index_key(aModelClass)) or []
+    cache.delete_many(keys + [version_key(key) for key in keys] + [index_key(aModelClass)])
+
+def live_entries(aModelClass):
+    keys = cache.get(index_key(aModelClass))
+    return cache.get_many(keys) if keys else {}
+
+def row_states(aModelClass, pk, entries, using=None):
+    """{key: values of row `pk` if the entry's filter set matches it, else None}.
+
+    One query per distinct filter set, none of them when no entry is live.
+    """
+    fields = sorted({name for entry in entries.values() for name in entry['columns']})
+    states, seen = {}, {}
+    for key, entry in entries.items():
+        filter_set = json.dumps([entry['lookups'], entry['search'] and entry['aPath'], entry['search']], sort_keys=True, default=str)
+        if filter_set not in seen:
+            queryset = entry_queryset(aModelClass, entry).using(using).filter(pk=pk)
+            seen[filter_set] = queryset.values(*fields).first()
+        states[key] = seen[filter_set]
+    return states
+
+def apply_change(entry, old, new):
+    """Moves one row from `old` to `new` values (None: not in the set) in `entry`.
+
+    Returns False when the entry can't be updated in place (a min / max
+    value left the set).
+    """
+    entry['rows'] += (new is not None) - (old is not None)
+    for name, column in entry['columns'].items():
+        before = old.get(name) if old else None
+        after  = new.get(name) if new else None
+        if before == after:
+            continue
+
+        if before is not None:
+            lost_min = before == column['min'] and (after is None or after > before)
+            lost_max = before == column['max'] and (after is None or after < before)
+            if column['count'] > 1 and (lost_min or lost_max):
+                return False
+            column['count'] -= 1
+            if column['count']:
+                column['sum'] -= before
+            else:
+                column['sum'] = column['min'] = column['max'] = None
+
+        if after is not None:
+            if column['count']:
+                column['sum'] += after
+                column['min'] = min(column['min'], after)
+                column['max'] = max(column['max'], after)
+            else:
+                column['sum'] = column['min'] = column['max'] = after
+            column['count'] += 1
+    return True
+
+def store_change(key, version, old, new):
+    """Applies the change that took `version` to the entry `key`.
+
+    The entry is written back only when it holds the previous version and
+    no other change took a version in the meantime; otherwise it is dropped.
+    """
+    entry = cache.get(key)
+    if entry is None:
+        return
+    timeout = entry['expires'] - time.time()
+    if (version is None or entry.get('version') != version - 1 or old is STALE or timeout <= 0
+            or not apply_change(entry, old, new)):
+        cache.delete(key)
+        return
+
+    entry['version'] = version
+    cache.set(key, entry, timeout)
+    if cache.get(version_key(key)) != version:
+        # a concurrent change read the entry before this write
+        cache.delete(key)
+
+def apply_changes(changes, using=None):
+    """`changes`: {key: (old, new)}, see apply_change(); applied on commit."""
+    versions = {key: claim_version(key) for key in changes}
+    def store():
+        for key, (old, new) in changes.items():
+            store_change(key, versions[key], old, new)
+    transaction.on_commit(store, using=using)
+
+def aggregates_pre_save(sender, instance, raw=False, using=None, **kwargs):
+    instance._dyn_dt_aggregates = {}
+    if raw or instance._state.adding:
+        return
+    entries = live_entries(sender)
+    if entries:
+        instance._dyn_dt_aggregates = row_states(sender, instance.pk, entries, using)
+
+def aggregates_post_save(sender, instance, created, raw=False, using=None, **kwargs):
+    before = instance.__dict__.pop('_dyn_dt_aggregates', {})
+    if raw:
+        return
+    entries = live_entries(sender)
+    if not entries:
+        return
+
+    after = row_states(sender, instance.pk, entries, using)
+    changes = {key: (None if created else before.get(key, STALE), new) for key, new in after.items()}
+    apply_changes(changes, using)
+
+def aggregates_pre_delete(sender, instance, using=None, **kwargs):
+    entries = live_entries(sender)
+    instance._dyn_dt_aggregates = row_states(sender, instance.pk, entries, using) if entries else {}
+
+def aggregates_post_delete(sender, instance, using=None, **kwargs):
+    before = instance.__dict__.pop('_dyn_dt_aggregates', {})
+    if before:
+        apply_changes({key: (old, None) for key, old in before.items()}, using)
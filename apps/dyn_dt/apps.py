@@ -3,3 +3,13 @@ from django.apps import AppConfig
 class DynDtConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.dyn_dt'
+
+    def ready(self):
+        from apps.dyn_dt import registry, signals
+        registry.build_registry()
+        signals.connect_fk_label_signals()
+        signals.connect_search_signals()
+        signals.connect_table_settings_signals()
+        signals.connect_aggregate_signals()
+        signals.connect_version_signals()
+        signals.connect_bulk_signals()
@@ -0,0 +1,171 @@
+"""
+Multi-row writes for dyn_dt tables.
+
+Every operation runs in one transaction. FK values are checked with one
+`pk__in` lookup per related model, whatever the number of rows, and row
+level problems are reported as [{'row': i, 'errors': {field: message}}];
+when there is any, nothing is written. On commit rows_changed
+(apps.common.signals) is sent with the written keys, bulk_create() and
+update() send no row signals: apps.common bumps the data version, and
+signals.rows_written() drops the cached aggregates and FK labels and
+refreshes the FTS5 rows.
+"""
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from apps.common.signals import send_rows_changed
+from apps.dyn_dt.aggregates import invalidate_aggregates
+from apps.dyn_dt.registry import table_settings
+from apps.dyn_dt.utils import model_filter_string, search_filter
+
+BULK_MAX_ROWS = getattr(settings, 'DYNAMIC_DATATB_BULK_MAX_ROWS', 5000)
+BULK_BATCH    = getattr(settings, 'DYNAMIC_DATATB_BULK_BATCH'   , 500)
+
+class BulkError(Exception):
+    """Rejected bulk request; `errors` holds the per-row problems."""
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors or []
+
+def editable_fields(aModelClass):
+    return {field.name: field for field in aModelClass._meta.fields if field.editable and not field.primary_key}
+
+def clean_value(field, value):
+    if value in ('', None):
+        if field.null:
+            return None
+        if field.is_relation:
+            raise ValidationError(field.error_messages['null'])
+    if field.is_relation:
+        return field.target_field.to_python(value)
+    # to_python, then choices, blank / null and the validators (max_length, ...)
+    return field.clean(value, None)
+
+def clean_rows(aModelClass, rows):
+    """Returns ([{attname: value}], errors); FK ids are checked in one query per model."""
+    fields = editable_fields(aModelClass)
+    cleaned, errors = [], []
+
+    for i, row in enumerate(rows):
+        values, row_errors = {}, {}
+        if not isinstance(row, dict):
+            errors.append({'row': i, 'errors': {'__all__': 'Expected an object'}})
+            cleaned.append(values)
+            continue
+        for name, value in row.items():
+            field = fields.get(name)
+            if field is None:
+                row_errors[name] = 'Unknown or read-only field'
+                continue
+            try:
+                values[field.attname] = clean_value(field, value)
+            except ValidationError as e:
+                row_errors[name] = ' '.join(e.messages)
+        if row_errors:
+            errors.append({'row': i, 'errors': row_errors})
+        cleaned.append(values)
+
+    for name, field in fields.items():
+        if not field.is_relation:
+            continue
+        wanted = {values[field.attname] for values in cleaned if values.get(field.attname) is not None}
+        if not wanted:
+            continue
+        found = set(field.related_model._default_manager.filter(pk__in=wanted).values_list('pk', flat=True))
+        for i, values in enumerate(cleaned):
+            pk = values.get(field.attname)
+            if pk is not None and pk not in found:
+                add_error(errors, i, name, f'{field.related_model.__name__} {pk} does not exist')
+
+    return cleaned, sorted(errors, key=lambda e: e['row'])
+
+def add_error(errors, row, name, message):
+    for entry in errors:
+        if entry['row'] == row:
+            entry['errors'][name] = message
+            return
+    errors.append({'row': row, 'errors': {name: message}})
+
+def bulk_create_rows(aModelClass, rows):
+    """Creates `rows` with bulk_create; returns the number of rows created."""
+    if not rows:
+        raise BulkError('No rows given')
+    if len(rows) > BULK_MAX_ROWS:
+        raise BulkError(f'At most {BULK_MAX_ROWS} rows per request')
+
+    cleaned, errors = clean_rows(aModelClass, rows)
+
+    # FK fields are skipped by clean_fields(), their validation queries per row
+    fk_names = [f.name for f in aModelClass._meta.fields if f.is_relation]
+    required = [f for f in aModelClass._meta.fields if f.is_relation and not f.null]
+
+    objs = []
+    for i, values in enumerate(cleaned):
+        for field in required:
+            if values.get(field.attname) is None:
+                add_error(errors, i, field.name, str(field.error_messages['null']))
+        obj = aModelClass(**values)
+        try:
+            obj.clean_fields(exclude=fk_names)
+        except ValidationError as e:
+            for name, messages in e.message_dict.items():
+                add_error(errors, i, name, ' '.join(messages))
+        objs.append(obj)
+
+    if errors:
+        raise BulkError('Invalid rows', sorted(errors, key=lambda e: e['row']))
+
+    with transaction.atomic():
+        aModelClass.objects.bulk_create(objs, batch_size=BULK_BATCH)
+        send_rows_changed(aModelClass, [obj.pk for obj in objs])
+    return len(objs)
+
+def written_keys(queryset):
+    """The keys of `queryset`, None (unknown: refresh everything) past BULK_MAX_ROWS rows."""
+    pks = list(queryset.values_list('pk', flat=True)[:BULK_MAX_ROWS + 1])
+    return pks if len(pks) <= BULK_MAX_ROWS else None
+
+def bulk_update_rows(queryset, values):
+    """One UPDATE for every row of `queryset`; returns the number of rows changed."""
+    if not values:
+        raise BulkError('No values given')
+
+    cleaned, errors = clean_rows(queryset.model, [values])
+    if errors:
+        raise BulkError('Invalid values', errors)
+
+    with transaction.atomic():
+        send_rows_changed(queryset.model, written_keys(queryset))
+        return queryset.update(**cleaned[0])
+
+def bulk_delete_rows(queryset):
+    # Dropped first too: with no live entry the per-row delete signals skip their lookups
+    invalidate_aggregates(queryset.model)
+    with transaction.atomic():
+        send_rows_changed(queryset.model, written_keys(queryset))
+        return queryset.delete()[0]
+
+def target_queryset(aPath, meta, data):
+    """The rows a bulk update/delete applies to.
+
+    {'ids': [...]} selects rows by key, {'all': true, 'search': '...'} every
+    row matching the saved filters and the search, like the table does.
+    """
+    aModelClass = meta.model
+    if data.get('all'):
+        filter_string = model_filter_string(table_settings(aPath).filters, meta.db_fields, aModelClass)
+        queryset = aModelClass.objects.filter(**filter_string)
+        return search_filter(queryset, data.get('search', ''), meta.db_fields, meta.fk_fields.keys(), aPath)
+
+    ids = data.get('ids')
+    if not ids or not isinstance(ids, list):
+        raise BulkError('Give "ids" or "all"')
+    if len(ids) > BULK_MAX_ROWS:
+        raise BulkError(f'At most {BULK_MAX_ROWS} ids per request')
+    try:
+        ids = [aModelClass._meta.pk.to_python(pk) for pk in ids]
+    except ValidationError as e:
+        raise BulkError(' '.join(e.messages))
+    return aModelClass.objects.filter(pk__in=ids)
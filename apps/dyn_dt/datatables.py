@@ -0,0 +1,198 @@
+"""
+DataTables server-side processing protocol for dyn_dt tables.
+
+Request: draw, start, length, search[value], order[i][column|dir],
+columns[i][data|searchable|orderable|search][value] (see
+https://datatables.net/manual/server-side). The rows are selected with the
+table's saved filters, search backend and hidden columns, like model_dt,
+and read with values(): no model instances, FK labels come from the
+cached fk_labels().
+
+Responses are cached per page under the table's data versions (see
+versions.py), so a write makes every cached page unreachable at once. With
+the 'prefetch' table option the next page is computed in a background
+thread after a page is served.
+"""
+
+import hashlib, json, threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection
+
+from apps.dyn_dt.fk_choices import fk_labels
+from apps.dyn_dt.registry import table_settings
+from apps.dyn_dt.utils import model_filter_string, search_filter, table_option, visible_fields
+from apps.dyn_dt.versions import table_version
+
+DATATABLES_MAX_LENGTH = getattr(settings, 'DYNAMIC_DATATB_MAX_LENGTH', 500)
+RECORDS_TOTAL_TTL     = getattr(settings, 'DYNAMIC_DATATB_TOTAL_TTL' , 60)
+DATATABLES_PAGE_TTL   = getattr(settings, 'DYNAMIC_DATATB_PAGE_TTL'  , 60)   # 0 disables the page cache
+PREFETCH_WORKERS      = getattr(settings, 'DYNAMIC_DATATB_PREFETCH_WORKERS', 2)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+class DataTablesError(ValueError):
+    pass
+
+def fk_search_value(aModelClass, name, value):
+    """The column search `value` of FK `name` as a key of the related model, DataTablesError if it is not one."""
+    try:
+        return str(aModelClass._meta.get_field(name).target_field.to_python(value))
+    except ValidationError:
+        raise DataTablesError(f'Invalid value for column {name}: {value}')
+
+def datatables_params(query, db_fields, aModelClass=None, fk_fields=()):
+    """Parses the protocol parameters of `query` (a QueryDict)."""
+    try:
+        draw   = int(query.get('draw', 0))
+        start  = max(int(query.get('start', 0)), 0)
+        length = int(query.get('length', 25))
+    except ValueError:
+        raise DataTablesError('draw, start and length must be integers')
+    if length < 0 or length > DATATABLES_MAX_LENGTH:
+        length = DATATABLES_MAX_LENGTH
+
+    columns = []
+    while f'columns[{len(columns)}][data]' in query:
+        i = len(columns)
+        data = query.get(f'columns[{i}][data]')
+        if data and data not in db_fields:
+            raise DataTablesError('Unknown column: ' + data)
+        search = query.get(f'columns[{i}][search][value]', '').strip()
+        if search and data in fk_fields:
+            search = fk_search_value(aModelClass, data, search)
+        columns.append({
+            'data'      : data,
+            'searchable': query.get(f'columns[{i}][searchable]', 'true') != 'false',
+            'orderable' : query.get(f'columns[{i}][orderable]', 'true') != 'false',
+            'search'    : search,
+        })
+    if not columns:
+        columns = [{'data': f, 'searchable': True, 'orderable': True, 'search': ''} for f in db_fields]
+
+    order = []
+    while f'order[{len(order)}][column]' in query:
+        i = len(order)
+        try:
+            column = columns[int(query.get(f'order[{i}][column]'))]
+        except (ValueError, IndexError):
+            raise DataTablesError('Invalid order column')
+        prefix = '-' if query.get(f'order[{i}][dir]') == 'desc' else ''
+        order.append((prefix, column))
+
+    return {
+        'draw'   : draw,
+        'start'  : start,
+        'length' : length,
+        'search' : query.get('search[value]', '').strip(),
+        'columns': columns,
+        'order'  : [prefix + column['data'] for prefix, column in order if column['data'] and column['orderable']],
+    }
+
+def records_total_key(aPath):
+    return 'dyn_dt:records_total:' + aPath.lower()
+
+def datatables_response(aPath, meta, params):
+    """The protocol response: draw, recordsTotal, recordsFiltered, data."""
+    aModelClass = meta.model
+    db_fields   = meta.db_fields
+    fk_fields   = meta.fk_fields.keys()
+
+    table = table_settings(aPath)
+    shown = visible_fields(table.field_names(db_fields), db_fields)
+    requested = [c['data'] for c in params['columns'] if c['data']]
+    fields = [f for f in shown if f in requested]
+
+    filter_string = model_filter_string(table.filters, db_fields, aModelClass)
+    queryset = aModelClass.objects.filter(**filter_string)
+    queryset = search_filter(queryset, params['search'], db_fields, fk_fields, aPath)
+    for column in params['columns']:
+        if column['data'] and column['search'] and column['searchable']:
+            if column['data'] in fk_fields:
+                queryset = queryset.filter(**{aModelClass._meta.get_field(column['data']).attname: column['search']})
+            else:
+                queryset = search_filter(queryset, column['search'], [column['data']], fk_fields, aPath)
+
+    filtered = queryset.count()
+    searched = params['search'] or any(c['search'] for c in params['columns'])
+    if not filter_string and not searched:
+        total = filtered
+    elif table_option(aPath, 'records_total', True):
+        total = cache.get_or_set(records_total_key(aPath), aModelClass.objects.count, RECORDS_TOTAL_TTL)
+    else:
+        total = filtered
+
+    pk_name = aModelClass._meta.pk.name
+    columns = [pk_name] + [f for f in fields if f != pk_name]
+    order   = params['order'] or [pk_name]
+    window  = queryset.order_by(*order, 'pk').values(*columns)[params['start']:params['start'] + params['length']]
+    rows    = list(window)
+
+    for name in fields:
+        if name in fk_fields:
+            labels = fk_labels(aModelClass._meta.get_field(name).related_model, [row[name] for row in rows])
+            for row in rows:
+                row[name + '_id'] = row[name]
+                row[name] = labels.get(row[name], '')
+    if pk_name != 'id':
+        for row in rows:
+            row['id'] = row.pop(pk_name)
+
+    return {
+        'draw'           : params['draw'],
+        'recordsTotal'   : total,
+        'recordsFiltered': filtered,
+        'data'           : rows,
+    }
+
+def page_cache_key(aPath, meta, params):
+    payload = json.dumps([aPath.lower(), table_version(aPath, meta), dict(params, draw=None)], sort_keys=True, default=str)
+    return 'dyn_dt:page:' + hashlib.md5(payload.encode()).hexdigest()
+
+def cached_datatables_response(aPath, meta, params):
+    """datatables_response() through the page cache, `draw` is echoed per request."""
+    if not DATATABLES_PAGE_TTL:
+        return datatables_response(aPath, meta, params)
+
+    key = page_cache_key(aPath, meta, params)
+    response = cache.get(key)
+    if response is None:
+        response = datatables_response(aPath, meta, params)
+        cache.set(key, response, DATATABLES_PAGE_TTL)
+
+    if table_option(aPath, 'prefetch', False) and params['length']:
+        following = dict(params, start=params['start'] + params['length'])
+        if following['start'] < response['recordsFiltered']:
+            schedule_prefetch(aPath, meta, following)
+    return dict(response, draw=params['draw'])
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix='dyn_dt_prefetch')
+        return _executor
+
+def prefetch_page(aPath, meta, params, key, threaded=False):
+    try:
+        if cache.get(key) is None:
+            cache.set(key, datatables_response(aPath, meta, params), DATATABLES_PAGE_TTL)
+    finally:
+        cache.delete(key + ':prefetch')
+        if threaded:
+            connection.close()
+
+def schedule_prefetch(aPath, meta, params):
+    """Computes the page of `params` into the cache, unless cached or already on its way."""
+    key = page_cache_key(aPath, meta, params)
+    if cache.get(key) is not None or not cache.add(key + ':prefetch', True, DATATABLES_PAGE_TTL):
+        return None
+
+    # Read per call, tests turn the thread off
+    if getattr(settings, 'DYNAMIC_DATATB_PREFETCH_THREADED', True):
+        return get_executor().submit(prefetch_page, aPath, meta, params, key, True)
+    prefetch_page(aPath, meta, params, key)
@@ -0,0 +1,203 @@
+import csv, json, zlib
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+
+from apps.dyn_dt.fk_choices import fk_labels
+from apps.dyn_dt.registry import table_settings
+from apps.dyn_dt.utils import model_filter_string, search_filter, visible_fields
+from cli import get_model_fk
+
+# Rows fetched per round trip (server-side cursor on PostgreSQL)
+EXPORT_CHUNK = getattr(settings, 'DYNAMIC_DATATB_EXPORT_CHUNK', 2000)
+
+EXPORT_FORMATS = {
+    # format -> (content type, file extension)
+    'csv'    : ('text/csv', 'csv'),
+    'ndjson' : ('application/x-ndjson', 'ndjson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+class ExportError(Exception):
+    pass
+
+class Echo:
+    """File-like object that hands back what is written (see csv streaming docs)."""
+    def write(self, value):
+        return value
+
+def export_chunks(queryset, aModelClass, fields, fk_fields, chunk_size=EXPORT_CHUNK):
+    """Yields lists of row tuples for `fields`, `chunk_size` rows at a time.
+
+    Only the exported columns are fetched (values_list). FK columns are
+    turned into labels with one lookup per FK model and chunk.
+    """
+    columns = [aModelClass._meta.get_field(f).attname for f in fields]
+    fk_index = [(i, aModelClass._meta.get_field(f).related_model) for i, f in enumerate(fields) if f in fk_fields]
+
+    chunk = []
+    for row in queryset.values_list(*columns).iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield resolve_fk_labels(chunk, fk_index)
+            chunk = []
+    if chunk:
+        yield resolve_fk_labels(chunk, fk_index)
+
+def resolve_fk_labels(chunk, fk_index):
+    if not fk_index:
+        return chunk
+
+    rows = [list(row) for row in chunk]
+    for i, related in fk_index:
+        labels = fk_labels(related, [row[i] for row in rows])
+        for row in rows:
+            row[i] = labels.get(row[i], '')
+    return rows
+
+def stream_csv(chunks, fields):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for chunk in chunks:
+        yield ''.join(writer.writerow(row) for row in chunk)
+
+def stream_ndjson(chunks, fields):
+    encoder = DjangoJSONEncoder()
+    for chunk in chunks:
+        yield ''.join(encoder.encode(dict(zip(fields, row))) + '\n' for row in chunk)
+
+def parquet_schema(aModelClass, fields, fk_fields):
+    import pyarrow as pa
+
+    types = []
+    for name in fields:
+        field = aModelClass._meta.get_field(name)
+        if name in fk_fields:
+            dtype = pa.string()
+        elif isinstance(field, models.BooleanField):
+            dtype = pa.bool_()
+        elif isinstance(field, (models.IntegerField, models.AutoField)):
+            dtype = pa.int64()
+        elif isinstance(field, models.FloatField):
+            dtype = pa.float64()
+        elif isinstance(field, models.DateTimeField):
+            dtype = pa.timestamp('us', tz='UTC') if settings.USE_TZ else pa.timestamp('us')
+        elif isinstance(field, models.DateField):
+            dtype = pa.date32()
+        else:
+            dtype = pa.string()
+        types.append(pa.field(name, dtype))
+    return pa.schema(types)
+
+class Drain:
+    """Write-only sink whose content is taken out after every row group."""
+    def __init__(self):
+        self.parts = []
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+def stream_parquet(chunks, fields, schema):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    string_columns = {f.name for f in schema if pa.types.is_string(f.type)}
+    sink = Drain()
+    writer = pq.ParquetWriter(sink, schema)
+    for chunk in chunks:
+        columns = list(zip(*chunk))
+        arrays = {}
+        for i, name in enumerate(fields):
+            values = columns[i]
+            if name in string_columns:
+                values = [None if v is None else str(v) for v in values]
+            arrays[name] = values
+        writer.write_table(pa.table(arrays, schema=schema))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+def gzip_stream(stream):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for part in stream:
+        if isinstance(part, str):
+            part = part.encode()
+        data = compressor.compress(part)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def count_rows(chunks, progress):
+    for chunk in chunks:
+        yield chunk
+        progress(len(chunk))
+
+def export_stream(fmt, queryset, aModelClass, fields, fk_fields, compress=False, chunk_size=EXPORT_CHUNK, progress=None):
+    """Returns the content iterator for an export, rows are never all in memory.
+
+    `progress(rows)` is called after every chunk has been written.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError('Unsupported export format: ' + fmt)
+
+    if fmt == 'parquet':
+        try:
+            schema = parquet_schema(aModelClass, fields, fk_fields)
+        except ImportError:
+            raise ExportError('Parquet exports require the pyarrow package')
+
+    chunks = export_chunks(queryset, aModelClass, fields, fk_fields, chunk_size)
+    if progress:
+        chunks = count_rows(chunks, progress)
+    if fmt == 'csv':
+        stream = stream_csv(chunks, fields)
+    elif fmt == 'ndjson':
+        stream = stream_ndjson(chunks, fields)
+    else:
+        stream = stream_parquet(chunks, fields, schema)
+
+    if compress:
+        stream = gzip_stream(stream)
+    return stream
+
+def export_params(request, aPath, aModelClass):
+    """Everything an export depends on, as plain JSON data (see jobs)."""
+    db_field_names = [field.name for field in aModelClass._meta.fields]
+
+    # The columns shown in the table, in model order
+    table = table_settings(aPath)
+    fields = visible_fields(table.field_names(db_field_names), db_field_names)
+
+    order_by = request.GET.get('order_by', 'id')
+    if order_by not in db_field_names:
+        order_by = 'id'
+
+    return {
+        'fields': fields,
+        'filter_string': model_filter_string(table.filters, db_field_names, aModelClass),
+        'search': request.GET.get('search', ''),
+        'order_by': order_by,
+        'format': request.GET.get('format', 'csv'),
+        'compress': request.GET.get('compress') == 'gzip',
+    }
+
+def export_queryset(aModelClass, params, aPath=None):
+    db_field_names = [field.name for field in aModelClass._meta.fields]
+    fk_fields = get_model_fk(aModelClass)
+
+    queryset = aModelClass.objects.filter(**params['filter_string']).order_by(params['order_by'], 'pk')
+    return search_filter(queryset, params['search'], db_field_names, fk_fields.keys(), aPath)
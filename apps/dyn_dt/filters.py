@@ -0,0 +1,157 @@
+"""
+Typed ModelFilter operators.
+
+Each saved filter has an operator; the ones offered for a column depend on
+its type, and the lookups built for them are the ones an index can serve:
+equality on numbers, FKs and choices, ranges on dates, prefix matches on
+indexed text columns. Lookup values stay strings / booleans, so the
+result can be stored in JSON (export jobs) and hashed into cache keys.
+"""
+
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, models
+from django.utils import timezone
+
+from apps.common.fields import is_indexed, is_text, is_number
+
+OP_CONTAINS = 'contains'
+OP_EQ       = 'eq'
+OP_IN       = 'in'
+OP_RANGE    = 'range'
+OP_PREFIX   = 'prefix'
+OP_ISNULL   = 'isnull'
+
+OPERATORS = (
+    (OP_CONTAINS, 'contains'),
+    (OP_EQ      , 'equals'),
+    (OP_IN      , 'in (a, b, ...)'),
+    (OP_RANGE   , 'between (a..b)'),
+    (OP_PREFIX  , 'starts with'),
+    (OP_ISNULL  , 'is empty (true / false)'),
+)
+
+RANGE_SEPARATOR = '..'
+TRUE_VALUES  = ('', 'true', '1', 'yes')
+FALSE_VALUES = ('false', '0', 'no')
+
+def field_operators(field):
+    """The operators offered for a column, the default one first."""
+    null = [OP_ISNULL] if field.null else []
+    if field.is_relation:
+        return [OP_EQ, OP_IN] + null
+    if field.choices:
+        return [OP_EQ, OP_IN] + null
+    if isinstance(field, models.BooleanField):
+        return [OP_EQ] + null
+    if is_number(field):
+        return [OP_EQ, OP_IN, OP_RANGE, OP_CONTAINS] + null
+    if isinstance(field, models.DateField):
+        return [OP_RANGE, OP_EQ, OP_CONTAINS] + null
+    if is_text(field) and is_indexed(field):
+        return [OP_PREFIX, OP_EQ, OP_IN, OP_CONTAINS] + null
+    return [OP_CONTAINS, OP_PREFIX, OP_EQ, OP_IN] + null
+
+def default_operator(field):
+    return field_operators(field)[0]
+
+def split_list(value):
+    return [v.strip() for v in value.split(',') if v.strip()]
+
+def split_range(value):
+    separator = RANGE_SEPARATOR if RANGE_SEPARATOR in value else ','
+    parts = [v.strip() for v in value.split(separator)]
+    if len(parts) != 2 or not any(parts):
+        raise ValidationError(f'Expected a range: a{RANGE_SEPARATOR}b (either end may be left out)')
+    return parts
+
+def clean(field, value):
+    """Validates `value` for `field`, returns it in a JSON friendly form."""
+    target = field.target_field if field.is_relation else field
+    value = target.to_python(value)
+    if value is None:
+        raise ValidationError('A value is required')
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+def day_bounds(field, value):
+    """[start, end) of the days `value` covers, for date or datetime columns."""
+    day = models.DateField().to_python(value)
+    if not isinstance(field, models.DateTimeField):
+        return day.isoformat(), (day + timedelta(days=1)).isoformat()
+    start = datetime.combine(day, time.min)
+    if settings.USE_TZ:
+        start = timezone.make_aware(start)
+    return start.isoformat(), (start + timedelta(days=1)).isoformat()
+
+def is_date_only(field, value):
+    return isinstance(field, models.DateTimeField) and len(value.strip()) == 10
+
+def field_lookups(field, operator, value):
+    """ORM lookups for one filter, raises ValidationError for bad values."""
+    name = field.attname if field.is_relation else field.name
+    value = (value or '').strip()
+
+    if operator == OP_ISNULL:
+        if value.lower() not in TRUE_VALUES + FALSE_VALUES:
+            raise ValidationError('Expected true or false')
+        return {f'{name}__isnull': value.lower() in TRUE_VALUES}
+
+    if operator == OP_CONTAINS:
+        return {f'{name}__icontains': value}
+
+    if operator == OP_PREFIX:
+        # Case sensitive LIKE 'x%' can use a btree index on PostgreSQL
+        # (Django adds a pattern_ops index for indexed char columns)
+        lookup = 'startswith' if is_indexed(field) and connection.vendor == 'postgresql' else 'istartswith'
+        return {f'{name}__{lookup}': value}
+
+    if operator == OP_EQ:
+        if isinstance(field, models.DateTimeField) and is_date_only(field, value):
+            start, end = day_bounds(field, value)
+            return {f'{name}__gte': start, f'{name}__lt': end}
+        if isinstance(field, models.BooleanField):
+            if value.lower() not in TRUE_VALUES[1:] + FALSE_VALUES:
+                raise ValidationError('Expected true or false')
+            return {name: value.lower() in TRUE_VALUES}
+        return {name: clean(field, value)}
+
+    if operator == OP_IN:
+        values = [clean(field, v) for v in split_list(value)]
+        if not values:
+            raise ValidationError('Expected a comma separated list')
+        return {f'{name}__in': values}
+
+    if operator == OP_RANGE:
+        low, high = split_range(value)
+        lookups = {}
+        if isinstance(field, models.DateField) and (not low or len(low) == 10) and (not high or len(high) == 10):
+            if low:
+                lookups[f'{name}__gte'] = day_bounds(field, low)[0]
+            if high:
+                lookups[f'{name}__lt'] = day_bounds(field, high)[1]
+            return lookups
+        if low:
+            lookups[f'{name}__gte'] = clean(field, low)
+        if high:
+            lookups[f'{name}__lte'] = clean(field, high)
+        return lookups
+
+    raise ValidationError('Unknown operator: ' + str(operator))
+
+def filter_lookups(aModelClass, filter_instance, db_fields):
+    """Returns (lookups, errors) for the saved filters of a table."""
+    lookups, errors = {}, {}
+    for filter_data in filter_instance:
+        if filter_data.key not in db_fields:
+            continue
+        field = aModelClass._meta.get_field(filter_data.key)
+        operator = filter_data.operator or default_operator(field)
+        if operator not in field_operators(field):
+            operator = default_operator(field)
+        try:
+            lookups.update(field_lookups(field, operator, filter_data.value))
+        except ValidationError as e:
+            errors[filter_data.key] = ' '.join(e.messages)
+    return lookups, errors
@@ -0,0 +1,96 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models
+from django.db.models import Q
+
+# FK choices are served page by page (type-ahead), never as a whole table
+FK_CHOICES_LIMIT     = getattr(settings, 'DYNAMIC_DATATB_FK_LIMIT'    , 20)
+FK_CHOICES_LIMIT_MAX = getattr(settings, 'DYNAMIC_DATATB_FK_LIMIT_MAX', 100)
+FK_LABEL_TTL         = getattr(settings, 'DYNAMIC_DATATB_FK_LABEL_TTL', 600)
+
+def label_version_key(aModelClass):
+    return f'dyn_dt:fk:{aModelClass._meta.label_lower}:version'
+
+def label_version(aModelClass):
+    """Part of the label keys of a model, bumped to drop all of them at once."""
+    key = label_version_key(aModelClass)
+    version = cache.get(key)
+    if version is None:
+        # seeded with the clock, a lost counter never repeats a value
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+def bump_label_version(aModelClass):
+    try:
+        cache.incr(label_version_key(aModelClass))
+    except ValueError:
+        label_version(aModelClass)
+
+def fk_label_key(aModelClass, pk, version=None):
+    if version is None:
+        version = label_version(aModelClass)
+    return f'dyn_dt:fk:{aModelClass._meta.label_lower}:{version}:{pk}'
+
+def fk_labels(aModelClass, ids):
+    """Returns {pk: label} for `ids`, with one query for the cache misses."""
+    ids = {pk for pk in ids if pk is not None}
+    if not ids:
+        return {}
+
+    version = label_version(aModelClass)
+    keys    = {fk_label_key(aModelClass, pk, version): pk for pk in ids}
+    cached  = cache.get_many(list(keys.keys()))
+    labels  = {keys[key]: label for key, label in cached.items()}
+
+    missing = ids - labels.keys()
+    if missing:
+        fetched = {pk: str(obj) for pk, obj in aModelClass.objects.in_bulk(list(missing)).items()}
+        cache.set_many({fk_label_key(aModelClass, pk, version): label for pk, label in fetched.items()}, FK_LABEL_TTL)
+        labels.update(fetched)
+
+    return labels
+
+def invalidate_fk_label(sender, instance, **kwargs):
+    cache.delete(fk_label_key(sender, instance.pk))
+
+def invalidate_fk_labels(aModelClass, pks=None):
+    """Drops the cached labels of `pks`, of every row when None."""
+    if pks is None:
+        bump_label_version(aModelClass)
+        return
+    version = label_version(aModelClass)
+    cache.delete_many([fk_label_key(aModelClass, pk, version) for pk in pks])
+
+def fk_search_fields(aModelClass):
+    return [
+        field.name for field in aModelClass._meta.fields
+        if isinstance(field, (models.CharField, models.TextField))
+    ]
+
+def fk_choices(aModelClass, q='', ids=None, limit=FK_CHOICES_LIMIT):
+    """Returns (results, more) for a type-ahead over the related model.
+
+    `ids` resolves the labels of known keys; `q` matches the text columns
+    of the related model (or the primary key for numeric input).
+    """
+    if ids:
+        labels = fk_labels(aModelClass, ids)
+        return [{'id': pk, 'text': labels[pk]} for pk in ids if pk in labels], False
+
+    queryset = aModelClass.objects.all()
+    if q:
+        search = Q()
+        for name in fk_search_fields(aModelClass):
+            search |= Q(**{f'{name}__icontains': q})
+        if q.isdigit():
+            search |= Q(pk=int(q))
+        queryset = queryset.filter(search)
+
+    rows = list(queryset.order_by('pk')[:limit + 1])
+    results = [{'id': obj.pk, 'text': str(obj)} for obj in rows[:limit]]
+    version = label_version(aModelClass)
+    cache.set_many({fk_label_key(aModelClass, r['id'], version): r['text'] for r in results}, FK_LABEL_TTL)
+    return results, len(rows) > limit
@@ -0,0 +1,238 @@
+"""
+Background export jobs for dyn_dt.
+
+Jobs are queued in the ExportJob table (no broker needed) and executed
+by a thread pool, in-process or through the `dyn_dt_export_worker`
+command. Finished files live under MEDIA_ROOT and are served with HTTP
+Range support, so interrupted downloads can resume.
+"""
+
+import hashlib, json, logging, os, re, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+
+from apps.dyn_dt.exports import export_stream, export_queryset, EXPORT_FORMATS
+from apps.dyn_dt.models import ExportJob
+from apps.dyn_dt.versions import table_version
+from cli import name_to_class, get_model_fk
+
+logger = logging.getLogger(__name__)
+
+EXPORT_DIR       = getattr(settings, 'DYNAMIC_DATATB_EXPORT_DIR'      , os.path.join('dyn_dt', 'exports'))
+EXPORT_REUSE     = getattr(settings, 'DYNAMIC_DATATB_EXPORT_REUSE'    , 3600)   # seconds an artifact is reused
+EXPORT_RETENTION = getattr(settings, 'DYNAMIC_DATATB_EXPORT_RETENTION', 86400)  # seconds before files are purged
+EXPORT_LEASE     = getattr(settings, 'DYNAMIC_DATATB_EXPORT_LEASE'    , 300)    # silent running jobs are reclaimed
+EXPORT_WORKERS   = getattr(settings, 'DYNAMIC_DATATB_EXPORT_WORKERS'  , 2)
+EXPORT_ATTEMPTS  = getattr(settings, 'DYNAMIC_DATATB_EXPORT_ATTEMPTS' , 3)      # claims before a job is failed
+EXPORT_PURGE     = getattr(settings, 'DYNAMIC_DATATB_EXPORT_PURGE'    , 3600)   # seconds between in-process purges
+
+RANGE_BLOCK = 64 * 1024
+RANGE_RE    = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+_executor = None
+_executor_lock = threading.Lock()
+_last_purge = [0.0]
+
+def params_hash(aPath, params, version=None):
+    payload = json.dumps([aPath.lower(), params, version], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def job_abspath(job):
+    return os.path.join(settings.MEDIA_ROOT, job.file_path)
+
+def job_content_type(job):
+    if job.params.get('compress'):
+        return 'application/gzip'
+    return EXPORT_FORMATS[job.params['format']][0]
+
+def enqueue_export(aPath, params):
+    """Returns (job, created); identical recent exports of unchanged data are reused."""
+    digest = params_hash(aPath, params, table_version(aPath))
+    since  = timezone.now() - timedelta(seconds=EXPORT_REUSE)
+
+    recent = ExportJob.objects.filter(
+        params_hash=digest,
+        status__in=[ExportJob.STATUS_PENDING, ExportJob.STATUS_RUNNING, ExportJob.STATUS_DONE],
+        created_at__gte=since,
+    )
+    for job in recent:
+        if job.status != ExportJob.STATUS_DONE or os.path.exists(job_abspath(job)):
+            return job, False
+
+    job = ExportJob.objects.create(parent=aPath.lower(), params=params, params_hash=digest)
+
+    # Read per call, tests and dedicated worker setups turn it off
+    if getattr(settings, 'DYNAMIC_DATATB_EXPORT_INPROCESS', True):
+        transaction.on_commit(kick_worker)
+    return job, True
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix='dyn_dt_export')
+        return _executor
+
+def kick_worker():
+    get_executor().submit(run_in_process)
+
+def run_in_process():
+    """The in-process worker: drains the queue and purges expired exports at most every EXPORT_PURGE seconds."""
+    try:
+        run_pending_jobs()
+        if time.monotonic() - _last_purge[0] >= EXPORT_PURGE:
+            _last_purge[0] = time.monotonic()
+            purge_expired_exports()
+    finally:
+        if threading.current_thread() is not threading.main_thread():
+            connection.close()
+
+def claimable():
+    stale = timezone.now() - timedelta(seconds=EXPORT_LEASE)
+    return Q(status=ExportJob.STATUS_PENDING) | Q(status=ExportJob.STATUS_RUNNING, heartbeat_at__lt=stale)
+
+def fail_job(job, error):
+    ExportJob.objects.filter(pk=job.pk).update(
+        status=ExportJob.STATUS_FAILED, error=error, finished_at=timezone.now())
+
+def claim_next_job():
+    """Atomically moves the oldest claimable job to 'running'.
+
+    Jobs that were claimed EXPORT_ATTEMPTS times (their worker died each
+    time) are failed instead of being claimed again.
+    """
+    ExportJob.objects.filter(claimable(), attempts__gte=EXPORT_ATTEMPTS).update(
+        status=ExportJob.STATUS_FAILED, error=f'Export abandoned after {EXPORT_ATTEMPTS} attempts',
+        finished_at=timezone.now())
+
+    for pk in ExportJob.objects.filter(claimable()).order_by('created_at').values_list('pk', flat=True)[:5]:
+        now = timezone.now()
+        claimed = ExportJob.objects.filter(claimable(), pk=pk, attempts__lt=EXPORT_ATTEMPTS).update(
+            status=ExportJob.STATUS_RUNNING, started_at=now, heartbeat_at=now, rows_done=0, error='',
+            attempts=F('attempts') + 1)
+        if claimed:
+            return ExportJob.objects.get(pk=pk)
+    return None
+
+def run_pending_jobs():
+    """Runs jobs until the queue is empty; safe to call from many threads."""
+    try:
+        while True:
+            job = claim_next_job()
+            if not job:
+                return
+            try:
+                run_export_job(job)
+            except Exception as e:
+                logger.exception('dyn_dt export #%s failed', job.pk)
+                fail_job(job, str(e) or e.__class__.__name__)
+    finally:
+        if threading.current_thread() is not threading.main_thread():
+            connection.close()
+
+def run_export_job(job):
+    """Writes the export of `job`; any error marks the job failed."""
+    aModelClass = name_to_class(settings.DYNAMIC_DATATB.get(job.parent, ''))
+    if not aModelClass:
+        fail_job(job, 'Unknown model path: ' + job.parent)
+        return
+
+    try:
+        file_path, abs_path, rows = write_export(job, aModelClass)
+    except Exception as e:
+        fail_job(job, str(e) or e.__class__.__name__)
+        return
+
+    ExportJob.objects.filter(pk=job.pk).update(
+        status=ExportJob.STATUS_DONE, file_path=file_path, size=os.path.getsize(abs_path),
+        rows_done=rows, finished_at=timezone.now())
+
+def write_export(job, aModelClass):
+    params    = job.params
+    fk_fields = get_model_fk(aModelClass)
+    queryset  = export_queryset(aModelClass, params, job.parent)
+    ExportJob.objects.filter(pk=job.pk).update(rows_total=queryset.count())
+
+    extension = EXPORT_FORMATS[params['format']][1] + ('.gz' if params['compress'] else '')
+    file_path = os.path.join(EXPORT_DIR, f'{job.parent}-{job.params_hash[:16]}-{job.pk}.{extension}')
+    abs_path  = os.path.join(settings.MEDIA_ROOT, file_path)
+    os.makedirs(os.path.dirname(abs_path), exist_ok=True)
+
+    done = [0]
+    def progress(rows):
+        done[0] += rows
+        ExportJob.objects.filter(pk=job.pk).update(rows_done=done[0], heartbeat_at=timezone.now())
+
+    stream = export_stream(params['format'], queryset, aModelClass, params['fields'], fk_fields.keys(),
+                           params['compress'], progress=progress)
+    try:
+        with open(abs_path + '.part', 'wb') as out:
+            for part in stream:
+                out.write(part.encode() if isinstance(part, str) else part)
+        os.replace(abs_path + '.part', abs_path)
+    except Exception:
+        if os.path.exists(abs_path + '.part'):
+            os.remove(abs_path + '.part')
+        raise
+    return file_path, abs_path, done[0]
+
+def purge_expired_exports():
+    """Deletes finished jobs (and their files) older than the retention."""
+    since = timezone.now() - timedelta(seconds=EXPORT_RETENTION)
+    expired = ExportJob.objects.filter(
+        status__in=[ExportJob.STATUS_DONE, ExportJob.STATUS_FAILED], created_at__lt=since)
+    for job in expired:
+        if job.file_path and os.path.exists(job_abspath(job)):
+            os.remove(job_abspath(job))
+    return expired.delete()[0]
+
+def read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(RANGE_BLOCK, length))
+            if not data:
+                return
+            length -= len(data)
+            yield data
+
+def artifact_response(request, job):
+    """Serves a finished export, honouring single `Range: bytes=` requests."""
+    path = job_abspath(job)
+    size = os.path.getsize(path)
+    etag = f'"{job.params_hash[:16]}-{job.pk}-{size}"'
+
+    start, end, status = 0, size - 1, 200
+    range_header = request.META.get('HTTP_RANGE', '').strip()
+    if_range     = request.META.get('HTTP_IF_RANGE')
+
+    # Multi-range or malformed headers are ignored: the full file is sent
+    match = RANGE_RE.match(range_header) if range_header else None
+    if match and (match.group(1) or match.group(2)) and (not if_range or if_range == etag):
+        if match.group(1):
+            start = int(match.group(1))
+            end   = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+        else:
+            start = max(size - int(match.group(2)), 0)
+
+        if start >= size or start > end:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        status = 206
+
+    length = end - start + 1 if size else 0
+    response = StreamingHttpResponse(read_range(path, start, length), status=status, content_type=job_content_type(job))
+    response['Content-Length'] = str(length)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Content-Disposition'] = f'attachment; filename="{os.path.basename(job.file_path)}"'
+    if status == 206:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
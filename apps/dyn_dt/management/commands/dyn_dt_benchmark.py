@@ -0,0 +1,156 @@
+import statistics, time, tracemalloc
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory, override_settings
+
+from apps.dyn_dt import views
+from apps.dyn_dt.pagination import encode_cursor
+from apps.dyn_dt.search import build_search_index, SEARCH_BACKENDS
+from apps.common.testing import seed_rows
+from cli import name_to_class
+
+
+class Rollback(Exception):
+    """Raised to discard the rows seeded by a benchmark run."""
+
+
+class Command(BaseCommand):
+    help = 'Benchmark dyn_dt views against seeded tables (seeded rows are rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='product', help='DYNAMIC_DATATB slug to benchmark')
+        parser.add_argument('--rows', default=None, help='Comma separated row counts (default: 1000,10000,100000, up to 10^6 for aggregate)')
+        parser.add_argument('--repeat', type=int, default=5, help='Requests per measurement')
+        parser.add_argument('--scenario', default='page', choices=['page', 'deep', 'export', 'search', 'aggregate'], help='What to measure')
+
+    def handle(self, *args, **options):
+        aPath = options['path']
+        if aPath not in settings.DYNAMIC_DATATB.keys():
+            raise CommandError('Unknown DYNAMIC_DATATB path: ' + aPath)
+
+        self.aModelClass = name_to_class(settings.DYNAMIC_DATATB[aPath])
+        rows = options['rows'] or ('10000,100000,1000000' if options['scenario'] == 'aggregate' else '1000,10000,100000')
+        row_counts = [int(r) for r in rows.split(',')]
+
+        try:
+            with transaction.atomic():
+                seeded = 0
+                for count in row_counts:
+                    seed_rows(self.aModelClass, count - seeded)
+                    seeded = count
+                    getattr(self, 'bench_' + options['scenario'])(aPath, count, options['repeat'])
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def time_view(self, aPath, params, repeat):
+        factory = RequestFactory()
+        timings = []
+        for _ in range(repeat):
+            cache.clear()
+            request = factory.get('/dynamic-dt/' + aPath + '/', params)
+            request.user = AnonymousUser()
+            start = time.perf_counter()
+            views.model_dt(request, aPath)
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings), max(timings)
+
+    def save_and_commit(self, row):
+        # The seeded rows are rolled back at the end, so nothing commits:
+        # the on_commit handlers registered by the save are run here
+        pending = len(connection.run_on_commit)
+        with transaction.atomic():
+            row.save()
+        handlers = connection.run_on_commit[pending:]
+        del connection.run_on_commit[pending:]
+        for _, handler, _ in handlers:
+            handler()
+
+    def bench_page(self, aPath, count, repeat):
+        median, worst = self.time_view(aPath, {}, repeat)
+        self.stdout.write(f'page rows={count:>9} median={median:8.2f}ms max={worst:8.2f}ms')
+
+    def bench_deep(self, aPath, count, repeat):
+        # Last page of the table, reached by OFFSET and by a seek cursor
+        per_page = 25
+        pks = self.aModelClass.objects.order_by('pk').values_list('pk', flat=True)
+        anchor = pks[max(count - per_page - 1, 0)]
+
+        with override_settings(DYNAMIC_DATATB_OPTIONS={aPath: {'pagination': 'page'}}):
+            first, _ = self.time_view(aPath, {}, repeat)
+            deep, _  = self.time_view(aPath, {'page': max(count // per_page, 1)}, repeat)
+        self.stdout.write(f'offset rows={count:>9} first={first:8.2f}ms last={deep:8.2f}ms')
+
+        with override_settings(DYNAMIC_DATATB_OPTIONS={aPath: {'pagination': 'keyset', 'count': None}}):
+            first, _ = self.time_view(aPath, {}, repeat)
+            deep, _  = self.time_view(aPath, {'cursor': encode_cursor('id', anchor, anchor, 'next')}, repeat)
+        self.stdout.write(f'keyset rows={count:>9} first={first:8.2f}ms last={deep:8.2f}ms')
+
+    def bench_export(self, aPath, count, repeat):
+        # Rows per second and peak Python heap for every export format
+        factory = RequestFactory()
+        formats = [('csv', {}), ('csv.gz', {'compress': 'gzip'}), ('ndjson', {'format': 'ndjson'}), ('parquet', {'format': 'parquet'})]
+        for label, params in formats:
+            cache.clear()
+            request = factory.get('/export-csv/' + aPath + '/', params)
+            request.user = AnonymousUser()
+
+            tracemalloc.start()
+            start = time.perf_counter()
+            response = views.ExportCSVView.as_view()(request, aPath=aPath)
+            if not response.streaming:
+                tracemalloc.stop()
+                self.stdout.write(f'export {label:<8} rows={count:>9} skipped: {response.content.decode()}')
+                continue
+            size = sum(len(part) for part in response.streaming_content)
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            self.stdout.write(
+                f'export {label:<8} rows={count:>9} {count / elapsed:12.0f} rows/s '
+                f'size={size / 1024:10.1f}KB peak={peak / 1024 / 1024:7.2f}MB'
+            )
+
+    def bench_search(self, aPath, count, repeat):
+        # A text term and a numeric term through every backend this database supports
+        term = f'row-{count // 2}'
+        for backend in SEARCH_BACKENDS:
+            if backend != 'icontains' and not build_search_index(self.aModelClass, backend, rebuild=True):
+                continue
+            with override_settings(DYNAMIC_DATATB_OPTIONS={aPath: {'search': backend}}):
+                text, _   = self.time_view(aPath, {'search': term}, repeat)
+                number, _ = self.time_view(aPath, {'search': '42'}, repeat)
+            self.stdout.write(f'search {backend:<9} rows={count:>9} text={text:8.2f}ms number={number:8.2f}ms')
+
+    def bench_aggregate(self, aPath, count, repeat):
+        # Summary panel: computed (one aggregate() query), served from the
+        # cache, and kept current by a row update instead of a recompute
+        factory = RequestFactory()
+        url = '/dynamic-dt/' + aPath + '/aggregates/'
+
+        def request():
+            start = time.perf_counter()
+            views.model_aggregates(factory.get(url), aPath)
+            return (time.perf_counter() - start) * 1000
+
+        cold, warm, update = [], [], []
+        row = self.aModelClass.objects.order_by('pk').last()
+        for _ in range(repeat):
+            cache.clear()
+            cold.append(request())
+            warm.append(request())
+
+            start = time.perf_counter()
+            self.save_and_commit(row)
+            update.append((time.perf_counter() - start) * 1000)
+            warm.append(request())
+
+        self.stdout.write(
+            f'aggregate rows={count:>9} compute={statistics.median(cold):8.2f}ms '
+            f'cached={statistics.median(warm):8.2f}ms row update={statistics.median(update):8.2f}ms'
+        )
@@ -0,0 +1,32 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from apps.dyn_dt.jobs import run_pending_jobs, purge_expired_exports, EXPORT_WORKERS
+
+
+class Command(BaseCommand):
+    help = 'Run queued dyn_dt export jobs (DB-backed queue, no broker needed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=EXPORT_WORKERS, help='Jobs exported in parallel')
+        parser.add_argument('--poll', type=float, default=2.0, help='Seconds between queue polls')
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        self.stdout.write(f'Export worker started ({workers} threads)')
+
+        while True:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='dyn_dt_export') as pool:
+                for _ in range(workers):
+                    pool.submit(run_pending_jobs)
+
+            purged = purge_expired_exports()
+            if purged:
+                self.stdout.write(f'Purged {purged} expired export(s)')
+
+            if options['once']:
+                return
+            time.sleep(options['poll'])
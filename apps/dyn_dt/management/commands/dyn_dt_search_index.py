@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.dyn_dt.search import build_search_index, SEARCH_ICONTAINS
+from apps.dyn_dt.utils import table_option
+from cli import name_to_class
+
+
+class Command(BaseCommand):
+    help = 'Build the search indexes of the dyn_dt tables (see the "search" table option)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', action='append', help='DYNAMIC_DATATB slug, repeatable (default: all)')
+        parser.add_argument('--rebuild', action='store_true', help='Drop and refill FTS5 tables')
+
+    def handle(self, *args, **options):
+        paths = options['path'] or list(settings.DYNAMIC_DATATB.keys())
+        for aPath in paths:
+            if aPath not in settings.DYNAMIC_DATATB.keys():
+                raise CommandError('Unknown DYNAMIC_DATATB path: ' + aPath)
+
+            aModelClass = name_to_class(settings.DYNAMIC_DATATB[aPath])
+            backend = table_option(aPath, 'search', SEARCH_ICONTAINS)
+            if build_search_index(aModelClass, backend, rebuild=options['rebuild']):
+                self.stdout.write(f'{aPath}: {backend} index ready')
+            else:
+                self.stdout.write(f'{aPath}: no index for backend "{backend}" on this database')
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.9 on 2026-10-18 17:13
+
+from django.db import migrations, models
+
+
+def keep_contains(apps, schema_editor):
+    # Filters saved before operators existed were always icontains
+    apps.get_model('dyn_dt', 'ModelFilter').objects.update(operator='contains')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dyn_dt', '0002_exportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='modelfilter',
+            name='operator',
+            field=models.CharField(blank=True, choices=[('contains', 'contains'), ('eq', 'equals'), ('in', 'in (a, b, ...)'), ('range', 'between (a..b)'), ('prefix', 'starts with'), ('isnull', 'is empty (true / false)')], default='', max_length=16),
+        ),
+        migrations.RunPython(keep_contains, migrations.RunPython.noop),
+    ]
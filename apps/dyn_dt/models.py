@@ -1,6 +1,8 @@
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
+from apps.dyn_dt.filters import OPERATORS
+
 # Create your models here.
 
 class PageItems(models.Model):
@@ -19,6 +21,49 @@ class ModelFilter(models.Model):
 	parent = models.CharField(max_length=255, null=True, blank=True)
 	key = models.CharField(max_length=255)
 	value = models.CharField(max_length=255)
+	# Empty: the default operator of the column type (see filters.py)
+	operator = models.CharField(max_length=16, blank=True, default='', choices=OPERATORS)
+
+	def __str__(self):
+		return self.key
+
+class ExportJob(models.Model):
+	STATUS_PENDING = 'pending'
+	STATUS_RUNNING = 'running'
+	STATUS_DONE    = 'done'
+	STATUS_FAILED  = 'failed'
+	STATUS_CHOICES = (
+		(STATUS_PENDING, 'Pending'),
+		(STATUS_RUNNING, 'Running'),
+		(STATUS_DONE, 'Done'),
+		(STATUS_FAILED, 'Failed'),
+	)
+
+	parent = models.CharField(max_length=255)
+	params = models.JSONField(default=dict)
+	params_hash = models.CharField(max_length=64, db_index=True)
+	status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+	rows_total = models.BigIntegerField(null=True, blank=True)
+	rows_done = models.BigIntegerField(default=0)
+	attempts = models.PositiveIntegerField(default=0)
+	file_path = models.CharField(max_length=500, blank=True)
+	size = models.BigIntegerField(default=0)
+	error = models.TextField(blank=True)
+	created_at = models.DateTimeField(auto_now_add=True)
+	started_at = models.DateTimeField(null=True, blank=True)
+	heartbeat_at = models.DateTimeField(null=True, blank=True)
+	finished_at = models.DateTimeField(null=True, blank=True)
+
+	class Meta:
+		ordering = ['-created_at']
 
 	def __str__(self):
-		return self.key
\ No newline at end of file
+		return f'{self.parent} export #{self.pk} ({self.status})'
+
+	@property
+	def progress(self):
+		if self.status == self.STATUS_DONE:
+			return 100
+		if not self.rows_total:
+			return 0
+		return min(99, int(self.rows_done * 100 / self.rows_total))
@@ -0,0 +1,160 @@
+import base64, hashlib, json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import F, Q
+
+# Cached COUNT(*) lifetime, used by the 'approx' count mode
+COUNT_TTL = getattr(settings, 'DYNAMIC_DATATB_COUNT_TTL', 300)
+
+PAGINATION_PAGE   = 'page'    # Paginator: COUNT(*) + OFFSET
+PAGINATION_KEYSET = 'keyset'  # seek on (order_by, pk), opaque cursors
+
+COUNT_EXACT  = 'exact'
+COUNT_APPROX = 'approx'
+COUNT_NONE   = None
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(order_by, value, pk, direction):
+    payload = json.dumps({'o': order_by, 'v': value, 'pk': pk, 'd': direction}, cls=DjangoJSONEncoder)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, field):
+    """Returns (value, pk, direction) for a cursor built on `field`."""
+    try:
+        padded  = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if payload['o'] != field.name or payload['d'] not in ('next', 'prev'):
+            raise InvalidCursor('Cursor does not match the active ordering')
+        value = None if payload['v'] is None else field.to_python(payload['v'])
+        return value, payload['pk'], payload['d']
+    except InvalidCursor:
+        raise
+    except Exception as e:
+        raise InvalidCursor('Malformed cursor: ' + str(e))
+
+def seek_predicate(field, value, pk, direction):
+    """Rows strictly after (next) or before (prev) the (value, pk) position.
+
+    The sort is `field ASC NULLS FIRST, pk ASC`, so NULLs form the head of
+    the sequence on every backend.
+    """
+    name = field.name
+    if direction == 'next':
+        if value is None:
+            return Q(**{f'{name}__isnull': True, 'pk__gt': pk}) | Q(**{f'{name}__isnull': False})
+        return Q(**{f'{name}__gt': value}) | Q(**{name: value, 'pk__gt': pk})
+
+    if value is None:
+        return Q(**{f'{name}__isnull': True, 'pk__lt': pk})
+    return Q(**{f'{name}__lt': value}) | Q(**{name: value, 'pk__lt': pk}) | Q(**{f'{name}__isnull': True})
+
+def seek_ordering(field, direction):
+    if field.primary_key:
+        return ['pk'] if direction == 'next' else ['-pk']
+    if direction == 'next':
+        return [F(field.name).asc(nulls_first=True), 'pk']
+    return [F(field.name).desc(nulls_last=True), '-pk']
+
+def planner_estimate(aModelClass, using='default'):
+    """Row estimate from the planner statistics, None when not available."""
+    connection = connections[using]
+    table = aModelClass._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+            elif connection.vendor == 'mysql':
+                cursor.execute('SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s', [table])
+            else:
+                return None
+            row = cursor.fetchone()
+    except Exception:
+        return None
+
+    if not row or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+def approximate_count(queryset, cache_key):
+    """Planner estimate for unfiltered tables, otherwise a cached COUNT(*)."""
+    if not queryset.query.where:
+        estimate = planner_estimate(queryset.model, queryset.db)
+        if estimate is not None:
+            return estimate
+    return cache.get_or_set(cache_key, queryset.count, COUNT_TTL)
+
+class KeysetPage:
+    """Page of rows located by a seek predicate instead of an OFFSET.
+
+    Exposes the subset of the Paginator `Page` API used by the templates,
+    plus the `next_cursor` / `prev_cursor` tokens.
+    """
+    keyset = True
+
+    def __init__(self, object_list, has_next, has_previous, next_cursor, prev_cursor, count=None):
+        self.object_list  = object_list
+        self.next_cursor  = next_cursor
+        self.prev_cursor  = prev_cursor
+        self.count        = count
+        self._has_next     = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+def keyset_page(queryset, order_by, cursor, per_page, count_mode=COUNT_NONE, count_key=None):
+    """Returns the KeysetPage located by `cursor` (first page when empty).
+
+    Every page costs one indexed range scan of `per_page + 1` rows, whatever
+    its depth in the table.
+    """
+    field = queryset.model._meta.get_field(order_by)
+    filtered = queryset
+    direction = 'next'
+    if cursor:
+        value, pk, direction = decode_cursor(cursor, field)
+        queryset = queryset.filter(seek_predicate(field, value, pk, direction))
+
+    rows = list(queryset.order_by(*seek_ordering(field, direction))[:per_page + 1])
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if direction == 'next':
+        has_next, has_previous = has_more, bool(cursor)
+    else:
+        rows.reverse()
+        has_next, has_previous = True, has_more
+
+    next_cursor = prev_cursor = None
+    if rows and has_next:
+        next_cursor = encode_cursor(order_by, getattr(rows[-1], field.attname), rows[-1].pk, 'next')
+    if rows and has_previous:
+        prev_cursor = encode_cursor(order_by, getattr(rows[0], field.attname), rows[0].pk, 'prev')
+
+    count = None
+    if count_mode == COUNT_EXACT:
+        count = filtered.count()
+    elif count_mode == COUNT_APPROX:
+        count = approximate_count(filtered, count_key)
+    return KeysetPage(rows, has_next, has_previous, next_cursor, prev_cursor, count)
+
+def count_cache_key(aPath, filter_string, search):
+    filter_set = json.dumps([filter_string, search], sort_keys=True, default=str)
+    return f'dyn_dt:count:{aPath.lower()}:' + hashlib.md5(filter_set.encode()).hexdigest()
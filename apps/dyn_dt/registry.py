@@ -0,0 +1,102 @@
+"""
+Per-table metadata and settings for dyn_dt.
+
+TableMeta (field lists, choices, FK map) only depends on the model, so it
+is built once per process, at startup. TableSettings (hidden columns,
+saved filters, page size) lives in the cache and is dropped whenever one
+of its rows is saved or deleted, a page render reads it with a single
+cache lookup.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models
+
+from apps.dyn_dt.filters import field_operators, OPERATORS
+from apps.dyn_dt.models import ModelFilter, PageItems, HideShowFilter
+from cli import name_to_class, get_model_fk
+
+TABLE_SETTINGS_TTL = getattr(settings, 'DYNAMIC_DATATB_SETTINGS_TTL', 3600)
+
+_registry = {}
+
+def get_model_field_names(model, field_type):
+    """Returns a list of field names based on the given field type."""
+    return [
+        field.name for field in model._meta.get_fields()
+        if isinstance(field, field_type)
+    ]
+
+class TableMeta:
+    """Field metadata of a DYNAMIC_DATATB model."""
+
+    def __init__(self, aPath, aModelClass):
+        self.aPath = aPath
+        self.model = aModelClass
+        self.db_fields = [field.name for field in aModelClass._meta.fields]
+        self.fk_fields = get_model_fk(aModelClass)
+        self.db_filters = [f for f in self.db_fields if f not in self.fk_fields.keys()]
+        self.choices_dict = {field.name: field.choices for field in aModelClass._meta.fields if field.choices}
+
+        self.integer_fields = get_model_field_names(aModelClass, models.IntegerField)
+        self.date_time_fields = get_model_field_names(aModelClass, models.DateTimeField)
+        self.email_fields = get_model_field_names(aModelClass, models.EmailField)
+        self.text_fields = get_model_field_names(aModelClass, (models.TextField, models.CharField))
+
+        # {field: [(operator, label), ...]}, the default operator first
+        labels = dict(OPERATORS)
+        self.filter_operators = {
+            field.name: [(op, labels[op]) for op in field_operators(field)] for field in aModelClass._meta.fields
+        }
+
+def table_meta(aPath):
+    """The TableMeta of a DYNAMIC_DATATB slug, None for unknown slugs."""
+    aModelName = settings.DYNAMIC_DATATB.get(aPath)
+    if not aModelName:
+        return None
+
+    meta = _registry.get((aPath, aModelName))
+    if meta is None:
+        aModelClass = name_to_class(aModelName)
+        if not aModelClass:
+            return None
+        meta = _registry[(aPath, aModelName)] = TableMeta(aPath, aModelClass)
+    return meta
+
+def build_registry():
+    for aPath in settings.DYNAMIC_DATATB.keys():
+        table_meta(aPath)
+
+class TableSettings:
+    """The saved hide/show rows, filters and page size of one table."""
+
+    def __init__(self, parent, hide_show, filters, items_per_page):
+        self.parent = parent
+        self.hide_show = {row.key: row for row in hide_show}
+        self.filters = filters
+        self.items_per_page = items_per_page
+
+    def field_names(self, db_fields):
+        """One HideShowFilter per column; columns without a row are shown (unsaved)."""
+        return [self.hide_show.get(f) or HideShowFilter(parent=self.parent, key=f) for f in db_fields]
+
+def settings_cache_key(aPath):
+    return 'dyn_dt:settings:' + aPath.lower()
+
+def table_settings(aPath):
+    key = settings_cache_key(aPath)
+    table = cache.get(key)
+    if table is None:
+        parent = aPath.lower()
+        table = TableSettings(
+            parent,
+            list(HideShowFilter.objects.filter(parent=parent)),
+            list(ModelFilter.objects.filter(parent=parent)),
+            PageItems.objects.filter(parent=parent).values_list('items_per_page', flat=True).last(),
+        )
+        cache.set(key, table, TABLE_SETTINGS_TTL)
+    return table
+
+def invalidate_table_settings(sender, instance, **kwargs):
+    if instance.parent:
+        cache.delete(settings_cache_key(instance.parent))
@@ -0,0 +1,304 @@
+"""
+Search backends for dyn_dt tables.
+
+The search term is parsed once: numbers are matched with equality on the
+numeric columns, ISO dates (YYYY-MM-DD / YYYY-MM) with a range on the date
+columns, true/false on the boolean ones. Text columns go through the
+backend picked with the table's 'search' option:
+
+    'icontains' - OR'ed icontains (default, no index)
+    'fts5'      - SQLite FTS5 table per model, kept current by signals
+    'postgres'  - tsvector expression + GIN index (PostgreSQL)
+    'trigram'   - pg_trgm GIN index per text column (PostgreSQL)
+
+A backend that does not match the database vendor falls back to icontains.
+Indexes are built by the `dyn_dt_search_index` command; the FTS5 table is
+also created (and filled) on first use, and once it is known to exist no
+search or write looks it up again in this process.
+"""
+
+import re
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import connections, models, router, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+SEARCH_ICONTAINS = 'icontains'
+SEARCH_FTS5      = 'fts5'
+SEARCH_POSTGRES  = 'postgres'
+SEARCH_TRIGRAM   = 'trigram'
+
+SEARCH_BACKENDS = (SEARCH_ICONTAINS, SEARCH_FTS5, SEARCH_POSTGRES, SEARCH_TRIGRAM)
+
+BOOLEAN_TERMS = {'true': True, 'yes': True, 'false': False, 'no': False}
+MAX_NUMBER_EXPONENT = 30  # larger terms are no column value, and costly to convert
+TOKEN_RE      = re.compile(r'\w+')
+
+# (alias, database name, FTS5 table) known to exist, see fts5_exists()
+_fts5_tables = set()
+
+def text_fields(aModelClass):
+    """The Char/Text columns of a model, the ones a search index covers."""
+    return [
+        field for field in aModelClass._meta.fields
+        if isinstance(field, (models.CharField, models.TextField)) and not field.is_relation
+    ]
+
+def parse_number(value):
+    """A finite Decimal of reasonable magnitude, else None ('inf', 'NaN', '1e100000000')."""
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        return None
+    if not number.is_finite() or abs(number.adjusted()) > MAX_NUMBER_EXPONENT:
+        return None
+    return number
+
+def parse_span(value):
+    """Returns the [start, end) datetimes of an ISO day or month, else None."""
+    for fmt, unit in (('%Y-%m-%d', 'day'), ('%Y-%m', 'month')):
+        try:
+            start = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        if unit == 'day':
+            end = start + timedelta(days=1)
+        elif start.month == 12:
+            end = start.replace(year=start.year + 1, month=1)
+        else:
+            end = start.replace(month=start.month + 1)
+        return start, end
+    return None
+
+def typed_q(aModelClass, fields, fk_fields, value):
+    """Equality / range lookups on the non-text columns `value` parses as."""
+    number  = parse_number(value)
+    span    = parse_span(value)
+    boolean = BOOLEAN_TERMS.get(value.lower())
+    ops     = connections[router.db_for_read(aModelClass)].ops
+
+    search = Q()
+    for name in fields:
+        if name in fk_fields:
+            continue
+        field = aModelClass._meta.get_field(name)
+        if isinstance(field, models.BooleanField):
+            if boolean is not None:
+                search |= Q(**{name: boolean})
+        elif isinstance(field, (models.IntegerField, models.AutoField)):
+            if number is not None and number == number.to_integral_value():
+                # SQLite reports no range, its binds are 64-bit
+                low, high = ops.integer_field_range(field.get_internal_type())
+                low  = -2 ** 63 if low is None else low
+                high = 2 ** 63 - 1 if high is None else high
+                if low <= int(number) <= high:
+                    search |= Q(**{name: int(number)})
+        elif isinstance(field, models.DecimalField):
+            if number is not None and number.adjusted() < field.max_digits - field.decimal_places:
+                search |= Q(**{name: number})
+        elif isinstance(field, models.FloatField):
+            if number is not None:
+                search |= Q(**{name: float(number)})
+        elif isinstance(field, models.DateTimeField):
+            if span:
+                start, end = span
+                if settings.USE_TZ:
+                    start, end = timezone.make_aware(start), timezone.make_aware(end)
+                search |= Q(**{f'{name}__gte': start, f'{name}__lt': end})
+        elif isinstance(field, models.DateField):
+            if span:
+                search |= Q(**{f'{name}__gte': span[0].date(), f'{name}__lt': span[1].date()})
+    return search
+
+def icontains_q(columns, value):
+    search = Q()
+    for name in columns:
+        search |= Q(**{f'{name}__icontains': value})
+    return search
+
+# SQLite FTS5
+
+def fts_table(aModelClass):
+    return 'dyn_dt_fts_' + aModelClass._meta.db_table
+
+def fts5_query(value):
+    """Every word must match, as a prefix: 'foo ba' -> "foo"* "ba"*"""
+    return ' '.join(f'"{token}"*' for token in TOKEN_RE.findall(value))
+
+def fts5_key(aModelClass, using):
+    return using, connections[using].settings_dict['NAME'], fts_table(aModelClass)
+
+def remember_fts5(aModelClass, using):
+    # SQLite DDL is transactional: remembered once it is committed
+    key = fts5_key(aModelClass, using)
+    transaction.on_commit(lambda: _fts5_tables.add(key), using=using)
+
+def fts5_exists(aModelClass, using='default'):
+    """Whether the FTS5 table of a model exists; looked up once per process."""
+    if fts5_key(aModelClass, using) in _fts5_tables:
+        return True
+    with connections[using].cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [fts_table(aModelClass)])
+        exists = cursor.fetchone() is not None
+    if exists:
+        remember_fts5(aModelClass, using)
+    return exists
+
+def ensure_fts5_index(aModelClass, using='default', rebuild=False):
+    """Creates and fills the FTS5 table of a model when it is missing."""
+    connection = connections[using]
+    table   = fts_table(aModelClass)
+    qn      = connection.ops.quote_name
+    columns = ', '.join(qn(field.column) for field in text_fields(aModelClass))
+
+    if not rebuild and fts5_exists(aModelClass, using):
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {qn(table)}')
+        cursor.execute(f'CREATE VIRTUAL TABLE {qn(table)} USING fts5({columns})')
+        cursor.execute(
+            f'INSERT INTO {qn(table)} (rowid, {columns}) '
+            f'SELECT {qn(aModelClass._meta.pk.column)}, {columns} FROM {qn(aModelClass._meta.db_table)}'
+        )
+    remember_fts5(aModelClass, using)
+    return True
+
+def fts5_update(sender, instance, using='default', **kwargs):
+    """post_save: replaces the indexed text of one row."""
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or ensure_fts5_index(sender, using):
+        return
+
+    fields  = text_fields(sender)
+    table   = connection.ops.quote_name(fts_table(sender))
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE rowid = %s', [instance.pk])
+        cursor.execute(
+            f'INSERT INTO {table} (rowid, {columns}) VALUES (%s{", %s" * len(fields)})',
+            [instance.pk] + [field.value_from_object(instance) for field in fields],
+        )
+
+def fts5_delete(sender, instance, using='default', **kwargs):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    if fts5_exists(sender, using):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {connection.ops.quote_name(fts_table(sender))} WHERE rowid = %s', [instance.pk])
+
+def fts5_refresh(aModelClass, pks=None, using='default'):
+    """After bulk writes (no row signals): re-reads the indexed text of `pks`, every row when None."""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    if not fts5_exists(aModelClass, using):
+        return  # built, current, on first use
+    if pks is None:
+        ensure_fts5_index(aModelClass, using, rebuild=True)
+        return
+
+    qn      = connection.ops.quote_name
+    table   = qn(fts_table(aModelClass))
+    columns = ', '.join(qn(field.column) for field in text_fields(aModelClass))
+    pks     = list(pks)
+    with connection.cursor() as cursor:
+        for start in range(0, len(pks), 500):
+            chunk = pks[start:start + 500]
+            marks = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f'DELETE FROM {table} WHERE rowid IN ({marks})', chunk)
+            # deleted rows are not found again
+            cursor.execute(
+                f'INSERT INTO {table} (rowid, {columns}) '
+                f'SELECT {qn(aModelClass._meta.pk.column)}, {columns} FROM {qn(aModelClass._meta.db_table)} '
+                f'WHERE {qn(aModelClass._meta.pk.column)} IN ({marks})',
+                chunk,
+            )
+
+def fts5_q(aModelClass, value, using):
+    query = fts5_query(value)
+    if not query:
+        return Q()
+    ensure_fts5_index(aModelClass, using)
+    table = connections[using].ops.quote_name(fts_table(aModelClass))
+    return Q(pk__in=RawSQL(f'SELECT rowid FROM {table} WHERE {table} MATCH %s', [query]))
+
+# PostgreSQL
+
+def tsvector_sql(aModelClass, qualified=True):
+    """The document expression; the GIN index is built on the same one."""
+    qn = connections['default'].ops.quote_name
+    prefix = qn(aModelClass._meta.db_table) + '.' if qualified else ''
+    parts = [f"coalesce({prefix}{qn(field.column)}::text, '')" for field in text_fields(aModelClass)]
+    return "to_tsvector('simple', " + " || ' ' || ".join(parts) + ")"
+
+def tsquery(value):
+    return ' & '.join(f'{token}:*' for token in TOKEN_RE.findall(value))
+
+def postgres_q(aModelClass, value):
+    query = tsquery(value)
+    if not query:
+        return Q()
+    return Q(RawSQL(f"{tsvector_sql(aModelClass)} @@ to_tsquery('simple', %s)", [query],
+                    output_field=models.BooleanField()))
+
+def index_statements(aModelClass, backend):
+    """DDL for the PostgreSQL backends (FTS5 is handled by ensure_fts5_index)."""
+    qn = connections['default'].ops.quote_name
+    table = aModelClass._meta.db_table
+    if backend == SEARCH_POSTGRES:
+        return [
+            f'CREATE INDEX IF NOT EXISTS {qn("dyn_dt_fts_" + table)} ON {qn(table)} '
+            f'USING GIN (({tsvector_sql(aModelClass, qualified=False)}))'
+        ]
+    if backend == SEARCH_TRIGRAM:
+        # icontains compiles to UPPER(col::text) LIKE UPPER(%s), the index matches it
+        statements = ['CREATE EXTENSION IF NOT EXISTS pg_trgm']
+        for field in text_fields(aModelClass):
+            name = qn(f'dyn_dt_trgm_{table}_{field.column}'[:63])
+            statements.append(
+                f'CREATE INDEX IF NOT EXISTS {name} ON {qn(table)} '
+                f'USING GIN ((UPPER({qn(field.column)}::text)) gin_trgm_ops)'
+            )
+        return statements
+    return []
+
+def build_search_index(aModelClass, backend, using='default', rebuild=False):
+    """Creates the index `backend` needs; returns False when not applicable."""
+    vendor = connections[using].vendor
+    if backend == SEARCH_FTS5 and vendor == 'sqlite':
+        ensure_fts5_index(aModelClass, using, rebuild)
+        return True
+    if backend in (SEARCH_POSTGRES, SEARCH_TRIGRAM) and vendor == 'postgresql':
+        with connections[using].cursor() as cursor:
+            for statement in index_statements(aModelClass, backend):
+                cursor.execute(statement)
+        return True
+    return False
+
+def search_queryset(queryset, value, fields, fk_fields=[], backend=SEARCH_ICONTAINS):
+    """Filters `queryset` with the search term `value` (FK columns are skipped)."""
+    value = (value or '').strip()
+    if not value:
+        return queryset
+
+    aModelClass = queryset.model
+    vendor = connections[queryset.db].vendor
+    search = typed_q(aModelClass, fields, fk_fields, value)
+
+    text_columns = [f.name for f in text_fields(aModelClass) if f.name in fields and f.name not in fk_fields]
+    if text_columns:
+        if backend == SEARCH_FTS5 and vendor == 'sqlite':
+            search |= fts5_q(aModelClass, value, queryset.db)
+        elif backend == SEARCH_POSTGRES and vendor == 'postgresql':
+            search |= postgres_q(aModelClass, value)
+        else:
+            search |= icontains_q(text_columns, value)
+
+    if not search:
+        return queryset.none()
+    return queryset.filter(search)
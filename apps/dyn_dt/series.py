@@ -0,0 +1,44 @@
+import hashlib, json
+
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.common.versions import data_version
+
+# Column series are computed on demand (charts, summary widgets), never
+# as part of the table page, and only over a bounded window of rows.
+SERIES_WINDOW = getattr(settings, 'DYNAMIC_DATATB_SERIES_WINDOW', 1000)
+SERIES_CHUNK  = getattr(settings, 'DYNAMIC_DATATB_SERIES_CHUNK' , 500)
+SERIES_TTL    = getattr(settings, 'DYNAMIC_DATATB_SERIES_TTL'   , 300)
+
+def series_cache_key(aPath, field, filter_string, search, order_by, window, version=None):
+    """Cache key scoped to the model, its data version, the column and the active filter set."""
+    filter_set = json.dumps([filter_string, search, order_by, window, version], sort_keys=True, default=str)
+    digest = hashlib.md5(filter_set.encode()).hexdigest()
+    return f'dyn_dt:series:{aPath.lower()}:{field}:{digest}'
+
+def get_model_series(queryset, aPath, field, filter_string, search, order_by, window=SERIES_WINDOW):
+    """Returns the values of `field` over the first `window` rows of `queryset`.
+
+    Rows are streamed from the database in chunks, so memory is bounded by
+    the window and not by the table size. The result is cached per model,
+    column and filter set, until the next write to the model.
+    """
+    key = series_cache_key(aPath, field, filter_string, search, order_by, window, data_version(queryset.model))
+    series = cache.get(key)
+    if series is not None:
+        return series
+
+    values = []
+    rows = queryset.values_list(field, flat=True)[:window + 1]
+    for value in rows.iterator(chunk_size=SERIES_CHUNK):
+        values.append(value)
+
+    series = {
+        'field': field,
+        'values': values[:window],
+        'window': window,
+        'truncated': len(values) > window,
+    }
+    cache.set(key, series, SERIES_TTL)
+    return series
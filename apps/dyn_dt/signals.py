@@ -0,0 +1,87 @@
+from django.conf import settings
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+
+from apps.common.signals import rows_changed
+from apps.common.versions import bump_model_version
+from apps.dyn_dt.aggregates import aggregate_fields, aggregates_pre_save, aggregates_post_save, aggregates_pre_delete, aggregates_post_delete, invalidate_aggregates
+
+from apps.dyn_dt.fk_choices import invalidate_fk_label, invalidate_fk_labels
+from apps.dyn_dt.models import ModelFilter, PageItems, HideShowFilter
+from apps.dyn_dt.registry import invalidate_table_settings, table_meta
+from apps.dyn_dt.search import fts5_update, fts5_delete, fts5_refresh, SEARCH_FTS5
+from apps.dyn_dt.utils import table_option
+from apps.dyn_dt.versions import bump_settings_version
+from cli import name_to_class, get_model_fk
+
+def connect_fk_label_signals():
+    """Drops cached FK labels when a row of a FK target model changes."""
+    for aModelName in settings.DYNAMIC_DATATB.values():
+        aModelClass = name_to_class(aModelName)
+        if not aModelClass:
+            continue
+
+        for f_class in get_model_fk(aModelClass).values():
+            related = name_to_class(f_class)
+            uid = 'dyn_dt_fk_label_' + related._meta.label_lower
+            post_save.connect(invalidate_fk_label, sender=related, dispatch_uid=uid)
+            post_delete.connect(invalidate_fk_label, sender=related, dispatch_uid=uid)
+
+def connect_search_signals():
+    """Keeps the FTS5 tables of the tables using the 'fts5' search backend current."""
+    for aPath, aModelName in settings.DYNAMIC_DATATB.items():
+        if table_option(aPath, 'search') != SEARCH_FTS5:
+            continue
+        aModelClass = name_to_class(aModelName)
+        if not aModelClass:
+            continue
+
+        uid = 'dyn_dt_fts5_' + aModelClass._meta.label_lower
+        post_save.connect(fts5_update, sender=aModelClass, dispatch_uid=uid)
+        post_delete.connect(fts5_delete, sender=aModelClass, dispatch_uid=uid)
+
+def connect_table_settings_signals():
+    """Drops the cached TableSettings when a hide/show, filter or page size row changes."""
+    for model in (HideShowFilter, ModelFilter, PageItems):
+        uid = 'dyn_dt_settings_' + model._meta.label_lower
+        post_save.connect(invalidate_table_settings, sender=model, dispatch_uid=uid)
+        post_delete.connect(invalidate_table_settings, sender=model, dispatch_uid=uid)
+
+def connect_aggregate_signals():
+    """Updates the cached aggregates of a table in place when one of its rows changes."""
+    for aPath in settings.DYNAMIC_DATATB.keys():
+        meta = table_meta(aPath)
+        if not meta or not aggregate_fields(aPath, meta):
+            continue
+
+        uid = 'dyn_dt_aggregates_' + meta.model._meta.label_lower
+        pre_save.connect(aggregates_pre_save, sender=meta.model, dispatch_uid=uid)
+        post_save.connect(aggregates_post_save, sender=meta.model, dispatch_uid=uid)
+        pre_delete.connect(aggregates_pre_delete, sender=meta.model, dispatch_uid=uid)
+        post_delete.connect(aggregates_post_delete, sender=meta.model, dispatch_uid=uid)
+
+def connect_version_signals():
+    """Bumps the data version of the tables (and of their FK targets) on writes, see versions.py."""
+    for aPath in settings.DYNAMIC_DATATB.keys():
+        meta = table_meta(aPath)
+        if not meta:
+            continue
+
+        related = [meta.model._meta.get_field(name).related_model for name in meta.fk_fields.keys()]
+        for model in [meta.model] + related:
+            uid = 'dyn_dt_version_' + model._meta.label_lower
+            post_save.connect(bump_model_version, sender=model, dispatch_uid=uid)
+            post_delete.connect(bump_model_version, sender=model, dispatch_uid=uid)
+
+    for model in (HideShowFilter, ModelFilter, PageItems):
+        uid = 'dyn_dt_settings_version_' + model._meta.label_lower
+        post_save.connect(bump_settings_version, sender=model, dispatch_uid=uid)
+        post_delete.connect(bump_settings_version, sender=model, dispatch_uid=uid)
+
+def rows_written(sender, pks=None, using='default', **kwargs):
+    """rows_changed receiver: what the row signals would have done, for a bulk write of any model."""
+    invalidate_aggregates(sender)
+    invalidate_fk_labels(sender, pks)
+    fts5_refresh(sender, pks, using)
+
+def connect_bulk_signals():
+    rows_changed.connect(rows_written, dispatch_uid='dyn_dt_rows_written')
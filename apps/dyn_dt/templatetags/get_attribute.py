@@ -7,7 +7,11 @@ register = template.Library()
 @register.filter(name="getattribute")
 def getattribute(value, arg):
     try:
-        attr_value = getattr(value, arg)
+        # Rows may be plain dicts (see utils.row_dicts)
+        if isinstance(value, dict):
+            attr_value = value.get(arg, '')
+        else:
+            attr_value = getattr(value, arg)
         
         if isinstance(attr_value, datetime):
             return attr_value.strftime("%Y-%m-%d %H:%M:%S")
@@ -1,3 +1,984 @@
-from django.test import TestCase
+import csv, gzip, importlib.util, io, json, shutil, tempfile
+from datetime import timedelta
+from unittest import skipUnless
+from urllib.parse import urlencode
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Value
+from django.db.models.functions import Concat
+from django.db.models.signals import post_save, post_delete
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.common.signals import rows_changed, send_rows_changed
+from apps.dyn_dt import aggregates, bulk
+from apps.dyn_dt.filters import default_operator, field_operators, filter_lookups
+from apps.dyn_dt.jobs import enqueue_export, run_pending_jobs, run_in_process, claim_next_job, EXPORT_ATTEMPTS
+from apps.dyn_dt.models import PageItems, HideShowFilter, ModelFilter, ExportJob
+from apps.dyn_dt.search import SEARCH_FTS5, search_queryset, _fts5_tables
+from apps.dyn_dt.signals import connect_search_signals
+from apps.common.testing import seed_rows
+from apps.faq.models import FaqArticle, FaqCategory
+from apps.pages.models import Product
+from cli import name_to_class
+
+
+class ModelSeriesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def _page_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            r = self.client.get(reverse('model_dt', args=['product']))
+        self.assertEqual(r.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_page_does_not_scan_columns(self):
+        self.assertNotIn('model_series', self.client.get(reverse('model_dt', args=['product'])).context)
+
+    def test_page_queries_flat_with_row_count(self):
+        Product.objects.bulk_create([Product(name=f'p{i}', price=i) for i in range(5)])
+        self._page_queries()  # first visit caches the table settings
+        small = self._page_queries()
+        Product.objects.bulk_create([Product(name=f'q{i}', price=i) for i in range(200)])
+        self.assertEqual(self._page_queries(), small)
+
+    def test_series_is_bounded(self):
+        Product.objects.bulk_create([Product(name=f'p{i}', price=i) for i in range(10)])
+        r = self.client.get(reverse('model_series', args=['product']), {'field': 'price', 'limit': 3})
+        series = r.json()['series']['price']
+        self.assertEqual(series['values'], [0, 1, 2])
+        self.assertTrue(series['truncated'])
+
+    def test_series_is_cached_until_a_write(self):
+        Product.objects.bulk_create([Product(name=f'p{i}', price=i) for i in range(10)])
+        url = reverse('model_series', args=['product'])
+        self.client.get(url, {'field': 'price', 'limit': 3})
+        with CaptureQueriesContext(connection) as ctx:
+            r = self.client.get(url, {'field': 'price', 'limit': 3})
+        self.assertEqual(r.json()['series']['price']['values'], [0, 1, 2])
+        self.assertEqual([q for q in ctx.captured_queries if 'pages_product' in q['sql']], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.all().delete()
+        r = self.client.get(url, {'field': 'price', 'limit': 3})
+        self.assertEqual(r.json()['series']['price']['values'], [])
+
+    def test_series_limit_is_at_least_one(self):
+        Product.objects.bulk_create([Product(name=f'p{i}', price=i) for i in range(3)])
+        for limit in (-5, -1, 0):
+            r = self.client.get(reverse('model_series', args=['product']), {'field': 'price', 'limit': limit})
+            self.assertEqual(r.status_code, 200)
+            self.assertEqual(r.json()['series']['price']['values'], [0])
+
+    def test_series_unknown_field(self):
+        r = self.client.get(reverse('model_series', args=['product']), {'field': 'nope'})
+        self.assertEqual(r.status_code, 400)
+
+
+@override_settings(DYNAMIC_DATATB_OPTIONS={'product': {'pagination': 'keyset', 'count': None}})
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        prices = [None, 3, 1, None, 2, 2, 5, 1, None, 4, 2]
+        Product.objects.bulk_create([Product(name=f'p{i}', price=p) for i, p in enumerate(prices)])
+        PageItems.objects.create(parent='product', items_per_page=3)
+        self.url = reverse('model_dt', args=['product'])
+
+    def _walk(self, order_by):
+        expected = sorted(Product.objects.all(), key=lambda p: (p.price is not None, p.price or 0, p.pk)) \
+            if order_by == 'price' else list(Product.objects.order_by('pk'))
+        seen, params = [], {'order_by': order_by}
+        while True:
+            page = self.client.get(self.url, params).context['items']
+            seen += [row['id'] for row in page]
+            if not page.next_cursor:
+                break
+            params = {'order_by': order_by, 'cursor': page.next_cursor}
+        self.assertEqual(seen, [p.pk for p in expected])
+        return page, seen
+
+    def test_walk_forward_by_pk(self):
+        self._walk('id')
+
+    def test_walk_forward_and_back_with_nulls_and_ties(self):
+        page, seen = self._walk('price')
+        back = [row['id'] for row in page]
+        while page.prev_cursor:
+            page = self.client.get(self.url, {'order_by': 'price', 'cursor': page.prev_cursor}).context['items']
+            back = [row['id'] for row in page] + back
+        self.assertEqual(back, seen)
+        self.assertFalse(page.has_previous())
+
+    def test_deep_page_costs_same_as_first(self):
+        self.client.get(self.url)  # first visit caches the table settings
+        with CaptureQueriesContext(connection) as first:
+            page = self.client.get(self.url).context['items']
+        with CaptureQueriesContext(connection) as deep:
+            self.client.get(self.url, {'cursor': page.next_cursor})
+        self.assertEqual(len(first), len(deep))
+        for query in deep.captured_queries:
+            self.assertNotIn('OFFSET', query['sql'])
+
+    def test_bad_cursor_redirects(self):
+        r = self.client.get(self.url, {'cursor': 'garbage'})
+        self.assertEqual(r.status_code, 302)
+
+    @override_settings(DYNAMIC_DATATB_OPTIONS={'product': {'pagination': 'keyset', 'count': 'approx'}})
+    def test_approximate_count_is_cached(self):
+        self.assertEqual(self.client.get(self.url).context['items'].count, 11)
+        Product.objects.create(name='late')
+        self.assertEqual(self.client.get(self.url).context['items'].count, 11)
+
+
+@override_settings(DYNAMIC_DATATB={'article': 'apps.faq.models.FaqArticle'})
+class FkChoicesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.categories = [FaqCategory.objects.create(name=f'Category {i}') for i in range(30)]
+
+    def _articles(self, count):
+        for i in range(count):
+            FaqArticle.objects.create(category=self.categories[i % 3], title=f'a{FaqArticle.objects.count()}', content='x')
+
+    def test_search_is_bounded(self):
+        r = self.client.get(reverse('model_fk_choices', args=['article', 'category']), {'q': 'Category 1', 'limit': 5})
+        data = r.json()
+        self.assertEqual(len(data['results']), 5)
+        self.assertTrue(data['more'])
+        self.assertTrue(all('Category 1' in c['text'] for c in data['results']))
+
+    def test_limit_is_at_least_one(self):
+        for limit in (-5, 0):
+            r = self.client.get(reverse('model_fk_choices', args=['article', 'category']), {'q': 'Category', 'limit': limit})
+            self.assertEqual(r.status_code, 200)
+            self.assertEqual((len(r.json()['results']), r.json()['more']), (1, True))
+
+    def test_id_lookup(self):
+        wanted = [self.categories[4].pk, self.categories[7].pk]
+        r = self.client.get(reverse('model_fk_choices', args=['article', 'category']), {'id': wanted})
+        self.assertEqual([c['id'] for c in r.json()['results']], wanted)
+        self.assertEqual(r.json()['results'][0]['text'], 'Category 4')
+
+    def test_bulk_writes_drop_cached_labels(self):
+        url = reverse('model_fk_choices', args=['article', 'category'])
+        first, second = self.categories[1].pk, self.categories[2].pk
+        labels = lambda: [c['text'] for c in self.client.get(url, {'id': [first, second]}).json()['results']]
+        self.assertEqual(labels(), ['Category 1', 'Category 2'])  # cached
+
+        # What the DynamicAPI bulk endpoints send after their writes
+        with self.captureOnCommitCallbacks(execute=True):
+            FaqCategory.objects.filter(pk=first).update(name='Renamed')
+            send_rows_changed(FaqCategory, [first])
+        self.assertEqual(labels(), ['Renamed', 'Category 2'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            FaqCategory.objects.update(name=Concat(Value('All '), 'pk'))
+            send_rows_changed(FaqCategory, None)
+        self.assertEqual(labels(), [f'All {first}', f'All {second}'])
+
+    def test_unknown_fk_field(self):
+        r = self.client.get(reverse('model_fk_choices', args=['article', 'title']))
+        self.assertEqual(r.status_code, 400)
+        r = self.client.get(reverse('model_fk_choices', args=['nope', 'category']))
+        self.assertEqual(r.status_code, 404)
+
+    def test_page_renders_labels_without_n_plus_one(self):
+        url = reverse('model_dt', args=['article'])
+        self._articles(3)
+        self.client.get(url)
+        cache.clear()
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(url)
+        self._articles(20)
+        cache.clear()
+        with CaptureQueriesContext(connection) as large:
+            r = self.client.get(url)
+        self.assertEqual(len(small), len(large))
+        self.assertContains(r, 'Category 2')
+        # only the selected value is rendered into the edit modals
+        self.assertNotContains(r, 'Category 29')
+
+
+class QueryCountHarnessTests(TestCase):
+    """Every DYNAMIC_DATATB table renders and exports with a constant number of queries."""
+
+    def get(self, url):
+        r = self.client.get(url)
+        # Streamed exports run their row queries while the body is read
+        return b''.join(r.streaming_content) if r.streaming else r.content
+
+    def assertConstantQueries(self, url, aModelClass):
+        seed_rows(aModelClass, 3)
+        cache.clear()
+        with CaptureQueriesContext(connection) as small:
+            self.get(url)
+        seed_rows(aModelClass, 30)
+        cache.clear()
+        with CaptureQueriesContext(connection) as large:
+            self.get(url)
+        self.assertEqual(len(small), len(large), url)
+        table = f'FROM "{aModelClass._meta.db_table}"'
+        self.assertTrue(any(table in q['sql'] for q in large.captured_queries), url)
+
+    def test_registered_tables(self):
+        for aPath, aModelName in settings.DYNAMIC_DATATB.items():
+            with self.subTest(aPath):
+                aModelClass = name_to_class(aModelName)
+                self.assertConstantQueries(reverse('model_dt', args=[aPath]), aModelClass)
+                self.assertConstantQueries(reverse('export_csv', args=[aPath]), aModelClass)
+
+    @override_settings(DYNAMIC_DATATB={'article': 'apps.faq.models.FaqArticle'})
+    def test_registered_fk_table(self):
+        self.test_registered_tables()
+
+    def test_hidden_columns_are_not_loaded(self):
+        seed_rows(Product, 3)
+        HideShowFilter.objects.create(parent='product', key='info', value=True)
+        with CaptureQueriesContext(connection) as ctx:
+            r = self.client.get(reverse('model_dt', args=['product']))
+        rows_sql = [q['sql'] for q in ctx.captured_queries if 'FROM "pages_product"' in q['sql']]
+        self.assertTrue(rows_sql)
+        for sql in rows_sql:
+            self.assertNotIn('"info"', sql)
+        self.assertEqual(r.context['hidden_fields'], ['info'])
+
+
+@override_settings(DYNAMIC_DATATB={'article': 'apps.faq.models.FaqArticle'})
+class StreamingExportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        seed_rows(FaqArticle, 5, fk_pool=2)
+        for key in ('slug', 'content', 'is_published', 'is_featured', 'helpful_votes', 'not_helpful_votes', 'created_at', 'updated_at'):
+            HideShowFilter.objects.create(parent='article', key=key, value=True)
+        self.url = reverse('export_csv', args=['article'])
+
+    def expected_rows(self):
+        return [[str(a.pk), str(a.category), a.title, str(a.view_count)] for a in FaqArticle.objects.order_by('pk')]
+
+    def test_csv_is_streamed(self):
+        r = self.client.get(self.url)
+        self.assertTrue(r.streaming)
+        rows = list(csv.reader(io.StringIO(b''.join(r.streaming_content).decode())))
+        self.assertEqual(rows[0], ['id', 'category', 'title', 'view_count'])
+        self.assertEqual(rows[1:], self.expected_rows())
+
+    def test_gzip_csv(self):
+        r = self.client.get(self.url, {'compress': 'gzip'})
+        self.assertEqual(r['Content-Type'], 'application/gzip')
+        self.assertIn('article.csv.gz', r['Content-Disposition'])
+        rows = list(csv.reader(io.StringIO(gzip.decompress(b''.join(r.streaming_content)).decode())))
+        self.assertEqual(rows[1:], self.expected_rows())
+
+    def test_ndjson(self):
+        r = self.client.get(self.url, {'format': 'ndjson', 'search': 'row'})
+        lines = b''.join(r.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 5)
+        first = json.loads(lines[0])
+        self.assertEqual(set(first), {'id', 'category', 'title', 'view_count'})
+
+    def test_unknown_format(self):
+        self.assertEqual(self.client.get(self.url, {'format': 'xml'}).status_code, 400)
+
+    @skipUnless(importlib.util.find_spec('pyarrow'), 'pyarrow not installed')
+    def test_parquet(self):
+        import pyarrow.parquet as pq
+
+        r = self.client.get(self.url, {'format': 'parquet'})
+        table = pq.read_table(io.BytesIO(b''.join(r.streaming_content)))
+        self.assertEqual(table.num_rows, 5)
+        self.assertEqual(table.column('title').to_pylist(), [row[2] for row in self.expected_rows()])
+
+
+class ExportJobTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        overrides = override_settings(MEDIA_ROOT=self.media, DYNAMIC_DATATB_EXPORT_INPROCESS=False)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        seed_rows(Product, 50)
+        HideShowFilter.objects.create(parent='product', key='info', value=True)
+
+    def _export(self, params=None):
+        r = self.client.post(reverse('export_job_create', args=['product']) + '?' + urlencode(params or {}))
+        return r.status_code, r.json()
+
+    def test_job_runs_and_reports_progress(self):
+        status, job = self._export()
+        self.assertEqual(status, 202)
+        self.assertEqual(job['status'], ExportJob.STATUS_PENDING)
+
+        run_pending_jobs()
+        job = self.client.get(job['status_url']).json()
+        self.assertEqual(job['status'], ExportJob.STATUS_DONE)
+        self.assertEqual((job['progress'], job['rows_done'], job['rows_total']), (100, 50, 50))
+
+        body = b''.join(self.client.get(job['download_url']).streaming_content).decode()
+        self.assertEqual(len(body.splitlines()), 51)
+
+    def test_identical_export_reuses_artifact(self):
+        _, first = self._export({'search': 'row'})
+        run_pending_jobs()
+        status, again = self._export({'search': 'row'})
+        self.assertEqual((status, again['id'], again['reused']), (200, first['id'], True))
+
+        _, other = self._export({'search': 'row', 'format': 'ndjson'})
+        self.assertNotEqual(other['id'], first['id'])
+
+    def test_range_download_resumes(self):
+        _, job = self._export()
+        run_pending_jobs()
+        job = ExportJob.objects.get(pk=job['id'])
+        url = reverse('export_job_download', args=[job.pk])
+        full = b''.join(self.client.get(url).streaming_content)
+
+        r = self.client.get(url, HTTP_RANGE='bytes=10-')
+        self.assertEqual(r.status_code, 206)
+        self.assertEqual(r['Content-Range'], f'bytes 10-{len(full) - 1}/{len(full)}')
+        self.assertEqual(b''.join(r.streaming_content), full[10:])
+
+        r = self.client.get(url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(r.streaming_content), full[-5:])
+
+        r = self.client.get(url, HTTP_RANGE=f'bytes={len(full)}-')
+        self.assertEqual(r.status_code, 416)
+
+        r = self.client.get(url, HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(r.status_code, 200)
+
+    def test_stale_running_job_is_reclaimed(self):
+        _, job = self._export()
+        ExportJob.objects.filter(pk=job['id']).update(
+            status=ExportJob.STATUS_RUNNING, heartbeat_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(claim_next_job().pk, job['id'])
+        self.assertIsNone(claim_next_job())
+
+    def test_job_abandoned_after_max_attempts_is_failed(self):
+        _, job = self._export()
+        ExportJob.objects.filter(pk=job['id']).update(
+            status=ExportJob.STATUS_RUNNING, heartbeat_at=timezone.now() - timedelta(hours=1), attempts=EXPORT_ATTEMPTS)
+        self.assertIsNone(claim_next_job())
+        job = ExportJob.objects.get(pk=job['id'])
+        self.assertEqual(job.status, ExportJob.STATUS_FAILED)
+        self.assertIn('attempts', job.error)
+
+    def test_setup_errors_fail_the_job(self):
+        _, job = self._export()
+        # MEDIA_ROOT is a file: the export directory cannot be created
+        media = tempfile.NamedTemporaryFile(dir=self.media, delete=False).name
+        with override_settings(MEDIA_ROOT=media):
+            run_pending_jobs()
+        job = ExportJob.objects.get(pk=job['id'])
+        self.assertEqual((job.status, job.attempts), (ExportJob.STATUS_FAILED, 1))
+        self.assertTrue(job.error)
+
+    def test_in_process_worker_purges_expired_exports(self):
+        _, job = self._export()
+        ExportJob.objects.filter(pk=job['id']).update(
+            status=ExportJob.STATUS_DONE, created_at=timezone.now() - timedelta(days=30))
+        run_in_process()
+        self.assertFalse(ExportJob.objects.filter(pk=job['id']).exists())
+
+
+class SearchBackendTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alpha = Product.objects.create(name='alpha', info='first', price=42)
+        self.beta  = Product.objects.create(name='beta', info='second', price=420)
+
+    def _search(self, term):
+        with CaptureQueriesContext(connection) as ctx:
+            r = self.client.get(reverse('model_dt', args=['product']), {'search': term})
+        self.assertEqual(r.status_code, 200)
+        sql = ' '.join(q['sql'] for q in ctx.captured_queries)
+        return {row['id'] for row in r.context['items'].object_list}, sql
+
+    def test_number_hits_numeric_columns_with_equality(self):
+        found, sql = self._search('42')
+        self.assertEqual(found, {self.alpha.pk})
+        self.assertNotIn('"price" LIKE', sql)
+
+    def test_text_term_skips_numeric_columns(self):
+        found, sql = self._search('alp')
+        self.assertEqual(found, {self.alpha.pk})
+        self.assertNotIn('"price"', sql.split('WHERE', 1)[-1].split('ORDER BY')[0])
+
+    def test_date_term_is_a_range(self):
+        job = ExportJob.objects.create(parent='product', params={}, params_hash='x')
+        ExportJob.objects.filter(pk=job.pk).update(created_at=timezone.make_aware(timezone.datetime(2024, 5, 17, 10)))
+        ExportJob.objects.create(parent='product', params={}, params_hash='y')
+
+        for term in ('2024-05', '2024-05-17'):
+            found = search_queryset(ExportJob.objects.all(), term, ['created_at'], [])
+            self.assertEqual([j.pk for j in found], [job.pk])
+        self.assertFalse(search_queryset(ExportJob.objects.all(), '2024-05-18', ['created_at'], []).exists())
+
+    def test_unmatchable_term_returns_nothing(self):
+        self.assertFalse(search_queryset(Product.objects.all(), 'abc', ['price'], []).exists())
+
+    def test_out_of_range_numbers_match_nothing(self):
+        for term in ('inf', 'Infinity', '-inf', 'NaN', '99999999999999999999', '1e100000000', '1e-100000000'):
+            found, _ = self._search(term)
+            self.assertEqual(found, set(), term)
+        self.assertFalse(search_queryset(ExportJob.objects.all(), '99999999999999999999', ['id', 'rows_total'], []).exists())
+
+    @skipUnless(connection.vendor == 'sqlite', 'FTS5 backend is SQLite only')
+    @override_settings(DYNAMIC_DATATB_OPTIONS={'product': {'search': 'fts5'}})
+    def test_fts5_table_is_looked_up_once(self):
+        # captureOnCommitCallbacks runs the hooks of a transaction that is then rolled back
+        self.addCleanup(_fts5_tables.clear)
+        with self.captureOnCommitCallbacks(execute=True):
+            found, sql = self._search('alp')
+        self.assertEqual(found, {self.alpha.pk})
+        self.assertIn('sqlite_master', sql)
+
+        found, sql = self._search('alp')
+        self.assertEqual(found, {self.alpha.pk})
+        self.assertNotIn('sqlite_master', sql)
+
+    @skipUnless(connection.vendor == 'sqlite', 'FTS5 backend is SQLite only')
+    @override_settings(DYNAMIC_DATATB_OPTIONS={'product': {'search': 'fts5'}})
+    def test_fts5_index_follows_saves_and_deletes(self):
+        # captureOnCommitCallbacks runs the hooks of a transaction that is then rolled back
+        self.addCleanup(_fts5_tables.clear)
+        connect_search_signals()
+        self.addCleanup(post_save.disconnect, dispatch_uid='dyn_dt_fts5_pages.product', sender=Product)
+        self.addCleanup(post_delete.disconnect, dispatch_uid='dyn_dt_fts5_pages.product', sender=Product)
+
+        found, sql = self._search('alp')
+        self.assertEqual(found, {self.alpha.pk})
+        self.assertIn('MATCH', sql)
+
+        self.alpha.name = 'gamma'
+        self.alpha.save()
+        self.assertEqual(self._search('alp')[0], set())
+        self.assertEqual(self._search('gam')[0], {self.alpha.pk})
+
+        delta = Product.objects.create(name='delta', info='third', price=7)
+        self.assertEqual(self._search('delta third')[0], {delta.pk})
+
+        delta.delete()
+        self.assertEqual(self._search('delta')[0], set())
+
+
+class TableSettingsCacheTests(TestCase):
+    SETTINGS_TABLES = ('dyn_dt_hideshowfilter', 'dyn_dt_modelfilter', 'dyn_dt_pageitems')
+
+    def setUp(self):
+        cache.clear()
+        seed_rows(Product, 5)
+        self.url = reverse('model_dt', args=['product'])
+
+    def _settings_sql(self, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            r = self.client.get(self.url, params or {})
+        self.assertEqual(r.status_code, 200)
+        return r, [q['sql'] for q in ctx.captured_queries if any(t in q['sql'] for t in self.SETTINGS_TABLES)]
+
+    def test_render_never_writes_settings(self):
+        r, sql = self._settings_sql()
+        self.assertFalse([s for s in sql if not s.startswith('SELECT')])
+        self.assertFalse(HideShowFilter.objects.exists())
+        self.assertEqual([f.key for f in r.context['field_names']], ['id', 'name', 'info', 'price'])
+
+        # Warm cache: the settings tables are not touched at all
+        _, sql = self._settings_sql()
+        self.assertEqual(sql, [])
+
+    def test_settings_views_invalidate(self):
+        self._settings_sql()
+
+        self.client.post(reverse('create_page_items', args=['product']), {'items': 2})
+        r, _ = self._settings_sql()
+        self.assertEqual(len(r.context['items'].object_list), 2)
+
+        self.client.post(reverse('create_hide_show_filter', args=['product']),
+                         json.dumps({'key': 'info', 'value': True}), content_type='application/x-www-form-urlencoded')
+        r, _ = self._settings_sql()
+        self.assertEqual(r.context['hidden_fields'], ['info'])
+
+        self.client.post(reverse('create_filter', args=['product']), {'key': ['name'], 'value': ['row-nothing']})
+        r, _ = self._settings_sql()
+        self.assertEqual(r.context['items'].paginator.count, 0)
+
+        self.client.get(reverse('delete_filter', args=['product', r.context['filter_instance'][0].id]))
+        r, _ = self._settings_sql()
+        self.assertEqual(r.context['items'].paginator.count, 5)
+
+
+@override_settings(DYNAMIC_DATATB={'article': 'apps.faq.models.FaqArticle'})
+class BulkWriteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(get_user_model().objects.create_user(username='bulk', password='bulk'))
+        self.news = FaqCategory.objects.create(name='News', slug='news')
+        self.help = FaqCategory.objects.create(name='Help', slug='help')
+
+    def _post(self, name, payload):
+        r = self.client.post(reverse(name, args=['article']), json.dumps(payload), content_type='application/json')
+        return r.status_code, r.json()
+
+    def _rows(self, count, category):
+        return [{'title': f'post {i}', 'slug': f'{category.slug}-{i}', 'content': 'x', 'category': category.pk}
+                for i in range(count)]
+
+    def test_bulk_create_checks_fks_once(self):
+        rows = self._rows(30, self.news) + self._rows(30, self.help)
+        with CaptureQueriesContext(connection) as ctx:
+            status, body = self._post('bulk_create', {'rows': rows})
+        self.assertEqual((status, body), (201, {'created': 60}))
+        fk_lookups = [q for q in ctx.captured_queries if 'FROM "faq_faqcategory"' in q['sql']]
+        self.assertEqual(len(fk_lookups), 1)
+        self.assertEqual(FaqArticle.objects.count(), 60)
+
+    def test_bulk_create_reports_row_errors_and_writes_nothing(self):
+        rows = self._rows(3, self.news)
+        rows[1]['category'] = 999
+        rows[2].pop('title')
+        rows[2]['view_count'] = 'many'
+        status, body = self._post('bulk_create', {'rows': rows})
+        self.assertEqual(status, 400)
+        self.assertEqual([e['row'] for e in body['errors']], [1, 2])
+        self.assertIn('category', body['errors'][0]['errors'])
+        self.assertEqual(set(body['errors'][1]['errors']), {'title', 'view_count'})
+        self.assertFalse(FaqArticle.objects.exists())
+
+    def test_bulk_update_by_ids_and_by_search(self):
+        self._post('bulk_create', {'rows': self._rows(5, self.news) + self._rows(5, self.help)})
+        ids = list(FaqArticle.objects.filter(category=self.news).values_list('pk', flat=True)[:2])
+
+        status, body = self._post('bulk_update', {'ids': ids, 'values': {'view_count': 7}})
+        self.assertEqual((status, body), (200, {'updated': 2}))
+        self.assertEqual(set(FaqArticle.objects.filter(view_count=7).values_list('pk', flat=True)), set(ids))
+
+        status, body = self._post('bulk_update', {'all': True, 'search': 'help', 'values': {'category': self.news.pk}})
+        self.assertEqual(body, {'updated': 5})
+        self.assertFalse(FaqArticle.objects.filter(category=self.help).exists())
+
+        status, body = self._post('bulk_update', {'all': True, 'values': {'category': 999}})
+        self.assertEqual(status, 400)
+
+    def test_bulk_values_go_through_the_field_validators(self):
+        self._post('bulk_create', {'rows': self._rows(2, self.news)})
+        rows = self._rows(2, self.help)
+        rows[0]['title'] = 'x' * 300
+        rows[1]['slug'] = 'not a slug'
+        status, body = self._post('bulk_create', {'rows': rows})
+        self.assertEqual(status, 400)
+        self.assertEqual([set(e['errors']) for e in body['errors']], [{'title'}, {'slug'}])
+
+        status, body = self._post('bulk_update', {'all': True, 'values': {'title': 'x' * 300, 'content': ''}})
+        self.assertEqual(status, 400)
+        self.assertEqual(set(body['errors'][0]['errors']), {'title', 'content'})
+        self.assertFalse(FaqArticle.objects.filter(content='').exists())
+
+    def test_select_all_past_the_row_limit_refreshes_everything(self):
+        self._post('bulk_create', {'rows': self._rows(4, self.news)})
+        sent = []
+        def receiver(sender, pks, **kwargs):
+            sent.append(pks)
+        rows_changed.connect(receiver, sender=FaqArticle)
+        self.addCleanup(rows_changed.disconnect, receiver, sender=FaqArticle)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._post('bulk_update', {'all': True, 'values': {'view_count': 1}})
+        limit, bulk.BULK_MAX_ROWS = bulk.BULK_MAX_ROWS, 3
+        self.addCleanup(setattr, bulk, 'BULK_MAX_ROWS', limit)
+        with self.captureOnCommitCallbacks(execute=True):
+            self._post('bulk_update', {'all': True, 'values': {'view_count': 2}})
+        self.assertEqual(len(sent[0]), 4)
+        self.assertIsNone(sent[1])
+
+    def test_bulk_delete_by_ids_and_matching_filter(self):
+        self._post('bulk_create', {'rows': self._rows(5, self.news) + self._rows(5, self.help)})
+        ids = list(FaqArticle.objects.filter(category=self.news).values_list('pk', flat=True)[:3])
+        self.assertEqual(self._post('bulk_delete', {'ids': ids}), (200, {'deleted': 3}))
+
+        ModelFilter.objects.create(parent='article', key='slug', value='news-')
+        self.assertEqual(self._post('bulk_delete', {'all': True}), (200, {'deleted': 2}))
+        self.assertEqual(FaqArticle.objects.count(), 5)
+        self.assertFalse(FaqArticle.objects.filter(category=self.news).exists())
+
+    @skipUnless(connection.vendor == 'sqlite', 'FTS5 backend is SQLite only')
+    def test_bulk_writes_refresh_the_fts5_index(self):
+        # captureOnCommitCallbacks runs the hooks of a transaction that is then rolled back
+        self.addCleanup(_fts5_tables.clear)
+        def found(term):
+            return set(search_queryset(FaqArticle.objects.all(), term, ['title'], [], SEARCH_FTS5).values_list('title', flat=True))
+
+        FaqArticle.objects.create(category=self.news, title='existing', slug='existing', content='x')
+        self.assertEqual(found('existing'), {'existing'})  # builds the index
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._post('bulk_create', {'rows': self._rows(3, self.news)})
+        self.assertEqual(found('post'), {'post 0', 'post 1', 'post 2'})
+
+        ids = list(FaqArticle.objects.filter(title='post 1').values_list('pk', flat=True))
+        with self.captureOnCommitCallbacks(execute=True):
+            self._post('bulk_update', {'ids': ids, 'values': {'title': 'renamed'}})
+        self.assertEqual(found('post'), {'post 0', 'post 2'})
+        self.assertEqual(found('renamed'), {'renamed'})
+
+        ids = list(FaqArticle.objects.filter(title='post 0').values_list('pk', flat=True))
+        with self.captureOnCommitCallbacks(execute=True):
+            self._post('bulk_delete', {'ids': ids})
+        self.assertEqual(found('post'), {'post 2'})
+
+    def test_table_offers_select_all_matching(self):
+        PageItems.objects.create(parent='article', items_per_page=5)
+        self._post('bulk_create', {'rows': self._rows(8, self.news)})
+        r = self.client.get(reverse('model_dt', args=['article']))
+        self.assertContains(r, 'Select all 8 rows matching the filter')
+        self.assertContains(r, 'class="bulk-row"', count=5)
+
+    def test_bulk_requires_login_and_target(self):
+        self.assertEqual(self._post('bulk_delete', {})[0], 400)
+        self.client.logout()
+        r = self.client.post(reverse('bulk_delete', args=['article']), '{}', content_type='application/json')
+        self.assertEqual(r.status_code, 302)
+
+
+class DataTablesEndpointTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        Product.objects.bulk_create([Product(name=f'p{i}', info='x', price=i) for i in range(30)])
+        self.url = reverse('model_dt_data', args=['product'])
+
+    def _get(self, params):
+        columns = {f'columns[{i}][data]': f for i, f in enumerate(['id', 'name', 'info', 'price'])}
+        return self.client.get(self.url, {**columns, **params})
+
+    def test_protocol_paging_and_order(self):
+        r = self._get({'draw': 7, 'start': 10, 'length': 5, 'order[0][column]': 3, 'order[0][dir]': 'desc'})
+        body = r.json()
+        self.assertEqual((body['draw'], body['recordsTotal'], body['recordsFiltered']), (7, 30, 30))
+        self.assertEqual([row['price'] for row in body['data']], [19, 18, 17, 16, 15])
+        self.assertEqual(set(body['data'][0]), {'id', 'name', 'info', 'price'})
+
+    def test_search_and_cached_total(self):
+        body = self._get({'draw': 1, 'start': 0, 'length': 10, 'search[value]': 'p2'}).json()
+        self.assertEqual((body['recordsTotal'], body['recordsFiltered']), (30, 11))
+
+        Product.objects.create(name='p2x', price=1)
+        body = self._get({'draw': 2, 'search[value]': 'p2'}).json()
+        self.assertEqual((body['recordsTotal'], body['recordsFiltered']), (30, 12))
+
+    def test_hidden_columns_left_out(self):
+        HideShowFilter.objects.create(parent='product', key='info', value=True)
+        row = self._get({'draw': 1, 'length': 1}).json()['data'][0]
+        self.assertNotIn('info', row)
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.client.get(self.url, {'columns[0][data]': 'secret'}).status_code, 400)
+        self.assertEqual(self._get({'order[0][column]': 9}).status_code, 400)
+        self.assertEqual(self._get({'start': 'x'}).status_code, 400)
+
+    @override_settings(DYNAMIC_DATATB={'article': 'apps.faq.models.FaqArticle'})
+    def test_fk_labels_one_query_per_page(self):
+        seed_rows(FaqArticle, 20, fk_pool=3)
+        params = {'columns[0][data]': 'id', 'columns[1][data]': 'category', 'length': 20}
+        with CaptureQueriesContext(connection) as ctx:
+            body = self.client.get(reverse('model_dt_data', args=['article']), params).json()
+        self.assertEqual(len([q for q in ctx.captured_queries if 'FROM "faq_faqcategory"' in q['sql']]), 1)
+        labels = {str(a.category) for a in FaqArticle.objects.all()}
+        self.assertEqual({row['category'] for row in body['data']}, labels)
+        self.assertTrue(all(row['category_id'] for row in body['data']))
+
+    @override_settings(DYNAMIC_DATATB={'article': 'apps.faq.models.FaqArticle'})
+    def test_fk_column_search(self):
+        seed_rows(FaqArticle, 20, fk_pool=3)
+        category = FaqArticle.objects.values_list('category', flat=True).first()
+        url = reverse('model_dt_data', args=['article'])
+        params = {'columns[0][data]': 'id', 'columns[1][data]': 'category'}
+
+        body = self.client.get(url, {**params, 'columns[1][search][value]': category}).json()
+        self.assertEqual(body['recordsFiltered'], FaqArticle.objects.filter(category=category).count())
+
+        r = self.client.get(url, {**params, 'columns[1][search][value]': 'abc'})
+        self.assertEqual(r.status_code, 400)
+        self.assertIn('category', r.json()['error'])
+
+
+class TypedFilterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        Product.objects.bulk_create([Product(name=f'p{i}', info='x', price=i) for i in range(10)])
+        self.url = reverse('model_dt', args=['product'])
+
+    def _filtered(self, key, operator, value):
+        ModelFilter.objects.update_or_create(parent='product', key=key, defaults={'operator': operator, 'value': value})
+        with CaptureQueriesContext(connection) as ctx:
+            r = self.client.get(self.url)
+        sql = [q['sql'] for q in ctx.captured_queries if 'FROM "pages_product"' in q['sql']]
+        return r, sorted(row['price'] for row in r.context['items'].object_list), ' '.join(sql)
+
+    def test_operators_follow_field_type(self):
+        self.assertEqual(default_operator(Product._meta.get_field('price')), 'eq')
+        self.assertEqual(default_operator(Product._meta.get_field('name')), 'contains')
+        self.assertEqual(default_operator(FaqArticle._meta.get_field('slug')), 'prefix')
+        self.assertEqual(default_operator(FaqArticle._meta.get_field('category')), 'eq')
+        self.assertEqual(default_operator(FaqArticle._meta.get_field('created_at')), 'range')
+        self.assertNotIn('contains', field_operators(FaqArticle._meta.get_field('category')))
+
+    def test_numeric_operators_use_plain_comparisons(self):
+        _, prices, sql = self._filtered('price', 'eq', '5')
+        self.assertEqual(prices, [5])
+        self.assertIn('"price" = 5', sql)
+        self.assertNotIn('LIKE', sql)
+
+        self.assertEqual(self._filtered('price', 'in', '1, 3')[1], [1, 3])
+        self.assertEqual(self._filtered('price', 'range', '2..4')[1], [2, 3, 4])
+        self.assertEqual(self._filtered('price', 'range', '8..')[1], [8, 9])
+
+    def test_empty_operator_uses_type_default(self):
+        self.assertEqual(self._filtered('price', '', '7')[1], [7])
+
+    def test_invalid_value_matches_nothing_and_is_reported(self):
+        r, prices, _ = self._filtered('price', 'eq', 'abc')
+        self.assertEqual(prices, [])
+        self.assertIn('price', r.context['filter_errors'])
+
+    def test_fk_and_date_filters(self):
+        seed_rows(FaqArticle, 6, fk_pool=2)
+        category = FaqCategory.objects.order_by('pk').first()
+        FaqArticle.objects.filter(pk__in=FaqArticle.objects.order_by('pk').values('pk')[:2]).update(
+            created_at=timezone.make_aware(timezone.datetime(2024, 3, 10, 12)))
+
+        lookups, errors = filter_lookups(FaqArticle, [ModelFilter(key='category', operator='eq', value=str(category.pk))],
+                                         ['category'])
+        self.assertEqual((lookups, errors), ({'category_id': str(category.pk)}, {}))
+        self.assertEqual(FaqArticle.objects.filter(**lookups).count(), 3)
+
+        lookups, _ = filter_lookups(FaqArticle, [ModelFilter(key='created_at', operator='range', value='2024-03-01..2024-03-10')],
+                                    ['created_at'])
+        self.assertEqual(FaqArticle.objects.filter(**lookups).count(), 2)
+        lookups, _ = filter_lookups(FaqArticle, [ModelFilter(key='created_at', operator='eq', value='2024-03-11')],
+                                    ['created_at'])
+        self.assertEqual(FaqArticle.objects.filter(**lookups).count(), 0)
+
+    def test_create_filter_saves_operator(self):
+        self.client.post(reverse('create_filter', args=['product']), {'key': ['price'], 'operator': ['range'], 'value': ['1..2']})
+        self.assertEqual(ModelFilter.objects.get(parent='product').operator, 'range')
+        self.assertEqual(sorted(row['price'] for row in self.client.get(self.url).context['items'].object_list), [1, 2])
+
+    def test_explain_view_is_staff_only(self):
+        user = get_user_model().objects.create_user(username='plan', password='plan')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse('model_dt_explain', args=['product'])).status_code, 403)
+
+        user.is_staff = True
+        user.save()
+        ModelFilter.objects.create(parent='product', key='price', operator='eq', value='3')
+        r = self.client.get(reverse('model_dt_explain', args=['product']))
+        self.assertEqual(r.status_code, 200)
+        self.assertContains(r, '&quot;price&quot; = 3')
+        self.assertTrue(all(plan['plan'] for plan in r.context['plans']))
+
+
+class AggregateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        seed_rows(Product, 6)
+        for i, product in enumerate(Product.objects.order_by('pk')):
+            product.price = (i + 1) * 10
+            product.save()
+        self.url = reverse('model_aggregates', args=['product'])
+
+    def _aggregates(self, params=None):
+        r = self.client.get(self.url, params or {})
+        self.assertEqual(r.status_code, 200)
+        return r.json()['aggregates']
+
+    def _expected(self, queryset):
+        prices = [p for p in queryset.values_list('price', flat=True) if p is not None]
+        return {'sum': sum(prices), 'count': len(prices), 'avg': sum(prices) / len(prices),
+                'min': min(prices), 'max': max(prices)}
+
+    def test_one_query_then_cached(self):
+        with CaptureQueriesContext(connection) as ctx:
+            data = self._aggregates()
+        self.assertEqual(len([q for q in ctx.captured_queries if 'pages_product' in q['sql']]), 1)
+        self.assertEqual(data['rows'], 6)
+        self.assertEqual(data['columns']['price'], self._expected(Product.objects.all()))
+        self.assertEqual(list(data['columns']['price']), ['sum', 'count', 'avg', 'min', 'max'])
+
+        with CaptureQueriesContext(connection) as ctx:
+            self._aggregates()
+        self.assertEqual([q for q in ctx.captured_queries if 'pages_product' in q['sql']], [])
+
+    def test_filters_and_search(self):
+        ModelFilter.objects.create(parent='product', key='price', operator='range', value='0..500')
+        expected = Product.objects.filter(price__lte=500)
+        self.assertEqual(self._aggregates()['rows'], expected.count())
+
+        name = Product.objects.order_by('pk').first().name
+        data = self._aggregates({'search': name})
+        self.assertEqual(data['rows'], 1)
+
+    def test_row_writes_update_in_place(self):
+        self._aggregates()
+        self._aggregates({'search': 'row-'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='new', price=999999)
+        # Neither the min nor the max leaves the set
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.get(price=30)
+            product.price = 35
+            product.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.get(price=40).delete()
+
+        # Served from the updated entries, no recompute
+        with CaptureQueriesContext(connection) as ctx:
+            data = self._aggregates()
+            searched = self._aggregates({'search': 'row-'})
+        self.assertEqual([q for q in ctx.captured_queries if 'pages_product' in q['sql']], [])
+        self.assertEqual(data['rows'], 6)
+        self.assertEqual(data['columns']['price'], self._expected(Product.objects.all()))
+        self.assertEqual(searched['rows'], 5)
+        self.assertEqual(searched['columns']['price'], self._expected(Product.objects.filter(name__startswith='row-')))
+
+    def test_concurrent_changes_are_not_lost(self):
+        self._aggregates()
+        # Two writers take their versions before either applies its change
+        with self.captureOnCommitCallbacks() as first:
+            product = Product.objects.get(price=20)
+            product.price = 25
+            product.save()
+        with self.captureOnCommitCallbacks() as second:
+            product = Product.objects.get(price=30)
+            product.price = 33
+            product.save()
+
+        for callbacks in (second, first):
+            for callback in callbacks:
+                callback()
+        self.assertEqual(self._aggregates()['columns']['price'], self._expected(Product.objects.all()))
+
+        # The second writer runs between the cache read and write of the first one
+        with self.captureOnCommitCallbacks() as first:
+            product = Product.objects.get(price=40)
+            product.price = 44
+            product.save()
+        with self.captureOnCommitCallbacks() as second:
+            product = Product.objects.get(price=50)
+            product.price = 55
+            product.save()
+
+        apply_change = aggregates.apply_change
+        def interleaved(*args):
+            aggregates.apply_change = apply_change
+            for callback in second:
+                callback()
+            return apply_change(*args)
+        aggregates.apply_change = interleaved
+        try:
+            for callback in first:
+                callback()
+        finally:
+            aggregates.apply_change = apply_change
+        self.assertEqual(self._aggregates()['columns']['price'], self._expected(Product.objects.all()))
+
+    def test_removed_max_forces_recompute(self):
+        top = Product.objects.get(price=60)
+        self._aggregates()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            top.delete()
+        self.assertEqual(self._aggregates()['columns']['price'], self._expected(Product.objects.all()))
+
+    def test_bulk_writes_invalidate(self):
+        self._aggregates()
+        user = get_user_model().objects.create_user(username='agg', password='agg')
+        self.client.force_login(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('bulk_update', args=['product']), json.dumps({'all': True, 'values': {'price': 7}}),
+                             content_type='application/json')
+        self.assertEqual(self._aggregates()['columns']['price']['sum'], 42)
+
+    @override_settings(DYNAMIC_DATATB_OPTIONS={'product': {'aggregates': False}})
+    def test_disabled_by_option(self):
+        self.assertEqual(self._aggregates()['columns'], {})
+        self.assertNotContains(self.client.get(reverse('model_dt', args=['product'])), 'id="dtAggregates"')
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        seed_rows(Product, 6)
+        self.url = reverse('model_dt', args=['product'])
+        self.data_url = reverse('model_dt_data', args=['product'])
+
+    def _get(self, url, params=None, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        with CaptureQueriesContext(connection) as ctx:
+            r = self.client.get(url, params or {}, **headers)
+        return r, [q for q in ctx.captured_queries if 'pages_product' in q['sql']]
+
+    def test_page_not_modified_without_data_queries(self):
+        self._get(self.url)  # first visit, sets the CSRF cookie the page depends on
+        r, _ = self._get(self.url)
+        self.assertEqual(r.status_code, 200)
+        self.assertIn('no-cache', r['Cache-Control'])
+
+        r2, queries = self._get(self.url, etag=r['ETag'])
+        self.assertEqual(r2.status_code, 304)
+        self.assertEqual(queries, [])
+
+        # Another page, ordering or search is another ETag
+        self.assertNotEqual(self._get(self.url, {'search': 'row'})[0]['ETag'], r['ETag'])
+
+    def test_writes_change_the_etag(self):
+        self._get(self.url)
+        etag = self._get(self.url)[0]['ETag']
+        self.assertEqual(self._get(self.url, etag=etag)[0].status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='new', price=1)
+        r, _ = self._get(self.url, etag=etag)
+        self.assertEqual(r.status_code, 200)
+
+        etag = r['ETag']
+        ModelFilter.objects.create(parent='product', key='price', operator='eq', value='1')
+        self.assertEqual(self._get(self.url, etag=etag)[0].status_code, 200)
+
+    def test_data_endpoint_page_cache_and_draw(self):
+        params = {'start': 0, 'length': 2, 'columns[0][data]': 'id', 'columns[1][data]': 'name'}
+        r, _ = self._get(self.data_url, params)
+        self.assertEqual(self._get(self.data_url, params, etag=r['ETag'])[0].status_code, 304)
+
+        # Same page, new draw: another body, served from the page cache
+        r2, queries = self._get(self.data_url, dict(params, draw=7))
+        self.assertEqual(queries, [])
+        self.assertEqual(r2.json()['draw'], 7)
+        self.assertEqual(r2.json()['data'], r.json()['data'])
+        self.assertNotEqual(r2['ETag'], r['ETag'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.order_by('pk').first().delete()
+        r3, queries = self._get(self.data_url, params, etag=r['ETag'])
+        self.assertEqual(r3.status_code, 200)
+        self.assertTrue(queries)
+        self.assertNotEqual(r3.json()['data'], r.json()['data'])
+
+    @override_settings(DYNAMIC_DATATB_OPTIONS={'product': {'prefetch': True}}, DYNAMIC_DATATB_PREFETCH_THREADED=False)
+    def test_next_page_is_prefetched(self):
+        params = {'start': 0, 'length': 3, 'columns[0][data]': 'id'}
+        self._get(self.data_url, params)
+        r, queries = self._get(self.data_url, dict(params, start=3))
+        self.assertEqual(queries, [])
+        self.assertEqual(len(r.json()['data']), 3)
+
+    @override_settings(DYNAMIC_DATATB_EXPORT_INPROCESS=False)
+    def test_export_jobs_reused_until_the_data_changes(self):
+        job, created = enqueue_export('product', {'format': 'csv'})
+        self.assertEqual(enqueue_export('product', {'format': 'csv'}), (job, False))
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='new', price=1)
+        self.assertTrue(enqueue_export('product', {'format': 'csv'})[1])
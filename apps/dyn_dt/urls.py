@@ -11,8 +11,19 @@ urlpatterns = [
     path('create/<str:aPath>/', views.create, name="create"),
     path('delete/<str:aPath>/<int:id>/', views.delete, name="delete"),
     path('update/<str:aPath>/<int:id>/', views.update, name="update"),
+    path('bulk-create/<str:aPath>/', views.bulk_create, name="bulk_create"),
+    path('bulk-update/<str:aPath>/', views.bulk_update, name="bulk_update"),
+    path('bulk-delete/<str:aPath>/', views.bulk_delete, name="bulk_delete"),
 
     path('export-csv/<str:aPath>/', views.ExportCSVView.as_view(), name='export_csv'),
+    path('export-jobs/<str:aPath>/', views.export_job_create, name='export_job_create'),
+    path('export-jobs/status/<int:id>/', views.export_job, name='export_job'),
+    path('export-jobs/download/<int:id>/', views.export_job_download, name='export_job_download'),
 
+    path('dynamic-dt/<str:aPath>/fk-choices/<str:field_name>/', views.model_fk_choices, name="model_fk_choices"),
+    path('dynamic-dt/<str:aPath>/series/', views.model_series, name="model_series"),
+    path('dynamic-dt/<str:aPath>/aggregates/', views.model_aggregates, name="model_aggregates"),
+    path('dynamic-dt/<str:aPath>/data/', views.model_dt_data, name="model_dt_data"),
+    path('dynamic-dt/<str:aPath>/explain/', views.model_dt_explain, name="model_dt_explain"),
     path('dynamic-dt/<str:aPath>/', views.model_dt, name="model_dt"),
 ]
@@ -1,13 +1,60 @@
-from django.db.models import Q
-
-def user_filter(request, queryset, fields, fk_fields=[]):
-    value = request.GET.get('search')
-    
-    if value:
-        dynamic_q = Q()
-        for field in fields:
-            if field not in fk_fields:
-                dynamic_q |= Q(**{f'{field}__icontains': value})
-        return queryset.filter(dynamic_q)
-
-    return queryset
\ No newline at end of file
+from django.conf import settings
+
+from apps.dyn_dt.filters import filter_lookups
+from apps.dyn_dt.search import search_queryset, SEARCH_ICONTAINS
+
+def table_option(aPath, name, default=None):
+    """Reads a per-table option from settings.DYNAMIC_DATATB_OPTIONS."""
+    options = getattr(settings, 'DYNAMIC_DATATB_OPTIONS', {}).get(aPath, {})
+    return options.get(name, default)
+
+def user_filter(request, queryset, fields, fk_fields=[], aPath=None):
+    return search_filter(queryset, request.GET.get('search'), fields, fk_fields, aPath)
+
+def search_filter(queryset, value, fields, fk_fields=[], aPath=None):
+    """Search through the backend set by the table's 'search' option (see search.py)."""
+    backend = table_option(aPath, 'search', SEARCH_ICONTAINS)
+    return search_queryset(queryset, value, fields, fk_fields, backend)
+
+def model_filter_string(filter_instance, db_fields, aModelClass, errors=None):
+    """Returns the ORM lookups for the saved ModelFilter rows of a table.
+
+    A filter with an invalid value makes the table match nothing, the
+    messages are added to `errors` ({key: message}) when given.
+    """
+    filter_string, filter_errors = filter_lookups(aModelClass, filter_instance, db_fields)
+    if filter_errors:
+        filter_string['pk__in'] = []
+        if errors is not None:
+            errors.update(filter_errors)
+    return filter_string
+
+def visible_fields(field_names, db_fields):
+    """Columns not hidden by a HideShowFilter row, in model order."""
+    hidden = {field.key for field in field_names if field.value}
+    return [f for f in db_fields if f not in hidden]
+
+def table_queryset(aModelClass, columns, fk_fields):
+    """Queryset loading only `columns`, with their FK targets joined in.
+
+    Rendering the rows then needs no lazy per-cell queries.
+    """
+    pk_name = aModelClass._meta.pk.name
+    columns = list(dict.fromkeys([pk_name] + list(columns)))
+    related = [c for c in columns if c in fk_fields]
+    return aModelClass.objects.select_related(*related).only(*columns)
+
+def row_dicts(items, columns, fk_fields):
+    """Plain row dicts for the templates / exports; FKs become their label."""
+    rows = []
+    for item in items:
+        row = {'id': item.pk}
+        for name in columns:
+            if name in fk_fields:
+                related = getattr(item, name)
+                row[name] = str(related) if related is not None else ''
+                row[name + '_id'] = related.pk if related is not None else ''
+            else:
+                row[name] = getattr(item, name)
+        rows.append(row)
+    return rows
@@ -0,0 +1,56 @@
+"""
+Data versions and ETags for dyn_dt pages.
+
+Every DYNAMIC_DATATB model, and every FK target it shows the labels of,
+has a "data version" counter (apps.common.versions), bumped on commit by
+the row signals and by the bulk writes; the saved settings of a table have
+one too. Page ETags hash these versions with the request, so a matching
+If-None-Match is answered with 304 from the cache alone, the data tables
+are not touched.
+"""
+
+import hashlib, json
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+
+from apps.common.versions import bump_version, get_versions, model_version_name
+from apps.dyn_dt.registry import table_meta
+from apps.dyn_dt.utils import table_option
+
+def settings_version_name(aPath):
+    return 'settings:' + aPath.lower()
+
+def table_version(aPath, meta=None):
+    """The versions the rows of `aPath` depend on: model, FK targets, saved settings."""
+    meta = meta or table_meta(aPath)
+    aModelClass = meta.model
+    names = [model_version_name(aModelClass), settings_version_name(aPath)]
+    for name in meta.fk_fields.keys():
+        names.append(model_version_name(aModelClass._meta.get_field(name).related_model))
+    versions = get_versions(names)
+    return [versions[name] for name in names]
+
+def bump_settings_version(sender, instance, **kwargs):
+    if instance.parent:
+        bump_version(settings_version_name(instance.parent))
+
+def request_etag(aPath, meta, query, *extra):
+    payload = [aPath.lower(), table_version(aPath, meta), sorted(query.lists()), *extra]
+    return hashlib.md5(json.dumps(payload, default=str).encode()).hexdigest()
+
+def page_etag(request, aPath):
+    """ETag of the model_dt page: data + settings versions, query, user and CSRF cookie."""
+    meta = table_meta(aPath)
+    if not meta or not table_option(aPath, 'etag', True):
+        return None
+    user = request.user
+    return request_etag(aPath, meta, request.GET, user.pk, user.is_staff,
+                        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''), len(get_messages(request)))
+
+def data_etag(request, aPath):
+    """ETag of the DataTables endpoint, its rows don't depend on the user."""
+    meta = table_meta(aPath)
+    if not meta or not table_option(aPath, 'etag', True):
+        return None
+    return request_etag(aPath, meta, request.GET)
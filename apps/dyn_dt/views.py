@@ -1,19 +1,35 @@
-import requests, base64, json, csv
+import requests, base64, json, csv, os
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.utils.safestring import mark_safe
 from django.conf import settings
 from django.urls import reverse
 from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
 from django.urls import reverse
 from django.views import View
-from django.db import models
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.db import models, connection, DatabaseError, IntegrityError
+from django.db.models import ProtectedError, RestrictedError
 from pprint import pp 
 
-from apps.dyn_dt.models import ModelFilter, PageItems, HideShowFilter
-from apps.dyn_dt.utils import user_filter
+from apps.dyn_dt.models import ModelFilter, PageItems, HideShowFilter, ExportJob
+from apps.dyn_dt.utils import user_filter, model_filter_string, table_option, visible_fields, table_queryset, row_dicts
+from apps.dyn_dt.fk_choices import fk_choices, FK_CHOICES_LIMIT, FK_CHOICES_LIMIT_MAX
+from apps.dyn_dt.exports import export_stream, export_params, export_queryset, ExportError, EXPORT_FORMATS
+from apps.dyn_dt.jobs import enqueue_export, artifact_response, job_abspath
+from apps.dyn_dt.pagination import keyset_page, count_cache_key, InvalidCursor, PAGINATION_KEYSET, COUNT_EXACT
+from apps.dyn_dt.series import get_model_series, SERIES_WINDOW
+from apps.dyn_dt.registry import table_meta, table_settings
+from apps.common.fields import is_indexed
+from apps.dyn_dt.filters import field_lookups, field_operators, default_operator
+from apps.dyn_dt.datatables import datatables_params, cached_datatables_response, DataTablesError
+from apps.dyn_dt.versions import page_etag, data_etag
+from apps.dyn_dt.aggregates import table_aggregates, aggregate_fields
+from apps.dyn_dt.bulk import bulk_create_rows, bulk_update_rows, bulk_delete_rows, target_queryset, BulkError
 
 from cli import *
 
@@ -34,14 +50,16 @@ def create_filter(request, model_name):
     if request.method == "POST":
         keys = request.POST.getlist('key')
         values = request.POST.getlist('value')
+        operators = request.POST.getlist('operator')
         for i in range(len(keys)):
             key = keys[i]
             value = values[i]
+            operator = operators[i] if i < len(operators) else ''
 
             ModelFilter.objects.update_or_create(
                 parent=model_name,
                 key=key,
-                defaults={'value': value}
+                defaults={'value': value, 'operator': operator}
             )
 
         return redirect(reverse('model_dt', args=[model_name]))
@@ -83,109 +101,239 @@ def delete_filter(request, model_name, id):
     return redirect(reverse('model_dt', args=[model_name]))
 
 
-def get_model_field_names(model, field_type):
-    """Returns a list of field names based on the given field type."""
-    return [
-        field.name for field in model._meta.get_fields() 
-        if isinstance(field, field_type)
-    ]
-
+# Browsers revalidate every visit, unchanged pages are answered with 304
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=page_etag)
 def model_dt(request, aPath):
-    aModelName  = None
-    aModelClass = None
-    choices_dict = {}
+    meta = table_meta(aPath)
+    if not meta:
+        return HttpResponse( ' > ERR: Getting ModelClass for path: ' + aPath )
 
-    if aPath in settings.DYNAMIC_DATATB.keys():
-        aModelName  = settings.DYNAMIC_DATATB[aPath]
-        aModelClass = name_to_class(aModelName)
+    aModelClass = meta.model
+    db_fields   = meta.db_fields
+    fk_fields   = meta.fk_fields
 
-    if not aModelClass:
-        return HttpResponse( ' > ERR: Getting ModelClass for path: ' + aPath )
-    
-    #db_fields = [field.name for field in aModelClass._meta.get_fields() if not field.is_relation]
-    db_fields = [field.name for field in aModelClass._meta.fields]
-    fk_fields = get_model_fk_values(aModelClass)
-    db_filters = []
-    for f in db_fields:
-        if f not in fk_fields.keys():
-            db_filters.append( f )
-
-    for field in aModelClass._meta.fields:
-        if field.choices:
-            choices_dict[field.name] = field.choices
-
-    field_names = []
-    for field_name in db_fields:
-        fields, created = HideShowFilter.objects.get_or_create(key=field_name, parent=aPath.lower())
-        if fields.key in db_fields:
-            field_names.append(fields)
-    
-    model_series = {}
-    for f in db_fields:
-        f_values = list ( aModelClass.objects.values_list( f, flat=True) )
-        model_series[ f ] = ', '.join( str(i) for i in f_values)
+    # Saved hide/show rows, filters and page size: one cache read
+    table = table_settings(aPath)
+    field_names = table.field_names(db_fields)
 
     # model filter
-    filter_string = {}
-    filter_instance = ModelFilter.objects.filter(parent=aPath.lower())
-    for filter_data in filter_instance:
-        if filter_data.key in db_fields: 
-            filter_string[f'{filter_data.key}__icontains'] = filter_data.value
+    filter_instance = table.filters
+    filter_errors = {}
+    filter_string = model_filter_string(filter_instance, db_fields, aModelClass, filter_errors)
 
     order_by = request.GET.get('order_by', 'id')
     if order_by not in db_fields:
         order_by = 'id'
-    
-    queryset = aModelClass.objects.filter(**filter_string).order_by(order_by)
-    item_list = user_filter(request, queryset, db_fields, fk_fields.keys())
-
-    # pagination
-    page_items = PageItems.objects.filter(parent=aPath.lower()).last()
-    p_items = 25
-    if page_items:
-        p_items = page_items.items_per_page
 
-    page = request.GET.get('page', 1)
-    paginator = Paginator(item_list, p_items)
+    # Only the visible columns are loaded, FKs are joined in
+    shown_fields = visible_fields(field_names, db_fields)
+    queryset = table_queryset(aModelClass, shown_fields + [order_by], fk_fields.keys())
+    queryset = queryset.filter(**filter_string).order_by(order_by)
+    item_list = user_filter(request, queryset, db_fields, fk_fields.keys(), aPath)
 
-    try:
-        items = paginator.page(page)
-    except PageNotAnInteger:
-        return redirect(reverse('model_dt', args=[aPath]))
-    except EmptyPage:
-        return redirect(reverse('model_dt', args=[aPath]))
+    # pagination
+    p_items = table.items_per_page or 25
+
+    if table_option(aPath, 'pagination') == PAGINATION_KEYSET:
+        count_mode = table_option(aPath, 'count', COUNT_EXACT)
+        count_key  = count_cache_key(aPath, filter_string, request.GET.get('search', ''))
+        try:
+            items = keyset_page(item_list, order_by, request.GET.get('cursor'), p_items, count_mode, count_key)
+        except InvalidCursor:
+            return redirect(reverse('model_dt', args=[aPath]))
+    else:
+        page = request.GET.get('page', 1)
+        paginator = Paginator(item_list, p_items)
+
+        try:
+            items = paginator.page(page)
+        except PageNotAnInteger:
+            return redirect(reverse('model_dt', args=[aPath]))
+        except EmptyPage:
+            return redirect(reverse('model_dt', args=[aPath]))
+
+    items.object_list = row_dicts(items.object_list, shown_fields, fk_fields.keys())
+
+    # Export links keep the active search / ordering
+    export_query = request.GET.copy()
+    for key in ('page', 'cursor'):
+        export_query.pop(key, None)
     
     read_only_fields = ('id', )
 
-    integer_fields = get_model_field_names(aModelClass, models.IntegerField)
-    date_time_fields = get_model_field_names(aModelClass, models.DateTimeField)
-    email_fields = get_model_field_names(aModelClass, models.EmailField)
-    text_fields = get_model_field_names(aModelClass, (models.TextField, models.CharField))
-    
     context = {
         'page_title': 'Dynamic DataTable - ' + aPath.lower().title(),
         'link': aPath,
         'field_names': field_names,
         'db_field_names': db_fields,
-        'db_filters': db_filters,
+        'db_filters': meta.db_filters,
+        'hidden_fields': [f for f in db_fields if f not in shown_fields],
         'items': items,
         'page_items': p_items,
+        'export_query': export_query.urlencode(),
         'filter_instance': filter_instance,
+        'filter_errors': filter_errors,
+        'filter_operators': meta.filter_operators,
+        'aggregate_fields': aggregate_fields(aPath, meta),
         'read_only_fields': read_only_fields,
 
-        'integer_fields': integer_fields,
-        'date_time_fields': date_time_fields,
-        'email_fields': email_fields,
-        'text_fields': text_fields,
+        'integer_fields': meta.integer_fields,
+        'date_time_fields': meta.date_time_fields,
+        'email_fields': meta.email_fields,
+        'text_fields': meta.text_fields,
         'fk_fields_keys': list( fk_fields.keys() ),
         'fk_fields': fk_fields ,
-        'choices_dict': choices_dict,
+        'choices_dict': meta.choices_dict,
         'parent': 'apps',
         'segment': 'dynamic_dt'
     }
     return render(request, 'dyn_dt/model.html', context)
 
 
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=data_etag)
+def model_dt_data(request, aPath):
+    """DataTables server-side endpoint: the rows of one page as JSON."""
+    meta = table_meta(aPath)
+    if not meta:
+        return JsonResponse({'error': 'Unknown model path: ' + aPath}, status=404)
+
+    try:
+        params = datatables_params(request.GET, meta.db_fields, meta.model, meta.fk_fields.keys())
+    except DataTablesError as e:
+        return JsonResponse({'draw': request.GET.get('draw', 0), 'error': str(e)}, status=400)
+
+    return JsonResponse(cached_datatables_response(aPath, meta, params))
+
+@login_required(login_url='/accounts/login/')
+def model_dt_explain(request, aPath):
+    """Staff only: the SQL and EXPLAIN plan of the table query for the saved filters."""
+    if not request.user.is_staff:
+        return HttpResponse(status=403)
+
+    meta = table_meta(aPath)
+    if not meta:
+        return HttpResponse( ' > ERR: Getting ModelClass for path: ' + aPath )
+
+    aModelClass = meta.model
+    db_fields   = meta.db_fields
+    fk_fields   = meta.fk_fields
+    table = table_settings(aPath)
+
+    filters = []
+    for filter_data in table.filters:
+        if filter_data.key not in db_fields:
+            continue
+        field = aModelClass._meta.get_field(filter_data.key)
+        operator = filter_data.operator if filter_data.operator in field_operators(field) else default_operator(field)
+        try:
+            lookups = field_lookups(field, operator, filter_data.value)
+        except ValidationError as e:
+            lookups = ' '.join(e.messages)
+        filters.append({'key': filter_data.key, 'operator': operator, 'value': filter_data.value,
+                        'lookups': lookups, 'indexed': is_indexed(field)})
+
+    order_by = request.GET.get('order_by', 'id')
+    if order_by not in db_fields:
+        order_by = 'id'
+
+    filter_string = model_filter_string(table.filters, db_fields, aModelClass)
+    shown_fields = visible_fields(table.field_names(db_fields), db_fields)
+    queryset = table_queryset(aModelClass, shown_fields + [order_by], fk_fields.keys())
+    queryset = queryset.filter(**filter_string).order_by(order_by)
+    queryset = user_filter(request, queryset, db_fields, fk_fields.keys(), aPath)
+
+    plans = []
+    for label, plan_qs in (('Page rows', queryset[:table.items_per_page or 25]), ('Filtered rows (count)', queryset.order_by())):
+        try:
+            sql, plan = str(plan_qs.query), plan_qs.explain()
+        except EmptyResultSet:
+            sql, plan = '-- matches nothing, no query is sent', ''
+        except DatabaseError as e:
+            plan = 'EXPLAIN failed: ' + str(e)
+        plans.append({'label': label, 'sql': sql, 'plan': plan})
+
+    context = {
+        'page_title': 'Query plan - ' + aPath.lower().title(),
+        'link': aPath,
+        'filters': filters,
+        'plans': plans,
+        'vendor': connection.vendor,
+        'parent': 'apps',
+        'segment': 'dynamic_dt'
+    }
+    return render(request, 'dyn_dt/explain.html', context)
+
+def model_series(request, aPath):
+    """Column series for charts / summary widgets, computed on demand."""
+    meta = table_meta(aPath)
+    if not meta:
+        return JsonResponse({'error': 'Unknown model path: ' + aPath}, status=404)
+
+    aModelClass = meta.model
+    db_fields   = meta.db_fields
+    fk_fields   = meta.fk_fields
+
+    fields = request.GET.getlist('field')
+    for field in fields:
+        if field not in db_fields:
+            return JsonResponse({'error': 'Unknown field: ' + field}, status=400)
+
+    try:
+        window = max(1, min(int(request.GET.get('limit', SERIES_WINDOW)), SERIES_WINDOW))
+    except ValueError:
+        window = SERIES_WINDOW
+
+    filter_string = model_filter_string(table_settings(aPath).filters, db_fields, aModelClass)
+
+    order_by = request.GET.get('order_by', 'id')
+    if order_by not in db_fields:
+        order_by = 'id'
+
+    queryset = aModelClass.objects.filter(**filter_string).order_by(order_by)
+    queryset = user_filter(request, queryset, db_fields, fk_fields.keys(), aPath)
+    search = request.GET.get('search', '')
+
+    series = {}
+    for field in fields:
+        series[field] = get_model_series(queryset, aPath, field, filter_string, search, order_by, window)
+
+    return JsonResponse({'series': series})
+
+
+def model_aggregates(request, aPath):
+    """Summary panel: sum / count / avg / min / max of the numeric columns over the filters + ?search."""
+    meta = table_meta(aPath)
+    if not meta:
+        return JsonResponse({'error': 'Unknown model path: ' + aPath}, status=404)
+
+    filter_string = model_filter_string(table_settings(aPath).filters, meta.db_fields, meta.model)
+    search = request.GET.get('search', '').strip()
+    return JsonResponse({'aggregates': table_aggregates(aPath, meta, filter_string, search)})
+
+
+def model_fk_choices(request, aPath, field_name):
+    """Type-ahead choices for a FK column: ?q=<text>&limit=<n> or ?id=<pk>&id=<pk>."""
+    meta = table_meta(aPath)
+    if not meta:
+        return JsonResponse({'error': 'Unknown model path: ' + aPath}, status=404)
+
+    if field_name not in meta.fk_fields.keys():
+        return JsonResponse({'error': 'Unknown FK field: ' + field_name}, status=400)
+
+    related = meta.model._meta.get_field(field_name).related_model
+
+    try:
+        limit = max(1, min(int(request.GET.get('limit', FK_CHOICES_LIMIT)), FK_CHOICES_LIMIT_MAX))
+        ids   = [related._meta.pk.to_python(pk) for pk in request.GET.getlist('id')]
+    except Exception as e:
+        return JsonResponse({'error': 'Input error: ' + str(e)}, status=400)
+
+    results, more = fk_choices(related, request.GET.get('q', '').strip(), ids, limit)
+    return JsonResponse({'results': results, 'more': more})
+
+
 @login_required(login_url='/accounts/login/')
 def create(request, aPath):
     aModelClass = None
@@ -266,6 +414,72 @@ def update(request, aPath, id):
 
 
 
+def bulk_payload(request, aPath):
+    """Returns (meta, data) of a bulk request, or (None, error response)."""
+    if request.method != 'POST':
+        return None, JsonResponse({'error': 'POST required'}, status=405)
+
+    meta = table_meta(aPath)
+    if not meta:
+        return None, JsonResponse({'error': 'Unknown model path: ' + aPath}, status=404)
+
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return None, JsonResponse({'error': 'Invalid JSON body'}, status=400)
+    if not isinstance(data, dict):
+        return None, JsonResponse({'error': 'Expected a JSON object'}, status=400)
+    return meta, data
+
+
+@login_required(login_url='/accounts/login/')
+def bulk_create(request, aPath):
+    """{"rows": [{field: value}, ...]} -> one transaction, bulk_create."""
+    meta, data = bulk_payload(request, aPath)
+    if not meta:
+        return data
+
+    try:
+        created = bulk_create_rows(meta.model, data.get('rows') or [])
+    except BulkError as e:
+        return JsonResponse({'error': str(e), 'errors': e.errors}, status=400)
+    except IntegrityError as e:
+        return JsonResponse({'error': 'Integrity error: ' + str(e)}, status=409)
+    return JsonResponse({'created': created}, status=201)
+
+
+@login_required(login_url='/accounts/login/')
+def bulk_update(request, aPath):
+    """{"ids": [...]} or {"all": true, "search": ...} plus {"values": {field: value}}."""
+    meta, data = bulk_payload(request, aPath)
+    if not meta:
+        return data
+
+    try:
+        updated = bulk_update_rows(target_queryset(aPath, meta, data), data.get('values') or {})
+    except BulkError as e:
+        return JsonResponse({'error': str(e), 'errors': e.errors}, status=400)
+    except IntegrityError as e:
+        return JsonResponse({'error': 'Integrity error: ' + str(e)}, status=409)
+    return JsonResponse({'updated': updated})
+
+
+@login_required(login_url='/accounts/login/')
+def bulk_delete(request, aPath):
+    """{"ids": [...]} or {"all": true, "search": ...}."""
+    meta, data = bulk_payload(request, aPath)
+    if not meta:
+        return data
+
+    try:
+        deleted = bulk_delete_rows(target_queryset(aPath, meta, data))
+    except BulkError as e:
+        return JsonResponse({'error': str(e), 'errors': e.errors}, status=400)
+    except (ProtectedError, RestrictedError) as e:
+        return JsonResponse({'error': str(e.args[0])}, status=409)
+    return JsonResponse({'deleted': deleted})
+
+
 # Export as CSV
 class ExportCSVView(View):
     def get(self, request, aPath):
@@ -279,39 +493,74 @@ class ExportCSVView(View):
         if not aModelClass:
             return HttpResponse( ' > ERR: Getting ModelClass for path: ' + aPath )
         
-        db_field_names = [field.name for field in aModelClass._meta.get_fields()]
-        fields = []
-        show_fields = HideShowFilter.objects.filter(value=False, parent=aPath.lower())
-        
-        for field in show_fields:
-            if field.key in db_field_names:
-                fields.append(field.key)
-            else:
-                print(f"Field {field.key} does not exist in {aModelClass} model.")
-
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="{aPath.lower()}.csv"'
-
-        writer = csv.writer(response)
-        writer.writerow(fields)  # Write the header
-
-        filter_string = {}
-        filter_instance = ModelFilter.objects.filter(parent=aPath.lower())
-        for filter_data in filter_instance:
-            filter_string[f'{filter_data.key}__icontains'] = filter_data.value
-
-        order_by = request.GET.get('order_by', 'id')
-        queryset = aModelClass.objects.filter(**filter_string).order_by(order_by)
-
-        items = user_filter(request, queryset, db_field_names)
-
-        for item in items:
-            row_data = []
-            for field in fields:
-                try:
-                    row_data.append(getattr(item, field))
-                except AttributeError:
-                    row_data.append('') 
-            writer.writerow(row_data)
-
-        return response
\ No newline at end of file
+        fk_fields = get_model_fk(aModelClass)
+        params = export_params(request, aPath, aModelClass)
+        queryset = export_queryset(aModelClass, params, aPath)
+        fmt = params['format']
+        compress = params['compress']
+
+        try:
+            stream = export_stream(fmt, queryset, aModelClass, params['fields'], fk_fields.keys(), compress)
+        except ExportError as e:
+            return HttpResponse(' > ERR: ' + str(e), status=400)
+
+        content_type, extension = EXPORT_FORMATS[fmt]
+        filename = f'{aPath.lower()}.{extension}'
+        if compress:
+            content_type, filename = 'application/gzip', filename + '.gz'
+
+        # Rows are written as they are fetched, in chunks
+        response = StreamingHttpResponse(stream, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+
+# Background exports
+def export_job_status(job):
+    data = {
+        'id': job.id,
+        'status': job.status,
+        'progress': job.progress,
+        'rows_done': job.rows_done,
+        'rows_total': job.rows_total,
+        'size': job.size,
+        'error': job.error,
+        'status_url': reverse('export_job', args=[job.id]),
+    }
+    if job.status == ExportJob.STATUS_DONE:
+        data['download_url'] = reverse('export_job_download', args=[job.id])
+    return data
+
+
+def export_job_create(request, aPath):
+    aModelClass = None
+
+    if aPath in settings.DYNAMIC_DATATB.keys():
+        aModelName  = settings.DYNAMIC_DATATB[aPath]
+        aModelClass = name_to_class(aModelName)
+
+    if not aModelClass:
+        return JsonResponse({'error': 'Unknown model path: ' + aPath}, status=404)
+
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request'}, status=400)
+
+    params = export_params(request, aPath, aModelClass)
+    if params['format'] not in EXPORT_FORMATS:
+        return JsonResponse({'error': 'Unsupported export format: ' + params['format']}, status=400)
+
+    job, created = enqueue_export(aPath, params)
+    return JsonResponse({**export_job_status(job), 'reused': not created}, status=202 if created else 200)
+
+
+def export_job(request, id):
+    job = get_object_or_404(ExportJob, id=id)
+    return JsonResponse(export_job_status(job))
+
+
+def export_job_download(request, id):
+    job = get_object_or_404(ExportJob, id=id, status=ExportJob.STATUS_DONE)
+    if not os.path.exists(job_abspath(job)):
+        return JsonResponse({'error': 'Export file expired'}, status=410)
+    return artifact_response(request, job)
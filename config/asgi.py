@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+# DynamicAPI reads with the async ORM (apps/dyn_api/async_views.py)
+os.environ.setdefault("DYNAMIC_API_ASYNC", "True")
 
 application = get_asgi_application()
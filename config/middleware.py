@@ -1,5 +1,17 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.shortcuts import redirect
 from django.urls import reverse
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+def view_module(view_func):
+    # view_func may be a function or a class-based view (callable)
+    module = getattr(view_func, '__module__', '')
+    if not module:
+        # class-based views appear as <class>.as_view().__wrapped__ -> module may vary
+        func = getattr(view_func, '__wrapped__', None)
+        module = getattr(func, '__module__', '') if func else ''
+    return module
 
 
 class AdminDashboardLoginRequiredMiddleware:
@@ -12,21 +24,25 @@ class AdminDashboardLoginRequiredMiddleware:
     accessible.
     """
 
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            # Under ASGI: only the dashboard views leave the event loop (request.user may query)
+            markcoroutinefunction(self)
+            self.process_view = self.aprocess_view
 
     def __call__(self, request):
         return self.get_response(request)
 
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        if not view_module(view_func).startswith('admin_adminlte.views'):
+            return None
+        return await sync_to_async(type(self).process_view)(self, request, view_func, view_args, view_kwargs)
+
     def process_view(self, request, view_func, view_args, view_kwargs):
-        # view_func may be a function or a class-based view (callable)
-        module = getattr(view_func, '__module__', '')
-        if not module:
-            # class-based views appear as <class>.as_view().__wrapped__ -> module may vary
-            func = getattr(view_func, '__wrapped__', None)
-            module = getattr(func, '__module__', '') if func else ''
-
-        if module.startswith('admin_adminlte.views'):
+        if view_module(view_func).startswith('admin_adminlte.views'):
             # Allow access to static/media and auth endpoints
             path = request.path
             if path.startswith('/accounts') or path.startswith('/admin') or path.startswith('/static') or path.startswith('/media'):
@@ -36,3 +52,30 @@ class AdminDashboardLoginRequiredMiddleware:
                 return redirect(reverse('account_login'))
 
         return None
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoise, async capable: under ASGI the requests that aren't for
+    static files stay on the event loop (WhiteNoise 6.7 is sync only)."""
+
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file, thread_sensitive=False)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve, thread_sensitive=False)(static_file, request)
+        return await self.get_response(request)
@@ -104,7 +104,7 @@ INSTALLED_APPS += [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "config.middleware.StaticFilesMiddleware",  # WhiteNoise, async capable
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     # allauth middleware (required)
@@ -215,6 +215,9 @@ STATICFILES_DIRS = (
     os.path.join(BASE_DIR, 'static'),
 )
 
+MEDIA_URL = '/media/'
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
 #if not DEBUG:
 #    STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
@@ -264,6 +267,19 @@ DYNAMIC_DATATB = {
     # SLUG -> Import_PATH 
     'product'  : "apps.pages.models.Product",
 }
+
+# Per-table options, Syntax: SLUG -> dict
+#   'pagination': 'page'   - COUNT(*) + OFFSET (default)
+#                 'keyset' - seek on order_by + id, opaque next/prev cursors
+#   'count'     : 'exact' (default), 'approx' (planner stats or cached count) or None (keyset only)
+#   'search'    : 'icontains' (default), 'fts5' (SQLite), 'postgres' (tsvector + GIN) or 'trigram' (pg_trgm)
+#                 build the index with: python manage.py dyn_dt_search_index
+#   'aggregates': columns of the summary panel (default: every numeric column), False to disable it
+#   'etag'      : True (default) - ETag / 304 for the table page and its JSON endpoint
+#   'prefetch'  : True - compute the next page of the JSON endpoint in the background (default False)
+DYNAMIC_DATATB_OPTIONS = {
+    'product'  : {'pagination': 'page'},
+}
 ########################################
 
 # Syntax: URI -> Import_PATH
@@ -272,6 +288,22 @@ DYNAMIC_API = {
     'product'  : "apps.pages.models.Product",
 }
 
+# Async DynamicAPI reads, on by default under ASGI (config/asgi.py)
+DYNAMIC_API_ASYNC = str2bool(os.environ.get('DYNAMIC_API_ASYNC')) if os.environ.get('DYNAMIC_API_ASYNC') is not None else False
+
+# Seconds a rendered GET response is cached (apps/dyn_api/caching.py), 0 disables
+DYNAMIC_API_CACHE_TTL = int(os.environ.get('DYNAMIC_API_CACHE_TTL', 60))
+
+# Per-slug options of the endpoints, Syntax: SLUG -> dict
+#   'max_page_size': largest ?limit= (capped by DYNAMIC_API_MAX_PAGE_SIZE, 500)
+#   'filter_fields': columns ?<field>= can filter on   (default: indexed columns)
+#   'order_fields' : columns ?ordering= can sort on     (default: indexed columns)
+#   'natural_key'  : unique field(s) POST api/<slug>/bulk/ upserts on (default: none, plain creates)
+#   'cache'        : False to never cache the GET responses of the slug
+DYNAMIC_API_OPTIONS = {
+    'product'  : {'max_page_size': 100},
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
@@ -304,3 +336,19 @@ RETELL_DISABLE_RECAPTCHA = str2bool(os.environ.get('RETELL_DISABLE_RECAPTCHA'))
 # (embed settings removed — restored original configuration)
 # Development: mock Retell responses when set to a truthy value
 RETELL_MOCK = str2bool(os.environ.get('RETELL_MOCK')) if os.environ.get('RETELL_MOCK') is not None else False
+
+# Detail fetching of the Retell sync (apps/communications/fetching.py)
+RETELL_FETCH_WORKERS = int(os.environ.get('RETELL_FETCH_WORKERS', 8))    # concurrent requests
+RETELL_RATE_LIMIT    = float(os.environ.get('RETELL_RATE_LIMIT', 50))    # requests/s per host, 0 disables
+RETELL_FETCH_RETRIES = int(os.environ.get('RETELL_FETCH_RETRIES', 3))    # on 429 / 5xx / connection errors
+
+# Incremental Retell sync (apps/communications/sync.py)
+RETELL_SYNC_OVERLAP   = int(os.environ.get('RETELL_SYNC_OVERLAP', 300))    # seconds listed again before the watermark
+RETELL_SYNC_MAX_PAGES = int(os.environ.get('RETELL_SYNC_MAX_PAGES', 5))    # list pages per run, the rest on the next run
+RETELL_SYNC_HOLD_MAX_AGE = int(os.environ.get('RETELL_SYNC_HOLD_MAX_AGE', 21600))  # seconds an ongoing/unsynced item holds the watermark
+
+# Background Retell syncs (apps/communications/jobs.py, `manage.py retell_sync_worker`)
+# RETELL_SYNC_INPROCESS: run queued syncs in a thread of the web process too, False when the worker runs
+RETELL_SYNC_INPROCESS = str2bool(os.environ.get('RETELL_SYNC_INPROCESS')) if os.environ.get('RETELL_SYNC_INPROCESS') is not None else True
+RETELL_SYNC_LEASE     = int(os.environ.get('RETELL_SYNC_LEASE', 120))      # seconds before a silent worker loses the lock
+RETELL_REFRESH_DEBOUNCE = int(os.environ.get('RETELL_REFRESH_DEBOUNCE', 60))  # seconds between the refreshes webhooks queue
@@ -0,0 +1,15 @@
+# -*- encoding: utf-8 -*-
+"""
+Copyright (c) 2019 - present AppSeed.us
+
+ASGI variant of gunicorn-cfg.py: gunicorn --config gunicorn-asgi-cfg.py config.asgi
+One uvicorn worker serves the concurrent DynamicAPI reads on its event loop.
+"""
+
+bind = '0.0.0.0:5005'
+workers = 1
+worker_class = 'uvicorn.workers.UvicornWorker'
+accesslog = '-'
+loglevel = 'debug'
+capture_output = True
+enable_stdio_inheritance = True